@@ -0,0 +1,341 @@
+import asyncio
+import logging
+import sqlite3
+import typing
+from datetime import datetime
+
+import discord
+
+from cogbot.message_store import to_epoch, to_snowflake
+from cogbot.types import ChannelId, ServerId, UserId
+
+log = logging.getLogger(__name__)
+
+ACTIVITY_CONCURRENCY = 4
+ACTIVITY_CHECKPOINT = 500
+ACTIVITY_FLUSH_EVERY = 100
+
+DAY = 86400
+
+# (server, channel, member, day) -> number of messages
+CountKey = typing.Tuple[ServerId, ChannelId, UserId, int]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS activity (
+    server_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    member_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, day, member_id)
+);
+CREATE TABLE IF NOT EXISTS progress (
+    channel_id INTEGER PRIMARY KEY,
+    server_id INTEGER NOT NULL,
+    start_id INTEGER NOT NULL,
+    end_id INTEGER NOT NULL
+);
+"""
+
+
+def to_day(epoch: float) -> int:
+    # UTC days since the Unix epoch.
+    return int(epoch // DAY)
+
+
+def message_key(message: discord.Message) -> CountKey:
+    return (
+        message.server.id,
+        message.channel.id,
+        message.author.id,
+        to_day(to_epoch(message.timestamp)),
+    )
+
+
+def add_count(
+    counts: typing.Dict[CountKey, int], message: discord.Message, delta: int = 1
+):
+    key = message_key(message)
+    counts[key] = counts.get(key, 0) + delta
+
+
+class ActivityProgress:
+    """ The stretch of a channel's history, by message id, that has been counted. """
+
+    def __init__(
+        self, server_id: ServerId, channel_id: ChannelId, start_id: int, end_id: int
+    ):
+        self.server_id: ServerId = server_id
+        self.channel_id: ChannelId = channel_id
+        self.start_id: int = start_id
+        self.end_id: int = end_id
+
+    def is_counted(self, message_id: int) -> bool:
+        return self.start_id <= message_id <= self.end_id
+
+
+class ActivityIndex:
+    """
+    Per-member, per-channel, per-day message counts, kept in SQLite so that
+    activity reports never need to walk message history.
+
+    New messages are counted as they arrive. Older history is counted by
+    backfills, which walk the history API a few channels at a time and
+    checkpoint as they go, so an interrupted backfill picks up where it left
+    off. A channel's counts are only trusted once it has been caught up with
+    the gateway; until then, reports wait for its backfill.
+    """
+
+    def __init__(
+        self,
+        client: discord.Client,
+        path: str,
+        concurrency: int = ACTIVITY_CONCURRENCY,
+        checkpoint: int = ACTIVITY_CHECKPOINT,
+        flush_every: int = ACTIVITY_FLUSH_EVERY,
+    ):
+        self.client: discord.Client = client
+        self.path: str = path
+        self.checkpoint: int = checkpoint
+        self.flush_every: int = flush_every
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.progress: typing.Dict[ChannelId, ActivityProgress] = {
+            str(channel_id): ActivityProgress(
+                str(server_id), str(channel_id), start_id, end_id
+            )
+            for channel_id, server_id, start_id, end_id in self.connection.execute(
+                "SELECT channel_id, server_id, start_id, end_id FROM progress"
+            )
+        }
+        # Channels whose counts are caught up with the gateway.
+        self.live: typing.Set[ChannelId] = set()
+        # Channels being caught up, and what arrived for them in the meantime.
+        self.filling: typing.Dict[ChannelId, typing.List[discord.Message]] = {}
+        # Live counts not yet written to disk.
+        self.buffered_counts: typing.Dict[CountKey, int] = {}
+        self.buffered_ends: typing.Set[ChannelId] = set()
+        self.buffered: int = 0
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.locks: typing.Dict[ChannelId, asyncio.Lock] = {}
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def get_lock(self, channel_id: ChannelId) -> asyncio.Lock:
+        lock = self.locks.get(channel_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.locks[channel_id] = lock
+        return lock
+
+    def get_progress(self, channel: discord.Channel) -> ActivityProgress:
+        progress = self.progress.get(channel.id)
+        if progress is None:
+            # Nothing counted yet; start from now and fill in either direction.
+            now_id = int(to_snowflake(to_epoch(datetime.utcnow())))
+            progress = ActivityProgress(channel.server.id, channel.id, now_id, now_id)
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO progress (channel_id, server_id, start_id, end_id)"
+                    " VALUES (?, ?, ?, ?)",
+                    (int(channel.id), int(channel.server.id), now_id, now_id),
+                )
+            self.progress[channel.id] = progress
+        return progress
+
+    def write_counts(self, counts: typing.Dict[CountKey, int]):
+        rows = [
+            (int(server_id), int(channel_id), int(member_id), day)
+            for server_id, channel_id, member_id, day in counts
+        ]
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO activity"
+            " (server_id, channel_id, member_id, day, count) VALUES (?, ?, ?, ?, 0)",
+            rows,
+        )
+        deltas = [
+            (count, channel_id, day, member_id)
+            for (_, channel_id, member_id, day), count in zip(rows, counts.values())
+        ]
+        self.connection.executemany(
+            "UPDATE activity SET count = count + ?"
+            " WHERE channel_id = ? AND day = ? AND member_id = ?",
+            deltas,
+        )
+
+    def commit(
+        self,
+        progress: ActivityProgress,
+        counts: typing.Dict[CountKey, int],
+        field: str,
+    ):
+        # Counts and the progress that covers them are written together, so a
+        # crash can lose work but never count anything twice.
+        with self.connection:
+            self.write_counts(counts)
+            self.connection.execute(
+                f"UPDATE progress SET {field} = ? WHERE channel_id = ?",
+                (getattr(progress, field), int(progress.channel_id)),
+            )
+
+    def flush(self):
+        if not self.buffered:
+            return
+        with self.connection:
+            self.write_counts(self.buffered_counts)
+            self.connection.executemany(
+                "UPDATE progress SET end_id = ? WHERE channel_id = ?",
+                [
+                    (self.progress[channel_id].end_id, int(channel_id))
+                    for channel_id in self.buffered_ends
+                ],
+            )
+        self.buffered_counts = {}
+        self.buffered_ends = set()
+        self.buffered = 0
+
+    def count_live(self, progress: ActivityProgress, message: discord.Message):
+        message_id = int(message.id)
+        # Skip anything a backfill already counted.
+        if message_id <= progress.end_id:
+            return
+        add_count(self.buffered_counts, message)
+        progress.end_id = message_id
+        self.buffered_ends.add(progress.channel_id)
+        self.buffered += 1
+        if self.buffered >= self.flush_every:
+            self.flush()
+
+    def record(self, message: discord.Message):
+        progress = self.progress.get(message.channel.id)
+        if progress is None:
+            return
+        if message.channel.id in self.live:
+            self.count_live(progress, message)
+        elif message.channel.id in self.filling:
+            self.filling[message.channel.id].append(message)
+        # Otherwise the next backfill will find it.
+
+    def record_delete(self, message: discord.Message):
+        progress = self.progress.get(message.channel.id)
+        if progress is None:
+            return
+        if progress.is_counted(int(message.id)):
+            add_count(self.buffered_counts, message, -1)
+            self.buffered += 1
+        elif message.channel.id in self.filling:
+            pending = self.filling[message.channel.id]
+            self.filling[message.channel.id] = [
+                m for m in pending if m.id != message.id
+            ]
+
+    def reset_live(self):
+        # A new gateway session may have missed messages; catch up again.
+        self.flush()
+        self.live.clear()
+
+    async def fill_forward(self, channel: discord.Channel, progress: ActivityProgress):
+        self.filling[channel.id] = []
+        try:
+            counts = {}
+            after = discord.Object(id=str(progress.end_id))
+            async for message in self.client.logs_from(
+                channel, limit=999999999, after=after, reverse=True
+            ):
+                add_count(counts, message)
+                progress.end_id = int(message.id)
+                if sum(counts.values()) >= self.checkpoint:
+                    self.commit(progress, counts, "end_id")
+                    counts = {}
+            self.commit(progress, counts, "end_id")
+            # Count whatever arrived while the last page was in flight.
+            self.live.add(channel.id)
+            for message in self.filling[channel.id]:
+                self.count_live(progress, message)
+        finally:
+            del self.filling[channel.id]
+
+    async def fill_backward(
+        self, channel: discord.Channel, progress: ActivityProgress, since_id: int
+    ):
+        counts = {}
+        before = discord.Object(id=str(progress.start_id))
+        async for message in self.client.logs_from(
+            channel, limit=999999999, before=before
+        ):
+            message_id = int(message.id)
+            if message_id < since_id:
+                break
+            add_count(counts, message)
+            progress.start_id = message_id
+            if sum(counts.values()) >= self.checkpoint:
+                self.commit(progress, counts, "start_id")
+                counts = {}
+        else:
+            # We've reached the beginning of the channel.
+            since_id = 0
+        progress.start_id = since_id
+        self.commit(progress, counts, "start_id")
+
+    async def cover(self, channel: discord.Channel, since: datetime):
+        """ Make sure every message in `channel` since `since` has been counted. """
+        since_id = int(to_snowflake(to_epoch(since)))
+        async with self.get_lock(channel.id):
+            progress = self.get_progress(channel)
+            if channel.id in self.live and progress.start_id <= since_id:
+                return
+            async with self.semaphore:
+                if channel.id not in self.live:
+                    log.debug(f"Catching up activity in: #{channel}")
+                    await self.fill_forward(channel, progress)
+                if progress.start_id > since_id:
+                    log.info(f"Backfilling activity in #{channel} since {since}")
+                    await self.fill_backward(channel, progress, since_id)
+
+    async def cover_all(
+        self, channels: typing.Iterable[discord.Channel], since: datetime
+    ):
+        async def cover(channel: discord.Channel):
+            try:
+                await self.cover(channel, since)
+            except:
+                log.exception(f"Failed to backfill activity in: #{channel}")
+
+        await asyncio.gather(*(cover(channel) for channel in channels))
+
+    async def count_partial_day(
+        self, channel: discord.Channel, since: datetime, until: float
+    ) -> typing.Dict[UserId, int]:
+        counts = {}
+        async for message in self.client.logs_from(
+            channel, limit=999999999, after=since, reverse=True
+        ):
+            if to_epoch(message.timestamp) >= until:
+                break
+            counts[message.author.id] = counts.get(message.author.id, 0) + 1
+        return counts
+
+    async def count(
+        self, channel: discord.Channel, since: datetime
+    ) -> typing.Dict[UserId, int]:
+        """ Count messages per author in `channel` since `since`. """
+        await self.cover(channel, since)
+        self.flush()
+        # Whole days come from the index; only a partial first day needs the API.
+        since_epoch = to_epoch(since)
+        first_day = -to_day(-since_epoch)
+        counts = {}
+        if since_epoch < first_day * DAY:
+            counts = await self.count_partial_day(channel, since, first_day * DAY)
+        for member_id, count in self.connection.execute(
+            "SELECT member_id, SUM(count) FROM activity"
+            " WHERE channel_id = ? AND day >= ? GROUP BY member_id",
+            (int(channel.id), first_day),
+        ):
+            member_id = str(member_id)
+            counts[member_id] = counts.get(member_id, 0) + count
+        return {member_id: count for member_id, count in counts.items() if count > 0}
@@ -0,0 +1,696 @@
+"""
+Microbenchmarks for the bot's hot paths, run against synthetic data at realistic
+sizes (a few thousand members, hundreds of emoji, channels and FAQs, and a
+full-size block list and NBT schema):
+
+    python -m cogbot.benchmark --output before.json
+    python -m cogbot.benchmark --output after.json --compare before.json
+
+Each benchmark times batches of calls over its inputs and reports the time per
+call. Results are saved as JSON, so that runs from different commits can be
+compared; use `--filter` to run only the benchmarks whose names contain it.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+import typing
+from datetime import datetime, timedelta
+
+import discord
+
+import cogbot
+from cogbot.cog_bot import CogBot
+from cogbot.cog_bot_state import CogBotState
+from cogbot.cogs.robo_mod.conditions import make_condition
+from cogbot.cogs.robo_mod.triggers.message_sent import MessageSentTrigger
+from cogbot.cogs.robo_mod.triggers.reaction_added import ReactionAddedTrigger
+from cogbot.extensions.faq import Faq
+from cogbot.extensions.helpchat.help_chat_server_state import (
+    CHANNEL_TOPIC_TIMESTAMP_FORMAT,
+    CHANNEL_TOPIC_TIMESTAMP_PREFIX,
+)
+from cogbot.extensions.helpchat.simulator import SimulationOptions, Simulator
+from cogbot.extensions.mcblock import McBlock
+from cogbot.extensions.mcnbtdoc import search_field, search_nbt
+
+log = logging.getLogger(__name__)
+
+BENCHMARK_SEED = 1337
+BENCHMARK_REPEAT = 5
+# Each timed batch should take at least this long, so timer noise doesn't matter.
+BENCHMARK_MIN_TIME = 0.2
+
+NUM_MEMBERS = 5000
+NUM_ROLES = 100
+NUM_CHANNELS = 300
+NUM_EMOJIS = 250
+NUM_MESSAGES = 2000
+NUM_FAQS = 400
+NUM_FAQ_TAGS = 80
+NUM_BLOCKS = 800
+NUM_HELP_CHANNELS = 30
+NUM_NBT_MODULES = 30
+NUM_NBT_COMPOUNDS = 1500
+NUM_NBT_FIELDS = 8
+
+UNICODE_EMOJIS = ("👍", "😂", "🎉", "🔥", "❤", "🤔", "👀", "✅", "🐛", "🦊")
+WORDS = (
+    "the", "command", "block", "function", "datapack", "score", "entity",
+    "selector", "nbt", "item", "tag", "predicate", "advancement", "loot",
+    "table", "recipe", "world", "tick", "load", "execute", "summon", "give",
+)
+
+# (condition type, condition data)
+ROBO_MOD_CONDITIONS = (
+    ("message_is_exactly", {"content": "hello world", "ignore_case": True}),
+    ("message_starts_with", {"content": "!spam", "ignore_case": True}),
+    ("message_contains", {"content": "discord.gg/", "ignore_case": True}),
+    (
+        "message_contains_any_of",
+        {
+            "matches": [f"badword{i}" for i in range(50)],
+            "ignore_case": True,
+            "normalize_unicode": True,
+        },
+    ),
+    ("message_has_embed", {}),
+    ("message_has_attachment", {}),
+    ("message_has_embed_or_attachment", {}),
+    ("message_contains_external_media", {}),
+    ("reaction_matches", {"reactions": ["🐛", "🦊", "❌"], "first_only": True}),
+    ("author_is_not_self", {}),
+    ("author_account_age", {"less_than": {"days": 7}}),
+    ("author_has_been_member_for", {"more_than": {"days": 30}}),
+)
+
+BenchmarkSetup = typing.Callable[["SyntheticData"], typing.Tuple[typing.Callable, int]]
+
+BENCHMARKS: typing.Dict[str, BenchmarkSetup] = {}
+
+
+def benchmark(name: str):
+    """
+    Register a benchmark. The decorated function sets up its inputs and returns
+    a function that runs one batch, along with the number of calls per batch.
+    """
+
+    def decorator(setup: BenchmarkSetup) -> BenchmarkSetup:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+class SyntheticData:
+    """ A bot, a server and everything else the benchmarks need, built once. """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, seed: int = BENCHMARK_SEED):
+        self.loop: asyncio.AbstractEventLoop = loop
+        self.random = random.Random(seed)
+        self.ids = itertools.count(10 ** 17)
+        self.bot: CogBot = self.make_bot()
+        self.bot_user_data: dict = self.make_user_data("cogbot", bot=True)
+        self.bot.connection.user = discord.User(**self.bot_user_data)
+        self.server: discord.Server = self.make_server()
+        self.bot.objects.add_server(self.server)
+        self.channels: typing.List[discord.Channel] = list(self.server.channels)
+        self.messages: typing.List[discord.Message] = [
+            self.make_message() for _ in range(NUM_MESSAGES)
+        ]
+
+    def next_id(self) -> str:
+        return str(next(self.ids))
+
+    def make_bot(self) -> CogBot:
+        # The extensions are constructed directly, but they still want options.
+        raw_state = {
+            "extension_state": {
+                "cogbot.extensions.faq": {"database": ""},
+                "cogbot.extensions.mcblock": {"database": ""},
+            }
+        }
+        fd, path = tempfile.mkstemp(suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as fp:
+                json.dump(raw_state, fp)
+            state = CogBotState(path)
+        finally:
+            os.remove(path)
+        return CogBot(state=state, loop=self.loop)
+
+    def make_user_data(self, name: str, bot: bool = False) -> dict:
+        return {
+            "id": self.next_id(),
+            "username": name,
+            "discriminator": f"{self.random.randrange(10000):04}",
+            "avatar": None,
+            "bot": bot,
+        }
+
+    def make_server(self) -> discord.Server:
+        server_id = self.next_id()
+        roles = [
+            {
+                "id": server_id if i == 0 else self.next_id(),
+                "name": "@everyone" if i == 0 else f"role-{i}",
+                "permissions": 104324161,
+                "position": i,
+                "color": 0,
+                "hoist": False,
+                "managed": False,
+                "mentionable": False,
+            }
+            for i in range(NUM_ROLES)
+        ]
+        role_ids = [role["id"] for role in roles[1:]]
+        channels = [
+            {
+                "id": self.next_id(),
+                "name": f"channel-{i}",
+                "type": 0,
+                "position": i,
+                "permission_overwrites": [],
+                "topic": None,
+            }
+            for i in range(NUM_CHANNELS)
+        ]
+        emojis = [
+            {
+                "id": self.next_id(),
+                "name": f"emoji_{i}",
+                "roles": [],
+                "require_colons": True,
+                "managed": False,
+            }
+            for i in range(NUM_EMOJIS)
+        ]
+        now = datetime.utcnow()
+        members = [
+            {
+                "user": self.make_user_data(f"member-{i}"),
+                "roles": self.random.sample(role_ids, self.random.randrange(4)),
+                "joined_at": (
+                    now - timedelta(days=self.random.randrange(1000))
+                ).isoformat(),
+                "deaf": False,
+                "mute": False,
+            }
+            for i in range(NUM_MEMBERS)
+        ]
+        members.append(
+            {
+                "user": self.bot_user_data,
+                "roles": [],
+                "joined_at": now.isoformat(),
+                "deaf": False,
+                "mute": False,
+            }
+        )
+        guild = {
+            "id": server_id,
+            "name": "benchmark",
+            "owner_id": members[0]["user"]["id"],
+            "region": "us-east",
+            "afk_channel_id": None,
+            "afk_timeout": 300,
+            "icon": None,
+            "splash": None,
+            "verification_level": 0,
+            "default_message_notifications": 0,
+            "mfa_level": 0,
+            "features": [],
+            "emojis": emojis,
+            "large": True,
+            "unavailable": False,
+            "member_count": len(members),
+            "roles": roles,
+            "channels": channels,
+            "members": members,
+            "presences": [],
+            "voice_states": [],
+            "joined_at": now.isoformat(),
+        }
+        return self.bot.connection._add_server_from_data(guild)
+
+    def make_words(self, count: int) -> str:
+        return " ".join(self.random.choice(WORDS) for _ in range(count))
+
+    def make_emoji_heavy_content(self) -> str:
+        parts = []
+        for _ in range(self.random.randrange(5, 20)):
+            if self.random.random() < 0.5:
+                emoji = self.random.choice(self.server.emojis)
+                parts.append(f"<:{emoji.name}:{emoji.id}>")
+            else:
+                parts.append(self.random.choice(UNICODE_EMOJIS))
+            if self.random.random() < 0.3:
+                parts.append(self.make_words(2))
+        return " ".join(parts)
+
+    def make_message(self, kind: str = None) -> discord.Message:
+        """ Make a message like the ones a busy server sees, in similar shares. """
+        kind = kind or self.random.choices(
+            ("chatter", "command", "quote", "mention", "emoji", "link"),
+            weights=(55, 10, 5, 5, 20, 5),
+        )[0]
+        member = self.random.choice(list(self.server.members))
+        mentions = []
+        if kind == "command":
+            content = f">{self.random.choice(WORDS)} {self.make_words(3)}"
+        elif kind == "quote":
+            content = f"> {self.make_words(8)}\n{self.make_words(5)}"
+        elif kind == "mention":
+            content = f"<@{self.bot_user_data['id']}> {self.make_words(6)}"
+            mentions.append(self.bot_user_data)
+        elif kind == "emoji":
+            content = self.make_emoji_heavy_content()
+        elif kind == "link":
+            content = f"{self.make_words(4)} https://example.com/{self.next_id()}"
+        else:
+            content = self.make_words(self.random.randrange(3, 40))
+        reaction = {
+            "emoji": {"id": None, "name": self.random.choice(UNICODE_EMOJIS)},
+            "count": self.random.randrange(1, 4),
+            "me": False,
+        }
+        channel = self.random.choice(self.channels)
+        return self.bot.connection._create_message(
+            channel=channel,
+            id=self.next_id(),
+            channel_id=channel.id,
+            author={
+                "id": member.id,
+                "username": member.name,
+                "discriminator": member.discriminator,
+                "avatar": None,
+            },
+            content=content,
+            timestamp=datetime.utcnow().isoformat(),
+            edited_timestamp=None,
+            tts=False,
+            mention_everyone=False,
+            mentions=mentions,
+            mention_roles=[],
+            attachments=[],
+            embeds=[],
+            reactions=[reaction],
+            pinned=False,
+            type=0,
+        )
+
+    def close(self):
+        self.loop.run_until_complete(self.bot.close())
+
+
+def make_faq_data(rand: random.Random) -> dict:
+    tags = [f"tag{i}" for i in range(NUM_FAQ_TAGS)]
+    return {
+        f"faq-{i}": {
+            "tags": " ".join(rand.sample(tags, rand.randrange(1, 6))),
+            "message": [f"Answer number {i}.", "See the wiki for more."],
+            "aliases": [f"alias-{i}"],
+        }
+        for i in range(NUM_FAQS)
+    }
+
+
+def make_block_data(rand: random.Random) -> dict:
+    properties = {
+        "facing": ["north", "east", "south", "west", "up", "down"],
+        "waterlogged": ["true", "false"],
+        "half": ["top", "bottom"],
+        "shape": ["straight", "inner_left", "inner_right", "outer_left"],
+        "powered": ["true", "false"],
+        "age": [str(age) for age in range(16)],
+        "power": [str(power) for power in range(16)],
+        "axis": ["x", "y", "z"],
+    }
+    keys = sorted(properties)
+    blocks = {}
+    for i in range(NUM_BLOCKS):
+        block = {}
+        chosen = rand.sample(keys, rand.choice((0, 0, 1, 2, 3, 4)))
+        if chosen:
+            block["properties"] = {key: properties[key] for key in chosen}
+        blocks[f"minecraft:block_{i}"] = block
+    return blocks
+
+
+def make_nbt_data(rand: random.Random) -> dict:
+    """ A schema shaped like mc-nbtdoc's: modules of compounds with fields. """
+    compound_arena = [
+        {
+            "fields": {
+                f"{rand.choice(WORDS).title()}{j}": {
+                    "description": "",
+                    "nbttype": "Int",
+                }
+                for j in range(NUM_NBT_FIELDS)
+            }
+        }
+        for _ in range(NUM_NBT_COMPOUNDS)
+    ]
+    module_arena = [{"children": {}}]
+    for i in range(1, NUM_NBT_MODULES):
+        module_arena.append({"children": {}})
+        # Nest some modules, to give the searches something to recurse into.
+        parent = module_arena[rand.randrange(i)]
+        parent["children"][f"module_{i}"] = {"Module": i}
+    for i in range(NUM_NBT_COMPOUNDS):
+        module = rand.choice(module_arena)
+        module["children"][f"{rand.choice(WORDS)}_{i}"] = {"Compound": i}
+    return {
+        "compound_arena": compound_arena,
+        "module_arena": module_arena,
+        "root_modules": {"minecraft": 0},
+    }
+
+
+@benchmark("cog_bot.care_about_it")
+def bench_care_about_it(data: SyntheticData):
+    bot, messages = data.bot, data.messages
+
+    def run():
+        for message in messages:
+            bot.care_about_it(message)
+
+    return run, len(messages)
+
+
+@benchmark("cog_bot.is_command")
+def bench_is_command(data: SyntheticData):
+    bot, messages = data.bot, data.messages
+
+    def run():
+        for message in messages:
+            bot.is_command(message)
+
+    return run, len(messages)
+
+
+@benchmark("cog_bot.iter_emojis")
+def bench_iter_emojis(data: SyntheticData):
+    bot = data.bot
+    messages = [data.make_message("emoji") for _ in range(500)]
+
+    def run():
+        for message in messages:
+            # Each message is normally only cleaned up once, so don't cache it.
+            try:
+                del message._clean_content
+            except AttributeError:
+                pass
+            for _ in bot.iter_emojis(message):
+                pass
+
+    return run, len(messages)
+
+
+def make_robo_mod_benchmark(name: str, condition_data: dict) -> BenchmarkSetup:
+    def setup(data: SyntheticData):
+        state = argparse.Namespace(bot=data.bot)
+        condition = data.loop.run_until_complete(
+            make_condition(state, dict(condition_data, type=name.upper()))
+        )
+        if name == "reaction_matches":
+            triggers = [
+                ReactionAddedTrigger(state, None, message.reactions[0], message.author)
+                for message in data.messages
+            ]
+        else:
+            triggers = [
+                MessageSentTrigger(state, None, message) for message in data.messages
+            ]
+
+        async def check_all():
+            for trigger in triggers:
+                await condition.check(trigger)
+
+        def run():
+            data.loop.run_until_complete(check_all())
+
+        return run, len(triggers)
+
+    return setup
+
+
+for condition_name, condition_data in ROBO_MOD_CONDITIONS:
+    benchmark(f"robo_mod.{condition_name}.check")(
+        make_robo_mod_benchmark(condition_name, condition_data)
+    )
+
+
+def make_simulator(data: SyntheticData) -> Simulator:
+    options = SimulationOptions(num_channels=NUM_HELP_CHANNELS, seed=BENCHMARK_SEED)
+    simulator = Simulator({}, options)
+    # Spread the channels across every state.
+    state = simulator.state
+    state_names = ("hoisted", "busy", "idle", "pending", "answered", "ducked")
+    for i, channel in enumerate(state.channels):
+        channel_state = getattr(state, f"{state_names[i % len(state_names)]}_state")
+        key = state.get_channel_key(channel)
+        channel.name = channel_state.format_name(key=key, channel=channel)
+        timestamp = simulator.clock() - timedelta(minutes=i)
+        channel.topic = "\n".join(
+            (
+                data.make_words(20),
+                "",
+                CHANNEL_TOPIC_TIMESTAMP_PREFIX
+                + timestamp.strftime(CHANNEL_TOPIC_TIMESTAMP_FORMAT),
+            )
+        )
+    return simulator
+
+
+@benchmark("helpchat.get_channel_state")
+def bench_get_channel_state(data: SyntheticData):
+    state = make_simulator(data).state
+    channels = list(state.channels)
+
+    def run():
+        for channel in channels:
+            state.get_channel_state(channel)
+
+    return run, len(channels)
+
+
+@benchmark("helpchat.get_last_update_timestamp")
+def bench_get_last_update_timestamp(data: SyntheticData):
+    state = make_simulator(data).state
+    channels = list(state.channels)
+
+    def run():
+        for channel in channels:
+            state.get_last_update_timestamp(channel)
+
+    return run, len(channels)
+
+
+@benchmark("faq.get_entries_by_tags")
+def bench_get_entries_by_tags(data: SyntheticData):
+    faq = Faq(data.bot, "cogbot.extensions.faq")
+    faq.apply_entries(faq.build_entries(make_faq_data(data.random)))
+    tags = list(faq.entries_by_tag)
+    queries = [
+        data.random.sample(tags, data.random.randrange(1, 4)) for _ in range(1000)
+    ]
+
+    def run():
+        for query in queries:
+            faq.get_entries_by_tags(query)
+
+    return run, len(queries)
+
+
+@benchmark("mcnbtdoc.search_nbt")
+def bench_search_nbt(data: SyntheticData):
+    nbt_data = make_nbt_data(data.random)
+    root = nbt_data["root_modules"]["minecraft"]
+    queries = ("item", "entity_1", "Score", "nothing-matches-this")
+
+    def run():
+        for query in queries:
+            search_nbt(query, root, [], nbt_data)
+
+    return run, len(queries)
+
+
+@benchmark("mcnbtdoc.search_field")
+def bench_search_field(data: SyntheticData):
+    nbt_data = make_nbt_data(data.random)
+    queries = ("Item1", "Tick", "nothing-matches-this")
+
+    def run():
+        for query in queries:
+            search_field(query, nbt_data)
+
+    return run, len(queries)
+
+
+@benchmark("mcblock.make_response")
+def bench_make_response(data: SyntheticData):
+    mcblock = McBlock(data.bot, "cogbot.extensions.mcblock")
+    mcblock.apply_block_map(mcblock.build_block_map(make_block_data(data.random)))
+    blocks = list(mcblock.block_map.values())
+
+    def run():
+        for block in blocks:
+            mcblock.make_response(block)
+
+    return run, len(blocks)
+
+
+class BenchmarkResult:
+    def __init__(self, name: str, calls: int, timings: typing.List[float]):
+        self.name: str = name
+        # Calls per timed batch, and seconds per call for each batch.
+        self.calls: int = calls
+        self.timings: typing.List[float] = timings
+
+    @property
+    def best(self) -> float:
+        return min(self.timings)
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.timings)
+
+    def to_json(self) -> dict:
+        return {
+            "calls": self.calls,
+            "best": self.best,
+            "median": self.median,
+            "timings": self.timings,
+        }
+
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+def run_benchmark(
+    name: str, run: typing.Callable, items: int, repeat: int = BENCHMARK_REPEAT
+) -> BenchmarkResult:
+    # Find how many batches it takes to fill the minimum time, like `timeit`.
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - started
+        if elapsed >= BENCHMARK_MIN_TIME:
+            break
+        loops *= 2
+    calls = loops * items
+    timings = [elapsed / calls]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            run()
+        timings.append((time.perf_counter() - started) / calls)
+    return BenchmarkResult(name, calls, timings)
+
+
+def get_git_commit() -> typing.Optional[str]:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    names: typing.Iterable[str], repeat: int = BENCHMARK_REPEAT
+) -> typing.List[BenchmarkResult]:
+    loop = asyncio.get_event_loop()
+    data = SyntheticData(loop)
+    results = []
+    try:
+        for name in names:
+            run, items = BENCHMARKS[name](data)
+            result = run_benchmark(name, run, items, repeat=repeat)
+            print(
+                f"{name:<48} {format_seconds(result.median):>10} per call"
+                f" (best {format_seconds(result.best)})"
+            )
+            results.append(result)
+    finally:
+        data.close()
+    return results
+
+
+def compare_results(results: typing.List[BenchmarkResult], baseline: dict):
+    print()
+    print(f"Compared to {baseline.get('commit') or 'baseline'}:")
+    previous = baseline.get("benchmarks", {})
+    for result in results:
+        before = previous.get(result.name)
+        if not before:
+            print(f"{result.name:<48} {'new':>10}")
+            continue
+        # The best run is the least disturbed by whatever else the machine is doing.
+        ratio = result.best / before["best"]
+        print(f"{result.name:<48} {ratio:>9.2f}x")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark cogbot's hot paths.")
+    arg_parser.add_argument("--output", help="Write the results to this JSON file")
+    arg_parser.add_argument("--compare", help="Compare with results from this file")
+    arg_parser.add_argument(
+        "--filter", help="Only run benchmarks whose names contain this"
+    )
+    arg_parser.add_argument(
+        "--repeat",
+        help="How many batches to time for each benchmark",
+        type=int,
+        default=BENCHMARK_REPEAT,
+    )
+    arg_parser.add_argument("--log", help="Log level", default="ERROR")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=args.log)
+
+    names = [name for name in BENCHMARKS if not args.filter or args.filter in name]
+    results = run_benchmarks(names, repeat=args.repeat)
+
+    report = {
+        "commit": get_git_commit(),
+        "cogbot_version": cogbot.__version__,
+        "python_version": platform.python_version(),
+        "discord_version": discord.__version__,
+        "timestamp": datetime.utcnow().isoformat(),
+        "benchmarks": {result.name: result.to_json() for result in results},
+    }
+
+    if args.compare:
+        with open(args.compare) as fp:
+            compare_results(results, json.load(fp))
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
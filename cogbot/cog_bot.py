@@ -1,8 +1,8 @@
-import json
+import asyncio
 import logging
 import re
+import time
 import typing
-import urllib.request
 from datetime import datetime, timedelta
 
 import discord
@@ -12,11 +12,25 @@ from discord.ext.commands import Context
 from discord.ext.commands.errors import *
 
 from cogbot.cog_bot_server_state import CogBotServerState
+from cogbot.activity_index import ActivityIndex
 from cogbot.cog_bot_state import CogBotState
+from cogbot.dataset_loader import DatasetLoader
+from cogbot.gateway_replay import GatewayRecorder
+from cogbot.lean_cache import LeanCache
+from cogbot.listener_timings import ListenerTimings
+from cogbot.loop_watchdog import LoopWatchdog
+from cogbot.memory import CacheRegistry, MemoryTracker
+from cogbot.message_store import MessageStore, to_epoch, to_snowflake
+from cogbot.metrics import MetricsRegistry, MetricsServer
+from cogbot.object_index import ObjectIndex, get_custom_emoji_id
+from cogbot.rest_scheduler import RestScheduler
 from cogbot.types import ChannelId, RoleId, ServerId, UserId
+from cogbot.web_client import WebClient
 
 log = logging.getLogger(__name__)
 
+REPORT_CONCURRENCY = 4
+
 
 # https://gist.github.com/Alex-Just/e86110836f3f93fe7932290526529cd1#gistcomment-3208085
 # https://en.wikipedia.org/wiki/Unicode_block
@@ -66,12 +80,101 @@ class CogBot(commands.Bot):
         self.server_state: typing.Dict[ServerId, CogBotServerState] = {}
         self.server_by_key: typing.Dict[str, discord.Server] = {}
 
+        # Numbers, for `>status` and (optionally) a local scrape endpoint.
+        self.metrics = MetricsRegistry()
+        self.events_total = self.metrics.counter(
+            "cogbot_events_total", "Events dispatched, by event.", labels=("event",)
+        )
+        self.listener_seconds = self.metrics.histogram(
+            "cogbot_listener_seconds",
+            "Time spent in each event listener.",
+            labels=("listener",),
+        )
+        self.commands_total = self.metrics.counter(
+            "cogbot_commands_total", "Commands invoked, by name.", labels=("command",)
+        )
+        self.cache_size = self.metrics.gauge(
+            "cogbot_cache_size", "Number of objects cached, by kind.", labels=("cache",)
+        )
+        self.loop_lag = self.metrics.gauge(
+            "cogbot_loop_lag_seconds", "Most recent event loop lag."
+        )
+        self.loop_stalls = self.metrics.gauge(
+            "cogbot_loop_stalls", "Number of times the event loop stalled."
+        )
+        self.metrics.add_collector(self.collect_metrics)
+        self.listener_timings = ListenerTimings(
+            threshold=self.state.slow_listener_threshold
+        )
+        self.metrics_server: MetricsServer = MetricsServer(
+            self.metrics, self.state.metrics_port, host=self.state.metrics_host
+        ) if self.state.metrics_port else None
+
+        # Optionally drop the presence, typing and voice state that nothing uses.
+        self.lean_cache: LeanCache = LeanCache(
+            self.connection, metrics=self.metrics
+        ) if self.state.lean_cache else None
+
+        # Anything that holds on to data registers its size here.
+        self.caches = CacheRegistry()
+        self.caches.register("messages", lambda: len(self.connection.messages))
+        self.caches.register("servers", lambda: len(self.servers))
+        self.caches.register("channels", lambda: len(self.objects.channels))
+        self.caches.register(
+            "members", lambda: sum(len(server.members) for server in self.servers)
+        )
+        self.memory = MemoryTracker()
+
+        # Rank outbound requests, so that moderation never waits on reactions.
+        self.rest = RestScheduler(self.http, self.loop, metrics=self.metrics)
+
+        # Keep an eye out for anything blocking the event loop.
+        self.watchdog: LoopWatchdog = LoopWatchdog(
+            self.loop, threshold=self.state.loop_lag_threshold
+        ) if self.state.loop_lag_threshold else None
+
+        # Look up channels, roles and emoji by id without scanning.
+        self.objects = ObjectIndex()
+
+        # Anyone waiting for a channel to show up, by channel id.
+        self.channel_waiters: typing.Dict[
+            ChannelId, typing.List[asyncio.Future]
+        ] = {}
+
         # Remember when we started.
         self.started_at = datetime.now()
 
         # A queue of messages to send after login.
         self.queued_messages = []
 
+        # One pooled HTTP client, shared by every extension.
+        self.web = WebClient(self.loop)
+
+        # Remote datasets are fetched and parsed off the event loop.
+        self.datasets = DatasetLoader(
+            self.web, self.loop, cache_dir=self.state.dataset_cache
+        )
+
+        # Optionally keep a local record of messages, to spare the history API.
+        self.message_store: MessageStore = MessageStore(
+            self.state.message_store
+        ) if self.state.message_store else None
+
+        # Optionally keep daily message counts, to spare activity reports.
+        self.activity_index: ActivityIndex = ActivityIndex(
+            self, self.state.activity_index
+        ) if self.state.activity_index else None
+        if self.activity_index:
+            self.caches.register(
+                "activity backfill",
+                lambda: sum(map(len, self.activity_index.filling.values())),
+            )
+
+        # Optionally record gateway events, for replaying under load later.
+        self.gateway_recorder: GatewayRecorder = GatewayRecorder(
+            self.state.gateway_record
+        ) if self.state.gateway_record else None
+
         if self.state.extensions:
             # skip disabled extensions (those beginning with a `!`)
             enabled_extensions = [
@@ -85,11 +188,59 @@ class CogBot(commands.Bot):
 
     def get_emoji(self, server: discord.Server, emoji: str):
         if emoji.startswith("<"):
-            for e in server.emojis:
-                if str(e) == emoji:
-                    return e
+            e = self.objects.get_emoji(server, get_custom_emoji_id(emoji))
+            if e and str(e) == emoji:
+                return e
         return emoji
 
+    def get_channel(self, id: ChannelId) -> discord.Channel:
+        # fall back to discord.py for private channels
+        return self.objects.get_channel(id) or super().get_channel(id)
+
+    def collect_metrics(self):
+        for cache, size in self.caches.get_sizes().items():
+            self.cache_size.set(size, cache=cache)
+        if self.watchdog:
+            self.loop_lag.set(self.watchdog.lag)
+            self.loop_stalls.set(self.watchdog.stalls)
+
+    def get_listener_owner(self, listener) -> str:
+        owner = getattr(listener, "__self__", None)
+        if owner is not None:
+            return type(owner).__name__
+        return getattr(listener, "__module__", None) or "?"
+
+    def record_listener(self, owner: str, event: str, started: float, args: tuple):
+        duration = time.perf_counter() - started
+        self.listener_seconds.observe(duration, listener=f"{owner}.on_{event}")
+        self.listener_timings.record(owner, event, duration, args)
+
+    def dispatch(self, event, *args, **kwargs):
+        self.events_total.inc(event=event)
+        super().dispatch(event, *args, **kwargs)
+
+    def handle_socket_response(self, msg: dict):
+        # called synchronously by discord.py, so this doesn't cost a task
+        if self.gateway_recorder:
+            self.gateway_recorder.record(msg)
+
+    async def _run_event(self, event, *args, **kwargs):
+        # time our own `on_` handlers...
+        started = time.perf_counter()
+        try:
+            await super()._run_event(event, *args, **kwargs)
+        finally:
+            self.record_listener(type(self).__name__, event[3:], started, args)
+
+    async def _run_extra(self, coro, event_name, *args, **kwargs):
+        # ... and every cog's listeners
+        started = time.perf_counter()
+        try:
+            await super()._run_extra(coro, event_name, *args, **kwargs)
+        finally:
+            owner = self.get_listener_owner(coro)
+            self.record_listener(owner, event_name, started, args)
+
     def queue_message(self, dest_getter, dest_id, content):
         self.queued_messages.append((dest_getter, dest_id, content))
 
@@ -114,14 +265,22 @@ class CogBot(commands.Bot):
         log.info(f"Finished unloading extensions.")
 
     async def load_json(self, address: str) -> dict:
-        if address.startswith(("http://", "https://")):
-            response = urllib.request.urlopen(address)
-            content = response.read().decode("utf8")
-            data = json.loads(content)
-        else:
-            with open(address, encoding="utf-8") as fp:
-                data = json.load(fp)
-        return data
+        return await self.datasets.load(address)
+
+    async def close(self):
+        await super().close()
+        await self.web.close()
+        self.datasets.close()
+        if self.message_store:
+            self.message_store.close()
+        if self.activity_index:
+            self.activity_index.close()
+        if self.watchdog:
+            self.watchdog.stop()
+        if self.metrics_server:
+            self.metrics_server.close()
+        if self.gateway_recorder:
+            self.gateway_recorder.close()
 
     def force_logout(self):
         self._is_logged_in.clear()
@@ -146,36 +305,54 @@ class CogBot(commands.Bot):
     def make_message_link(self, message: discord.Message) -> str:
         return f"https://discordapp.com/channels/{message.server.id}/{message.channel.id}/{message.id}"
 
+    async def count_messages(
+        self, channel: discord.Channel, since: datetime
+    ) -> typing.Dict[UserId, int]:
+        # count from the daily activity index, if we have one
+        if self.activity_index:
+            return await self.activity_index.count(channel, since)
+        # or from the local store, after filling in anything it's missing
+        if self.message_store:
+            await self.fill_message_gaps(channel, since)
+            return self.message_store.count_by_author(channel.id, to_epoch(since))
+        counts = {}
+        async for message in self.logs_from(channel, limit=999999999, after=since):
+            counts[message.author.id] = counts.get(message.author.id, 0) + 1
+        return counts
+
     async def make_message_report(
         self,
         channels: typing.List[discord.Channel],
         members: typing.List[discord.Member],
         since: datetime,
+        concurrency: int = REPORT_CONCURRENCY,
     ) -> MessageReport:
+        # count several channels at once
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def count(channel: discord.Channel) -> typing.Dict[UserId, int]:
+            async with semaphore:
+                return await self.count_messages(channel, since)
+
+        results = await asyncio.gather(*(count(channel) for channel in channels))
         report = MessageReport()
-        for channel in channels:
-            report.total_messages[channel] = 0
-            messages_per_member = {member: 0 for member in members}
-            report.messages_per_member[channel] = messages_per_member
-            async for message in self.logs_from(channel, limit=999999999, after=since):
-                message: discord.Message
-                author: discord.Member = message.author
-                report.total_messages[channel] += 1
-                if author in messages_per_member:
-                    messages_per_member[author] += 1
+        for channel, counts in zip(channels, results):
+            report.total_messages[channel] = sum(counts.values())
+            report.messages_per_member[channel] = {
+                member: counts.get(member.id, 0) for member in members
+            }
         return report
 
     def get_role(self, server: discord.Server, role_id: str) -> discord.Role:
-        for role in server.roles:
-            if role.id == role_id:
-                return role
+        return self.objects.get_role(server, role_id)
 
     def get_roles(
         self, server: discord.Server, role_ids: typing.Iterable[str]
     ) -> typing.Iterable[discord.Role]:
-        role_id_set = set(role_ids)
-        for role in server.roles:
-            if role.id in role_id_set:
+        # skip duplicates, but keep the order we were given
+        for role_id in dict.fromkeys(role_ids):
+            role = self.objects.get_role(server, role_id)
+            if role:
                 yield role
 
     def color_from_hex(self, color: str) -> discord.Color:
@@ -207,6 +384,63 @@ class CogBot(commands.Bot):
             json=payload,
         )
 
+    async def create_text_channel(
+        self,
+        server: discord.Server,
+        name: str,
+        topic: str = None,
+        position: int = None,
+        category: discord.Channel = None,
+        template: discord.Channel = None,
+        **options,
+    ) -> dict:
+        # NOTE hack because this version of discord is older than categories
+        payload = dict(type=0, name=name, **options)
+        if topic is not None:
+            payload["topic"] = topic
+        if position is not None:
+            payload["position"] = position
+        if category is not None:
+            payload["parent_id"] = category.id
+        # copy permissions from the template channel, if any
+        if template is not None:
+            overwrites = []
+            for target, overwrite in template.overwrites:
+                allow, deny = overwrite.pair()
+                overwrites.append(
+                    {
+                        "id": target.id,
+                        "type": "role" if isinstance(target, discord.Role) else "member",
+                        "allow": allow.value,
+                        "deny": deny.value,
+                    }
+                )
+            payload["permission_overwrites"] = overwrites
+        return await self.http.request(
+            discord.http.Route("POST", "/guilds/{guild_id}/channels", guild_id=server.id),
+            json=payload,
+        )
+
+    async def wait_for_channel(
+        self, channel_id: ChannelId, timeout: float = 10.0
+    ) -> discord.Channel:
+        # newly-created channels only make it into the cache once the gateway
+        # tells us about them, so wait for that to happen
+        channel = self.get_channel(channel_id)
+        if channel:
+            return channel
+        future = self.loop.create_future()
+        waiters = self.channel_waiters.setdefault(channel_id, [])
+        waiters.append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return self.get_channel(channel_id)
+        finally:
+            waiters.remove(future)
+            if not waiters:
+                self.channel_waiters.pop(channel_id, None)
+
     async def move_channel_to_category(
         self, channel: discord.Channel, category: discord.Channel, position: int = None
     ):
@@ -231,12 +465,10 @@ class CogBot(commands.Bot):
         emoji_matches = EMOJI_PATTERN.findall(message.clean_content)
         for emoji in emoji_matches:
             if emoji.startswith("<"):
-                try:
-                    em_id = re.findall(r"\:(\d+)\>", emoji)[0]
-                    emoji = [em for em in message.server.emojis if em.id == em_id][0]
+                emoji_id = get_custom_emoji_id(emoji)
+                emoji = self.objects.get_emoji(message.server, emoji_id)
+                if emoji:
                     yield emoji
-                except:
-                    pass
             elif emoji:
                 yield emoji
 
@@ -248,6 +480,23 @@ class CogBot(commands.Bot):
     async def on_ready(self):
         log.info(f"Logged in as {self.user.name} (id {self.user.id})")
 
+        if self.watchdog:
+            self.watchdog.start()
+
+        if self.metrics_server:
+            try:
+                await self.metrics_server.start()
+            except:
+                log.exception("Failed to start metrics server")
+
+        # (re)index everything, in case we missed any events while disconnected
+        for server in self.servers:
+            self.objects.add_server(server)
+
+        # a new gateway session; we'll hear about every message from here on
+        if self.message_store:
+            self.message_store.start_session()
+
         # resolve configured servers
         for server_key, server_options in self.state.servers.items():
             # copy options dict because we need to make modifications
@@ -275,6 +524,18 @@ class CogBot(commands.Bot):
             else:
                 log.error(f"Missing server_id for server {server_key}")
 
+        # catch up on activity, and backfill anything we haven't counted yet
+        if self.activity_index:
+            self.activity_index.reset_live()
+            since = datetime.utcnow() - timedelta(days=self.state.activity_backfill)
+            channels = [
+                channel
+                for server_id in self.server_state
+                for channel in self.get_server(server_id).channels
+                if channel.type == discord.ChannelType.text
+            ]
+            self.loop.create_task(self.activity_index.cover_all(channels, since))
+
         # Send any queued messages.
         if self.queued_messages:
             log.info(f"Sending {len(self.queued_messages)} queued messages...")
@@ -314,12 +575,57 @@ class CogBot(commands.Bot):
         then: datetime = message.timestamp + delta
         return now > then
 
+    def get_channel_epoch(self, channel: discord.Channel) -> float:
+        return to_epoch(discord.utils.snowflake_time(channel.id))
+
+    async def fetch_latest_messages(
+        self, channel: discord.Channel, limit: int = 1
+    ) -> typing.List[discord.Message]:
+        # newest first, like `logs_from`
+        store = self.message_store
+        if store:
+            rows = store.get_latest(channel.id, limit)
+            # if there are fewer messages than asked for, we need to know about
+            # everything since the channel was created
+            start = rows[-1][0] if len(rows) >= limit else self.get_channel_epoch(channel)
+            if store.is_covered(channel.id, start):
+                return [
+                    discord.Message(channel=channel, reactions=[], **data)
+                    for _, data in rows
+                ]
+        fetched_at = time.time()
+        messages = [m async for m in self.logs_from(channel, limit=limit)]
+        if store:
+            start = (
+                to_epoch(messages[-1].timestamp)
+                if len(messages) >= limit
+                else self.get_channel_epoch(channel)
+            )
+            # Whatever we had before the fetch existed when it was made.
+            known_id = int(rows[0][1]["id"]) if rows else None
+            store.record_range(channel.id, start, fetched_at, messages, known_id)
+        return messages
+
+    async def fill_message_gaps(self, channel: discord.Channel, since: datetime):
+        # fetch whatever the local store is missing between `since` and now
+        store = self.message_store
+        for gap_start, gap_end in store.get_gaps(channel.id, to_epoch(since)):
+            messages = []
+            before = discord.Object(id=to_snowflake(gap_end))
+            async for message in self.logs_from(channel, limit=999999999, before=before):
+                if to_epoch(message.timestamp) < gap_start:
+                    break
+                messages.append(message)
+            # The fetch saw every message older than `before`.
+            until_id = int(before.id) - 1
+            store.record_range(channel.id, gap_start, gap_end, messages, until_id)
+
     async def get_latest_message(self, channel: discord.Channel) -> discord.Message:
-        async for message in self.logs_from(channel, limit=1):
+        for message in await self.fetch_latest_messages(channel, limit=1):
             return message
 
     async def is_latest_message(self, message: discord.Message, limit: int = 1) -> bool:
-        async for m in self.logs_from(message.channel, limit=limit):
+        for m in await self.fetch_latest_messages(message.channel, limit=limit):
             if message.id == m.id:
                 return True
 
@@ -327,15 +633,46 @@ class CogBot(commands.Bot):
         self, channels: typing.List[discord.Channel], limit: int = 1
     ) -> typing.Iterable[discord.Message]:
         for channel in channels:
-            async for message in self.logs_from(channel, limit=limit):
+            for message in await self.fetch_latest_messages(channel, limit=limit):
                 yield message
 
     async def get_latest_messages(
-        self, channels: typing.List[discord.Channel], limit: int = 1
+        self,
+        channels: typing.List[discord.Channel],
+        limit: int = 1,
+        concurrency: int = 1,
     ) -> typing.List[discord.Message]:
-        return [m async for m in self.iter_latest_messages(channels, limit=limit)]
+        if concurrency <= 1:
+            return [m async for m in self.iter_latest_messages(channels, limit=limit)]
+        # fetch several channels at once, but keep the results in channel order
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(channel: discord.Channel) -> typing.List[discord.Message]:
+            async with semaphore:
+                return await self.fetch_latest_messages(channel, limit=limit)
+
+        results = await asyncio.gather(*(fetch(channel) for channel in channels))
+        return [m for channel_messages in results for m in channel_messages]
+
+    def cache_messages(self, messages: typing.Iterable[discord.Message]) -> int:
+        # add messages to the client cache so that discord.py will dispatch
+        # events (reactions, edits, deletes) for them; skip any that are already
+        # cached and don't add more than the cache can hold
+        cache: typing.Deque[discord.Message] = self.connection.messages
+        cached_ids = {m.id for m in cache}
+        to_cache = [m for m in messages if m.id not in cached_ids]
+        # oldest first, like the cache itself
+        to_cache.sort(key=lambda m: m.timestamp)
+        if cache.maxlen is not None:
+            to_cache = to_cache[-cache.maxlen :]
+        cache.extend(to_cache)
+        return len(to_cache)
 
     async def on_message(self, message):
+        if self.message_store and message.server:
+            self.message_store.record(message)
+        if self.activity_index and message.server:
+            self.activity_index.record(message)
         if self.care_about_it(message):
             # listen to anyone on public channels
             if message.server:
@@ -348,6 +685,61 @@ class CogBot(commands.Bot):
                 log.info(f"[{message.author}] {message.content}")
                 await super().on_message(message)
 
+    async def on_message_edit(self, before: discord.Message, after: discord.Message):
+        if self.message_store and after.server:
+            self.message_store.record(after)
+
+    async def on_message_delete(self, message: discord.Message):
+        if self.message_store and message.server:
+            self.message_store.record_delete(message)
+        if self.activity_index and message.server:
+            self.activity_index.record_delete(message)
+
+    async def on_command(self, command: commands.Command, ctx: Context):
+        self.commands_total.inc(command=command.qualified_name)
+
+    async def on_server_join(self, server: discord.Server):
+        self.objects.add_server(server)
+
+    async def on_server_available(self, server: discord.Server):
+        self.objects.add_server(server)
+
+    async def on_server_update(self, before: discord.Server, after: discord.Server):
+        self.objects.add_server(after)
+
+    async def on_server_remove(self, server: discord.Server):
+        self.objects.remove_server(server)
+
+    async def on_channel_create(self, channel: discord.Channel):
+        self.objects.add_channel(channel)
+        for future in self.channel_waiters.get(channel.id, ()):
+            if not future.done():
+                future.set_result(channel)
+
+    async def on_channel_update(self, before: discord.Channel, after: discord.Channel):
+        self.objects.add_channel(after)
+
+    async def on_channel_delete(self, channel: discord.Channel):
+        self.objects.remove_channel(channel)
+
+    async def on_server_role_create(self, role: discord.Role):
+        self.objects.add_role(role)
+
+    async def on_server_role_update(self, before: discord.Role, after: discord.Role):
+        self.objects.add_role(after)
+
+    async def on_server_role_delete(self, role: discord.Role):
+        self.objects.remove_role(role)
+
+    async def on_server_emojis_update(
+        self, before: typing.List[discord.Emoji], after: typing.List[discord.Emoji]
+    ):
+        # the server's emoji list is replaced wholesale, so just re-index it
+        emojis = after or before
+        if emojis:
+            server = emojis[0].server
+            self.objects.set_emojis(server, server.emojis)
+
     async def on_command_error(self, error: CommandError, ctx: Context):
         inner_error = error.original if isinstance(error, CommandInvokeError) else error
 
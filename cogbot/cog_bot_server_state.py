@@ -18,7 +18,9 @@ class CogBotServerState:
         self.log_channel: discord.Channel = None
         if log_channel:
             self.log_channel = self.bot.get_channel(log_channel)
-            if not self.log_channel:
+            if self.log_channel:
+                self.bot.rest.add_log_channel(self.log_channel)
+            else:
                 log.warning(f"[{self.server}] Failed to resolve log channel <{log_channel}>")
 
     async def mod_log(
@@ -1,6 +1,7 @@
 import json
 import logging
-import urllib.request
+
+from cogbot.dataset_loader import parse_json, read_address
 
 log = logging.getLogger(__name__)
 
@@ -16,9 +17,9 @@ class CogBotState:
 
         if state_file.startswith(("http://", "https://")):
             try:
-                response = urllib.request.urlopen(state_file)
-                content = response.read().decode("utf8")
-                raw_state = json.loads(content)
+                # This runs before the event loop starts, so a blocking read
+                # is fine; it just shouldn't hang forever.
+                raw_state = parse_json(read_address(state_file))
                 log.info('Successfully loaded main bot state from remote location')
             except Exception as error:
                 log.error(f"Failed to load main bot state: {error}")
@@ -49,6 +50,16 @@ class CogBotState:
             "react_to_unknown_commands", False
         )
         self.allow_dms = raw_state.get('allow_dms', False)
+        self.loop_lag_threshold = raw_state.get("loop_lag_threshold", 1.0)
+        self.slow_listener_threshold = raw_state.get("slow_listener_threshold", 0.5)
+        self.metrics_port = raw_state.get("metrics_port")
+        self.metrics_host = raw_state.get("metrics_host", "127.0.0.1")
+        self.dataset_cache = raw_state.get("dataset_cache")
+        self.message_store = raw_state.get("message_store")
+        self.activity_index = raw_state.get("activity_index")
+        self.gateway_record = raw_state.get("gateway_record")
+        self.lean_cache = raw_state.get("lean_cache", False)
+        self.activity_backfill = raw_state.get("activity_backfill", 30)
         self.extensions = raw_state.get("extensions", [])
         self.extension_state = raw_state.get("extension_state", {})
 
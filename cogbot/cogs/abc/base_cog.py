@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from abc import ABC, abstractmethod
 from typing import Dict, Generic, Type, TypeVar, Union
@@ -69,6 +70,7 @@ class BaseCog(ABC, Generic[S]):
 
     async def init_states(self):
         raw_servers = self.options.get("servers", {})
+        setups = []
         for server_key, options in raw_servers.items():
             server_key: str
             options: RawOptions
@@ -76,7 +78,9 @@ class BaseCog(ABC, Generic[S]):
             if not server:
                 self.log.error(f"Skipping unknown server: {server_key}")
                 continue
-            await self.setup_state(server, options)
+            setups.append(self.setup_state(server, options))
+        # load external options for every server at the same time
+        await asyncio.gather(*setups)
 
     async def clear_states(self):
         for state in self.server_state_by_id.values():
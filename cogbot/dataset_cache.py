@@ -0,0 +1,108 @@
+import hashlib
+import json
+import logging
+import os
+import typing
+from datetime import datetime
+
+from cogbot.web_client import WebClient, WebError
+
+log = logging.getLogger(__name__)
+
+
+class DatasetSnapshot:
+    def __init__(
+        self,
+        address: str,
+        content: bytes,
+        etag: str = None,
+        last_modified: str = None,
+        fetched_at: str = None,
+    ):
+        self.address: str = address
+        self.content: bytes = content
+        self.etag: str = etag
+        self.last_modified: str = last_modified
+        self.fetched_at: str = fetched_at or datetime.utcnow().isoformat()
+
+    def to_meta(self) -> dict:
+        return {
+            "address": self.address,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "fetched_at": self.fetched_at,
+        }
+
+
+async def fetch_snapshot(
+    web: WebClient,
+    address: str,
+    snapshot: DatasetSnapshot = None,
+    timeout: float = None,
+) -> DatasetSnapshot:
+    """ Fetch `address`, returning `snapshot` itself if the remote says it's unchanged. """
+    headers = {}
+    if snapshot:
+        if snapshot.etag:
+            headers["If-None-Match"] = snapshot.etag
+        if snapshot.last_modified:
+            headers["If-Modified-Since"] = snapshot.last_modified
+    response = await web.get(address, headers=headers, timeout=timeout)
+    if response.status == 304 and snapshot:
+        return snapshot
+    if response.status >= 300:
+        raise WebError(address, response.status)
+    return DatasetSnapshot(
+        address,
+        response.content,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+    )
+
+
+class DatasetCache:
+    """
+    Keeps the last good copy of each remote dataset on disk, along with the
+    validators needed to ask the remote whether it has changed since.
+    """
+
+    def __init__(self, directory: str):
+        self.directory: str = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get_paths(self, address: str) -> typing.Tuple[str, str]:
+        name = hashlib.sha1(address.encode("utf8")).hexdigest()
+        base = os.path.join(self.directory, name)
+        return base + ".data", base + ".meta.json"
+
+    def get(self, address: str) -> typing.Optional[DatasetSnapshot]:
+        data_path, meta_path = self.get_paths(address)
+        try:
+            with open(meta_path, encoding="utf-8") as fp:
+                meta = json.load(fp)
+            with open(data_path, "rb") as fp:
+                content = fp.read()
+        except FileNotFoundError:
+            return None
+        except:
+            log.exception(f"Ignoring unreadable cached snapshot of: {address}")
+            return None
+        return DatasetSnapshot(
+            address,
+            content,
+            etag=meta.get("etag"),
+            last_modified=meta.get("last_modified"),
+            fetched_at=meta.get("fetched_at"),
+        )
+
+    def put(self, snapshot: DatasetSnapshot):
+        data_path, meta_path = self.get_paths(snapshot.address)
+        # Write to temporary files first, so a crash never leaves half a snapshot.
+        for path, mode, payload in (
+            (data_path, "wb", snapshot.content),
+            (meta_path, "w", json.dumps(snapshot.to_meta(), indent=2)),
+        ):
+            temp_path = path + ".tmp"
+            with open(temp_path, mode) as fp:
+                fp.write(payload)
+            os.replace(temp_path, path)
@@ -0,0 +1,151 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import typing
+import urllib.request
+
+from cogbot.dataset_cache import DatasetCache, fetch_snapshot
+from cogbot.web_client import WebClient
+
+log = logging.getLogger(__name__)
+
+DATASET_TIMEOUT = 30.0
+DATASET_WORKERS = 4
+
+T = typing.TypeVar("T")
+
+
+def is_remote(address: str) -> bool:
+    return address.startswith(("http://", "https://"))
+
+
+def read_address(address: str, timeout: float = DATASET_TIMEOUT) -> bytes:
+    # Blocking; only for use off the event loop, or before it starts.
+    if is_remote(address):
+        with urllib.request.urlopen(address, timeout=timeout) as response:
+            return response.read()
+    with open(address, "rb") as fp:
+        return fp.read()
+
+
+def parse_json(content: bytes) -> typing.Any:
+    return json.loads(content.decode("utf8"))
+
+
+class DatasetLoader:
+    """
+    Fetches datasets through the shared web client and parses them on a small
+    thread pool, so that a slow host never blocks the event loop. An optional
+    `build` function also runs off the loop, turning the raw data into whatever
+    indices the caller needs; the caller then swaps the finished result in with
+    plain assignments.
+
+    With a cache directory, remote datasets are snapshotted to disk and
+    revalidated with conditional requests; if the remote is unreachable, the
+    last good snapshot is used instead.
+    """
+
+    def __init__(
+        self,
+        web: WebClient,
+        loop: asyncio.AbstractEventLoop = None,
+        workers: int = DATASET_WORKERS,
+        timeout: float = DATASET_TIMEOUT,
+        cache_dir: str = None,
+    ):
+        self.web: WebClient = web
+        self.loop: asyncio.AbstractEventLoop = loop or asyncio.get_event_loop()
+        self.timeout: float = timeout
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="dataset"
+        )
+        self.cache: DatasetCache = DatasetCache(cache_dir) if cache_dir else None
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    def is_cached(self, address: str) -> bool:
+        return bool(self.cache and is_remote(address))
+
+    def build_sync(
+        self, content: bytes, build: typing.Callable[[typing.Any], T] = None
+    ) -> T:
+        data = parse_json(content)
+        return build(data) if build else data
+
+    async def run(self, timeout: float, func: typing.Callable, *args) -> typing.Any:
+        future = self.loop.run_in_executor(self.executor, func, *args)
+        # A stuck worker is abandoned rather than awaited forever.
+        return await asyncio.wait_for(future, timeout=timeout)
+
+    async def fetch(self, address: str, timeout: float) -> typing.Tuple[bytes, bool]:
+        # Returns the content, and whether it differs from the cached snapshot.
+        if not is_remote(address):
+            return await self.run(timeout, read_address, address, timeout), True
+        if not self.cache:
+            return await self.web.get_bytes(address, timeout=timeout), True
+        snapshot = await self.run(timeout, self.cache.get, address)
+        try:
+            fetched = await fetch_snapshot(self.web, address, snapshot, timeout=timeout)
+        except Exception as e:
+            if not snapshot:
+                raise
+            log.warning(
+                f"Failed to fetch {address}; using snapshot from {snapshot.fetched_at}: {e!r}"
+            )
+            return snapshot.content, False
+        if fetched is snapshot:
+            return snapshot.content, False
+        await self.run(timeout, self.cache.put, fetched)
+        return fetched.content, True
+
+    async def load(
+        self,
+        address: str,
+        build: typing.Callable[[typing.Any], T] = None,
+        timeout: float = None,
+        on_update: typing.Callable[[T], typing.Any] = None,
+    ) -> T:
+        """
+        Load and build the dataset at `address`. If `on_update` is given and a
+        snapshot is cached, the snapshot is returned straight away and the remote
+        is revalidated in the background; `on_update` then receives the rebuilt
+        result, only if the dataset actually changed.
+        """
+        timeout = timeout or self.timeout
+        log.debug(f"Loading dataset from: {address}")
+        if on_update and self.is_cached(address):
+            snapshot = await self.run(timeout, self.cache.get, address)
+            if snapshot:
+                try:
+                    result = await self.run(
+                        timeout, self.build_sync, snapshot.content, build
+                    )
+                except:
+                    log.exception(f"Ignoring unusable cached snapshot of: {address}")
+                else:
+                    self.loop.create_task(
+                        self.revalidate(address, build, timeout, on_update)
+                    )
+                    return result
+        content, _ = await self.fetch(address, timeout)
+        return await self.run(timeout, self.build_sync, content, build)
+
+    async def revalidate(
+        self,
+        address: str,
+        build: typing.Callable[[typing.Any], T],
+        timeout: float,
+        on_update: typing.Callable[[T], typing.Any],
+    ):
+        try:
+            content, changed = await self.fetch(address, timeout)
+            if changed:
+                log.info(f"Dataset changed since it was cached: {address}")
+                result = await self.run(timeout, self.build_sync, content, build)
+                updated = on_update(result)
+                if asyncio.iscoroutine(updated):
+                    await updated
+        except:
+            log.exception(f"Failed to revalidate dataset: {address}")
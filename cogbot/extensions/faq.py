@@ -1,7 +1,5 @@
-import json
 import logging
 import typing
-import urllib.request
 
 from discord.ext import commands
 from discord.ext.commands import CommandError, Context
@@ -83,20 +81,7 @@ class Faq:
             else:
                 return []
 
-    def reload_data(self):
-        log.info('Reloading FAQs from: {}'.format(self.config.database))
-
-        if self.config.database.startswith(('http://', 'https://')):
-            try:
-                response = urllib.request.urlopen(self.config.database)
-                content = response.read().decode('utf8')
-                data = json.loads(content)
-            except Exception as e:
-                raise CommandError('Failed to reload FAQs: {}'.format(e))
-        else:
-            with open(self.config.database) as fp:
-                data = json.load(fp)
-
+    def build_entries(self, data: dict) -> typing.Tuple[dict, dict, str]:
         # parse data and precompile messages
         # also create map of tags to entries
         entries_by_key: typing.Dict[FAQEntry] = {}
@@ -125,15 +110,33 @@ class Faq:
             else:
                 log.error('Invalid FAQ entry "{}": {}'.format(key, raw_entry))
 
-        self.entries_by_key = entries_by_key
-        self.entries_by_tag = entries_by_tag
+        visible_keys = (key for key, entry in entries_by_key.items() if not entry.hidden)
+        available_faqs_text = 'Available FAQs: ' + self.format_keys(sorted(visible_keys))
+
+        return entries_by_key, entries_by_tag, available_faqs_text
 
-        self.available_faqs_text = 'Available FAQs: ' + self.format_keys(sorted(self.get_visible_keys()))
+    def apply_entries(self, entries: typing.Tuple[dict, dict, str]):
+        # swap everything in at once
+        self.entries_by_key, self.entries_by_tag, self.available_faqs_text = entries
+
+        log.info('Successfully reloaded {} FAQs'.format(len(self.entries_by_key)))
+
+    async def reload_data(self, cached: bool = False):
+        log.info('Reloading FAQs from: {}'.format(self.config.database))
+
+        # fetch, parse and index off the event loop
+        # if cached, start with the last snapshot and pick up changes later
+        try:
+            entries = await self.bot.datasets.load(
+                self.config.database, build=self.build_entries,
+                on_update=self.apply_entries if cached else None)
+        except Exception as e:
+            raise CommandError('Failed to reload FAQs: {}'.format(e))
 
-        log.info('Successfully reloaded {} FAQs'.format(len(data)))
+        self.apply_entries(entries)
 
     async def on_ready(self):
-        self.reload_data()
+        await self.reload_data(cached=True)
 
     @commands.command(pass_context=True, name='faq')
     async def cmd_faq(self, ctx: Context, *, key: str = ''):
@@ -166,7 +169,7 @@ class Faq:
     @commands.command(pass_context=True, name='faqreload', hidden=True)
     async def cmd_faqreload(self, ctx: Context):
         try:
-            self.reload_data()
+            await self.reload_data()
             await self.bot.react_success(ctx)
         except:
             await self.bot.react_failure(ctx)
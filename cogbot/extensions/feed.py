@@ -88,6 +88,18 @@ class Feed:
 
         self.polling_task: Optional[asyncio.Task] = None
 
+        bot.caches.register('feed entries', self._count_seen_entries)
+
+    def __unload(self):
+        self.bot.caches.unregister('feed entries')
+
+    def _count_seen_entries(self) -> int:
+        return sum(
+            len(sub.last_titles) + len(sub.last_ids)
+            for subs in self._subscriptions.values()
+            for sub in subs.values()
+        )
+
     async def on_ready(self):
         log.info('Ready event received; proceeding to initial reset...')
         self._reset()
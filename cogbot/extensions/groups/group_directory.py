@@ -7,7 +7,9 @@ log = logging.getLogger(__name__)
 
 
 class GroupDirectory(object):
-    def __init__(self):
+    def __init__(self, bot):
+        self._bot = bot
+
         # accessing role_map[server_id][role_name] gives role_id
         # don't store role object directly (not persistent)
         self._role_map = {}
@@ -16,12 +18,11 @@ class GroupDirectory(object):
     def _sanitize_group(group: str):
         return group.lower()
 
-    @staticmethod
-    def _get_server_role_by_id(server, role_id):
-        for role in server.roles:
-            if role.id == role_id:
-                return role
-        raise NoSuchRoleIdError(role_id=role_id)
+    def _get_server_role_by_id(self, server, role_id):
+        role = self._bot.get_role(server, role_id)
+        if role is None:
+            raise NoSuchRoleIdError(role_id=role_id)
+        return role
 
     @staticmethod
     def _get_server_role_by_sanitized_group(server, sanitized_group):
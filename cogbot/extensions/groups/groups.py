@@ -33,7 +33,7 @@ class Groups:
         self.cmd_groups._buckets._cooldown.rate = self.config.cooldown_rate
         self.cmd_groups._buckets._cooldown.per = self.config.cooldown_per
 
-        self._group_directory = GroupDirectory()
+        self._group_directory = GroupDirectory(bot)
 
     async def on_ready(self):
         # Load initial groups after the bot has made associations with servers.
@@ -0,0 +1,117 @@
+import collections
+import typing
+from datetime import datetime
+
+import discord
+
+from cogbot.types import UserId
+
+MessageId = str
+
+
+class ChannelHistoryEntry:
+    def __init__(
+        self,
+        message_id: MessageId,
+        author_id: UserId,
+        timestamp: datetime,
+        is_prompt: bool = False,
+    ):
+        self.message_id: MessageId = message_id
+        self.author_id: UserId = author_id
+        self.timestamp: datetime = timestamp
+        self.is_prompt: bool = is_prompt
+
+
+class ChannelHistory:
+    """ A fixed-size ring of the most recent message metadata in a channel. """
+
+    def __init__(self, size: int):
+        self.size: int = size
+        # Newest entries are on the right.
+        self.entries: typing.Deque[ChannelHistoryEntry] = collections.deque(
+            maxlen=size
+        )
+        # Whether the history has been seeded from the channel at least once.
+        self.seeded: bool = False
+        # Whether the history holds every message in the channel; which is the
+        # case when seeding returned fewer messages than we asked for.
+        self.exhaustive: bool = False
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def seed(self, entries: typing.Iterable[ChannelHistoryEntry]):
+        # Expects entries ordered from oldest to newest. Anything appended that's
+        # newer than all of them came in while they were being fetched, so keep
+        # it on the end instead of losing it.
+        seeded = list(entries)
+        newest = int(seeded[-1].message_id) if seeded else None
+        arrived = [
+            entry
+            for entry in self.entries
+            if newest is None or int(entry.message_id) > newest
+        ]
+        self.entries.clear()
+        self.entries.extend(seeded)
+        self.entries.extend(arrived)
+        self.seeded = True
+        self.exhaustive = (
+            len(seeded) < self.size and len(seeded) + len(arrived) <= self.size
+        )
+
+    def append(self, entry: ChannelHistoryEntry):
+        # Once the ring starts evicting, it no longer holds the whole channel.
+        if len(self.entries) == self.size:
+            self.exhaustive = False
+        self.entries.append(entry)
+
+    def remove(self, message_id: MessageId) -> bool:
+        for entry in self.entries:
+            if entry.message_id == message_id:
+                self.entries.remove(entry)
+                return True
+        return False
+
+    def update(self, message_id: MessageId, is_prompt: bool) -> bool:
+        for entry in self.entries:
+            if entry.message_id == message_id:
+                entry.is_prompt = is_prompt
+                return True
+        return False
+
+    def resized(self, size: int) -> "ChannelHistory":
+        # Carry the known entries over into a history of a different size.
+        history = ChannelHistory(size)
+        history.entries.extend(self.entries)
+        history.seeded = self.seeded
+        history.exhaustive = self.exhaustive and len(self.entries) < size
+        return history
+
+    def covers(self, limit: int) -> bool:
+        """ Whether the latest `limit` messages are all known to the history. """
+        return self.seeded and (self.exhaustive or len(self.entries) >= limit)
+
+    def latest(self) -> typing.Optional[ChannelHistoryEntry]:
+        if self.entries:
+            return self.entries[-1]
+
+    def iter_latest(self, limit: int) -> typing.Iterable[ChannelHistoryEntry]:
+        for i, entry in enumerate(reversed(self.entries)):
+            if i >= limit:
+                break
+            yield entry
+
+    def is_latest(self, message_id: MessageId, limit: int = 1) -> bool:
+        return any(e.message_id == message_id for e in self.iter_latest(limit))
+
+    @staticmethod
+    def entry_from_message(
+        message: discord.Message, is_prompt: bool = False
+    ) -> ChannelHistoryEntry:
+        return ChannelHistoryEntry(
+            message_id=message.id,
+            author_id=message.author.id,
+            timestamp=message.timestamp,
+            is_prompt=is_prompt,
+        )
@@ -1,8 +1,17 @@
+import string
 import typing
 
 import discord
 
 
+def refers_to_channel(format_string: str) -> bool:
+    """ Whether the format string uses the `channel` field in any way. """
+    return any(
+        field_name and field_name.split(".")[0].split("[")[0] == "channel"
+        for _, field_name, _, _ in string.Formatter().parse(format_string)
+    )
+
+
 class ChannelState:
     def __init__(
         self,
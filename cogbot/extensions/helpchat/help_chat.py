@@ -10,7 +10,14 @@ from discord.ext.commands import Context
 from cogbot import checks
 from cogbot.cog_bot import CogBot, ServerId
 from cogbot.extensions.helpchat.channel_state import ChannelState
+from cogbot.extensions.helpchat.help_chat_scheduler import (
+    SCHEDULER_CONCURRENCY,
+    SCHEDULER_JITTER,
+    HelpChatScheduler,
+)
 from cogbot.extensions.helpchat.help_chat_server_state import HelpChatServerState
+from cogbot.extensions.helpchat.help_chat_stats import STATS_WINDOW, parse_window
+from cogbot.lib.percentile import percentile
 
 log = logging.getLogger(__name__)
 
@@ -24,6 +31,16 @@ class HelpChat:
         self.ext = ext
         self.readied = False
         self.embed_color = self.bot.color_from_hex("#272A2D")
+        # one scheduler runs the polling work of every server
+        self.scheduler = HelpChatScheduler(
+            self.bot,
+            concurrency=self.options.get("scheduler_concurrency", SCHEDULER_CONCURRENCY),
+            jitter=self.options.get("scheduler_jitter", SCHEDULER_JITTER),
+        )
+
+    def __unload(self):
+        # otherwise the old scheduler keeps polling after a reload
+        self.scheduler.stop()
 
     def get_state(self, server: discord.Server) -> HelpChatServerState:
         return self.server_state.get(server.id)
@@ -36,14 +53,26 @@ class HelpChat:
             del self.server_state[server.id]
 
     async def create_state(
-        self, server: discord.Server, server_options: dict
+        self,
+        server: discord.Server,
+        server_options: dict,
+        old_state: HelpChatServerState = None,
     ) -> HelpChatServerState:
         state = HelpChatServerState(self.ext, self.bot, server, **server_options)
+        state.options = server_options
         self.set_state(server, state)
-        await state.on_ready()
+        # take over from the old state, if any, instead of starting from scratch
+        if old_state:
+            await state.adopt(old_state)
+        else:
+            await state.on_ready()
+        if state.auto_poll:
+            self.scheduler.add_state(state)
         return state
 
-    async def setup_state(self, server: discord.Server) -> HelpChatServerState:
+    async def setup_state(
+        self, server: discord.Server, old_state: HelpChatServerState = None
+    ) -> HelpChatServerState:
         server_options = self.server_options[server.id]
         # if options is just a string, use remote/external location
         if isinstance(server_options, str):
@@ -59,20 +88,25 @@ class HelpChat:
                     f"Failed to load state data for server {server}. Skipping..."
                 )
                 return
-            state = await self.create_state(server, actual_server_options)
+            state = await self.create_state(
+                server, actual_server_options, old_state=old_state
+            )
         # otherwise, use embedded/local config
         else:
-            state = await self.create_state(server, server_options)
+            state = await self.create_state(server, server_options, old_state=old_state)
         return state
 
-    async def reload_state(self, server: discord.Server, ctx: Context = None):
-        # remember and remove the old state object
+    async def reload_state(
+        self, server: discord.Server, ctx: Context = None, full: bool = False
+    ):
+        # remember the old state object; it stays registered, and keeps up with
+        # messages, until the new one takes over from it
         old_state = self.get_state(server)
         # if there was no old state (somehow) then just shirt-circuit
         if not old_state:
             await self.bot.add_reaction(ctx.message, "😱")
             return
-        self.remove_state(server)
+        self.scheduler.remove_state(old_state)
         # let people know things are happening
         if ctx:
             old_state.log.info(f"{ctx.message.author} initiated a reload.")
@@ -95,17 +129,27 @@ class HelpChat:
         old_state.log.info(f"Creating new state object...")
         new_state = None
         try:
-            new_state = await self.setup_state(server)
+            # a full reload starts over, otherwise only apply what changed
+            new_state = await self.setup_state(
+                server, old_state=None if full else old_state
+            )
             new_state.log.info(f"Successfully created new state object: {new_state}")
             if ctx:
                 await self.bot.add_reaction(ctx.message, "👍")
         except:
             old_state.log.exception(f"Failed to create new state object.")
             await old_state.log_to_channel(
-                emoji="🔥", description="Reload FAILED! Uh oh!", color=self.embed_color
+                emoji="🔥",
+                description="Reload FAILED! Uh oh!",
+                color=self.embed_color,
+                urgent=True,
             )
             if ctx:
                 await self.bot.add_reaction(ctx.message, "🔥")
+            # fall back on the old state object, so the server isn't left without
+            self.set_state(server, old_state)
+            if old_state.auto_poll:
+                self.scheduler.add_state(old_state)
             return
         # destroy the old state object
         new_state.log.info(f"Destroying old state object: {old_state}")
@@ -154,6 +198,8 @@ class HelpChat:
         else:
             self.readied = True
             log.info(f"Identifying servers and their channels for the first time...")
+        # make sure the scheduler is running (again, after a reconnect)
+        self.scheduler.start()
         # construct server state objects for easier context management
         for server_key, server_options in self.options.get("servers", {}).items():
             server = self.bot.get_server_from_key(server_key)
@@ -161,9 +207,10 @@ class HelpChat:
                 log.error(f"Skipping unknown server {server_key}.")
                 continue
             self.server_options[server.id] = server_options
-            # if previous state exists, reload it
+            # if previous state exists, reload it from scratch, since cached
+            # objects may have been invalidated
             if self.get_state(server):
-                await self.reload_state(server)
+                await self.reload_state(server, full=True)
             # otherwise, just setup a new state
             else:
                 await self.setup_state(server)
@@ -198,17 +245,30 @@ class HelpChat:
         # make sure this isn't a DM
         if message.server:
             state = self.get_state(message.server)
-            # ignore bot's messages
-            if state and message.author != self.bot.user:
-                await state.on_message(message)
+            if state:
+                # keep track of every message, including the bot's own prompts
+                state.record_message(message)
+                # ignore bot's messages
+                if message.author != self.bot.user:
+                    await state.on_message(message)
 
     async def on_message_delete(self, message: discord.Message):
         # make sure this isn't a DM
         if message.server:
             state = self.get_state(message.server)
-            # ignore bot's messages
-            if state and message.author != self.bot.user:
-                await state.on_message_delete(message)
+            if state:
+                # forget about every message, including the bot's own prompts
+                state.forget_message(message)
+                # ignore bot's messages
+                if message.author != self.bot.user:
+                    await state.on_message_delete(message)
+
+    async def on_message_edit(self, before: discord.Message, after: discord.Message):
+        # make sure this isn't a DM
+        if after.server:
+            state = self.get_state(after.server)
+            if state:
+                state.refresh_message(after)
 
     @checks.is_staff()
     @commands.group(pass_context=True, name="helpchat", aliases=["hc"], hidden=True)
@@ -261,10 +321,10 @@ class HelpChat:
 
     @checks.is_staff()
     @cmd_helpchat.command(pass_context=True, name="reload")
-    async def cmd_helpchat_reload(self, ctx: Context):
+    async def cmd_helpchat_reload(self, ctx: Context, mode: str = None):
         channel: discord.Channel = ctx.message.channel
         server: discord.Server = channel.server
-        await self.reload_state(server, ctx)
+        await self.reload_state(server, ctx, full=(mode == "full"))
 
     @checks.is_staff()
     @cmd_helpchat.group(pass_context=True, name="channels")
@@ -338,27 +398,33 @@ class HelpChat:
     async def cmd_helpchat_poll_status(self, ctx: Context):
         channel: discord.Channel = ctx.message.channel
         state = self.get_state(channel.server)
-        if state.auto_poll:
-            task = state.polling_task
-            if task:
-                pad = 12
-                lines = [
-                    "_coro:".ljust(pad) + str(getattr(task, "_coro", None)),
-                    "_state:".ljust(pad) + str(getattr(task, "_state", None)),
-                    "done:".ljust(pad) + str(task.done()),
-                    "cancelled:".ljust(pad) + str(task.cancelled()),
-                ]
-                if task.done():
-                    lines.append("exception:".ljust(pad) + str(task.exception()))
-                if task.done() and not task.exception():
-                    lines.append("result:".ljust(pad) + str(task.result()))
-                message = "\n".join(("```", *lines, "```"))
-                await self.bot.send_message(channel, message)
-            else:
-                message = "Polling task is dead! You might want to restart it."
-                await self.bot.send_message(channel, message)
+        scheduler = self.scheduler
+        task = scheduler.task
+        if task:
+            next_due = scheduler.get_next_due(state)
+            pad = 16
+            lines = [
+                "running:".ljust(pad) + str(scheduler.is_running),
+                "polling:".ljust(pad) + str(scheduler.has_state(state)),
+                "servers:".ljust(pad) + str(len(scheduler.states)),
+                "queue depth:".ljust(pad) + str(scheduler.get_queue_depth()),
+                "server depth:".ljust(pad) + str(scheduler.get_queue_depth(state)),
+                "next due:".ljust(pad)
+                + (f"{next_due:.1f}s" if next_due is not None else "-"),
+                "in flight:".ljust(pad)
+                + f"{scheduler.in_flight}/{scheduler.concurrency}",
+                "lag (last):".ljust(pad) + f"{scheduler.last_lag:.2f}s",
+                "lag (mean):".ljust(pad) + f"{scheduler.mean_lag:.2f}s",
+                "lag (max):".ljust(pad) + f"{scheduler.max_lag:.2f}s",
+                "runs:".ljust(pad) + str(scheduler.num_runs),
+                "errors:".ljust(pad) + str(scheduler.num_errors),
+            ]
+            if task.done() and not task.cancelled() and task.exception():
+                lines.append("exception:".ljust(pad) + str(task.exception()))
+            message = "\n".join(("```", *lines, "```"))
+            await self.bot.send_message(channel, message)
         else:
-            message = "Auto-polling is disabled on this server."
+            message = "Scheduler is dead! You might want to restart it."
             await self.bot.send_message(channel, message)
 
     @checks.is_staff()
@@ -366,7 +432,8 @@ class HelpChat:
     async def cmd_helpchat_poll_start(self, ctx: Context):
         channel: discord.Channel = ctx.message.channel
         state = self.get_state(channel.server)
-        if state.start_polling_task():
+        self.scheduler.start()
+        if self.scheduler.add_state(state):
             await self.bot.react_success(ctx)
         else:
             await self.bot.react_neutral(ctx)
@@ -376,7 +443,7 @@ class HelpChat:
     async def cmd_helpchat_poll_stop(self, ctx: Context):
         channel: discord.Channel = ctx.message.channel
         state = self.get_state(channel.server)
-        if state.stop_polling_task():
+        if self.scheduler.remove_state(state):
             await self.bot.react_success(ctx)
         else:
             await self.bot.react_neutral(ctx)
@@ -389,6 +456,40 @@ class HelpChat:
         await state.poll()
         await self.bot.react_success(ctx)
 
+    @checks.is_staff()
+    @cmd_helpchat.command(pass_context=True, name="stats")
+    async def cmd_helpchat_stats(self, ctx: Context, window: str = STATS_WINDOW):
+        channel: discord.Channel = ctx.message.channel
+        state = self.get_state(channel.server)
+        try:
+            window_delta = parse_window(window)
+        except ValueError:
+            await self.bot.react_question(ctx)
+            return
+        summary = state.stats.summarize(window_delta, state.now())
+
+        def fmt_seconds(values: typing.List[float]) -> str:
+            p50 = percentile(values, 0.5)
+            p90 = percentile(values, 0.9)
+            if p50 is None:
+                return "-"
+            return f"p50 {p50:.0f}s, p90 {p90:.0f}s (n={len(values)})"
+
+        pad = 20
+        lines = [
+            "window:".ljust(pad) + f"{window} ({summary.minutes} min recorded)",
+            "questions:".ljust(pad) + str(summary.questions),
+            "throughput:".ljust(pad) + f"{summary.questions_per_hour:.1f}/h",
+            "resolutions:".ljust(pad) + str(summary.resolutions),
+            "throttles:".ljust(pad) + str(summary.throttles),
+            "first response:".ljust(pad) + fmt_seconds(summary.first_response_times),
+            "resolve:".ljust(pad) + fmt_seconds(summary.resolve_times),
+        ]
+        for state_name, durations in sorted(summary.state_durations.items()):
+            lines.append(f"{state_name}:".ljust(pad) + fmt_seconds(durations))
+        message = "\n".join(("```", *lines, "```"))
+        await self.bot.send_message(channel, message)
+
     @checks.is_staff()
     @cmd_helpchat.group(pass_context=True, name="set")
     async def cmd_helpchat_set(self, ctx: Context):
@@ -0,0 +1,239 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import typing
+
+import discord
+
+from cogbot.cog_bot import CogBot
+from cogbot.extensions.helpchat.help_chat_server_state import HelpChatServerState
+
+log = logging.getLogger(__name__)
+
+SCHEDULER_CONCURRENCY = 4
+SCHEDULER_JITTER = 5.0
+
+# Lower numbers run first when several items are due at once.
+PRIORITY_HOISTING = 0
+PRIORITY_IDLE = 1
+PRIORITY_POSITIONS = 2
+
+WORK_HOISTING = "hoisting"
+WORK_IDLE = "idle"
+WORK_IDLE_CHANNEL = "idle-channel"
+WORK_POSITIONS = "positions"
+
+
+class HelpChatWorkItem:
+    def __init__(
+        self,
+        kind: str,
+        priority: int,
+        state: HelpChatServerState,
+        generation: int,
+        channel: discord.Channel = None,
+        repeat: bool = True,
+    ):
+        self.kind: str = kind
+        self.priority: int = priority
+        self.state: HelpChatServerState = state
+        # Which registration of the state the item belongs to.
+        self.generation: int = generation
+        self.channel: discord.Channel = channel
+        # One-off items are dropped after they run.
+        self.repeat: bool = repeat
+        # When the item was last due, in loop time.
+        self.due: float = 0.0
+
+
+class HelpChatScheduler:
+    """
+    A single task that runs the periodic help-chat work of every server, from
+    one priority queue, with a global cap on how much runs at once.
+    """
+
+    def __init__(
+        self,
+        bot: CogBot,
+        concurrency: int = SCHEDULER_CONCURRENCY,
+        jitter: float = SCHEDULER_JITTER,
+    ):
+        self.bot: CogBot = bot
+        self.concurrency: int = concurrency
+        self.jitter: float = jitter
+        self.queue: typing.List[typing.Tuple[float, int, int, HelpChatWorkItem]] = []
+        # The generation each state was registered with, so that items left over
+        # from an earlier registration can be told apart and dropped.
+        self.states: typing.Dict[HelpChatServerState, int] = {}
+        self.task: asyncio.Task = None
+        self.item_tasks: typing.Set[asyncio.Task] = set()
+        self.semaphore: asyncio.Semaphore = None
+        self.in_flight: int = 0
+        self.wakeup: asyncio.Event = None
+        self._seq = itertools.count()
+        self._generations = itertools.count()
+        # Lag is how late an item started compared to when it was due.
+        self.last_lag: float = 0.0
+        self.max_lag: float = 0.0
+        self.total_lag: float = 0.0
+        self.num_runs: int = 0
+        self.num_errors: int = 0
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return asyncio.get_event_loop()
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self.task and not self.task.done())
+
+    @property
+    def mean_lag(self) -> float:
+        return self.total_lag / self.num_runs if self.num_runs else 0.0
+
+    def start(self) -> bool:
+        if not self.is_running:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+            self.wakeup = asyncio.Event()
+            self.task = self.loop.create_task(self.run())
+            log.info(f"Started help-chat scheduler: {self.task}")
+            return True
+
+    def stop(self) -> bool:
+        if self.is_running:
+            self.task.cancel()
+            for task in list(self.item_tasks):
+                task.cancel()
+            return True
+
+    def push(self, item: HelpChatWorkItem, delay: float):
+        item.due = self.loop.time() + delay + random.uniform(0, self.jitter)
+        heapq.heappush(self.queue, (item.due, item.priority, next(self._seq), item))
+        if self.wakeup:
+            self.wakeup.set()
+
+    def add_state(self, state: HelpChatServerState) -> bool:
+        if state in self.states:
+            return False
+        generation = next(self._generations)
+        self.states[state] = generation
+        interval = state.seconds_to_poll
+        state.log.info(f"Channels will be polled every {interval} seconds.")
+        for kind, priority in (
+            (WORK_HOISTING, PRIORITY_HOISTING),
+            (WORK_IDLE, PRIORITY_IDLE),
+            (WORK_POSITIONS, PRIORITY_POSITIONS),
+        ):
+            self.push(HelpChatWorkItem(kind, priority, state, generation), interval)
+        return True
+
+    def remove_state(self, state: HelpChatServerState) -> bool:
+        if state not in self.states:
+            return False
+        del self.states[state]
+        # Items already running are dropped when they try to go around again.
+        self.queue = [entry for entry in self.queue if entry[3].state is not state]
+        heapq.heapify(self.queue)
+        return True
+
+    def is_current(self, item: HelpChatWorkItem) -> bool:
+        return self.states.get(item.state) == item.generation
+
+    def has_state(self, state: HelpChatServerState) -> bool:
+        return state in self.states
+
+    def get_queue_depth(self, state: HelpChatServerState = None) -> int:
+        return len(
+            [
+                item
+                for _, _, _, item in self.queue
+                if self.is_current(item) and (state is None or item.state is state)
+            ]
+        )
+
+    def get_next_due(self, state: HelpChatServerState) -> float:
+        dues = [item.due for _, _, _, item in self.queue if item.state is state]
+        if dues:
+            return max(0.0, min(dues) - self.loop.time())
+
+    async def run(self):
+        while not self.bot.is_closed:
+            try:
+                await self.run_due_items()
+            except asyncio.CancelledError:
+                log.warning("Help-chat scheduler was cancelled; breaking from loop...")
+                break
+            except:
+                log.exception("Help-chat scheduler encountered an error; ignoring...")
+
+    async def run_due_items(self):
+        # Sleep until the next item is due, or something new gets queued.
+        self.wakeup.clear()
+        if not self.queue:
+            await self.wakeup.wait()
+            return
+        delay = self.queue[0][0] - self.loop.time()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            return
+        entry = heapq.heappop(self.queue)
+        item = entry[3]
+        if not self.is_current(item):
+            return
+        # Wait for a free slot before starting the item.
+        try:
+            await self.semaphore.acquire()
+        except asyncio.CancelledError:
+            # Put it back, so that it isn't lost if the scheduler starts again.
+            heapq.heappush(self.queue, entry)
+            raise
+        lag = max(0.0, self.loop.time() - item.due)
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.total_lag += lag
+        self.num_runs += 1
+        self.in_flight += 1
+        task = self.loop.create_task(self.run_item(item))
+        self.item_tasks.add(task)
+        task.add_done_callback(self.item_tasks.discard)
+
+    async def run_item(self, item: HelpChatWorkItem):
+        state = item.state
+        try:
+            if item.kind == WORK_HOISTING:
+                await state.poll_hoisting()
+            elif item.kind == WORK_IDLE:
+                # Fan out into one check per channel, spread over the interval
+                # so that they don't all hit the API at the same moment.
+                spread = state.seconds_to_poll / 2
+                for channel in state.channels:
+                    self.push(
+                        HelpChatWorkItem(
+                            WORK_IDLE_CHANNEL,
+                            PRIORITY_IDLE,
+                            state,
+                            item.generation,
+                            channel=channel,
+                            repeat=False,
+                        ),
+                        random.uniform(0, spread),
+                    )
+            elif item.kind == WORK_IDLE_CHANNEL:
+                await state.sync_idle_channel(item.channel)
+            elif item.kind == WORK_POSITIONS:
+                await state.sync_channel_positions()
+        except asyncio.CancelledError:
+            raise
+        except:
+            self.num_errors += 1
+            state.log.exception(f"Scheduled {item.kind} work encountered an error:")
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()
+            if item.repeat and self.is_current(item):
+                self.push(item, state.seconds_to_poll)
@@ -3,13 +3,17 @@ import collections
 import logging
 import random
 import re
+import time
 import typing
 from datetime import datetime, timedelta
 
 import discord
 
 from cogbot.cog_bot import ChannelId, CogBot
-from cogbot.extensions.helpchat.channel_state import ChannelState
+from cogbot.extensions.helpchat.channel_history import ChannelHistory
+from cogbot.extensions.helpchat.channel_state import ChannelState, refers_to_channel
+from cogbot.extensions.helpchat.help_chat_stats import STATS_RETENTION, HelpChatStats
+from cogbot.extensions.helpchat.hoisting_rate import HoistingRateTracker
 
 PROMPT_COLOR = "#00ACED"
 
@@ -20,6 +24,29 @@ SECONDS_TO_THROTTLE = 600
 SECONDS_UNTIL_IDLE = 1800
 SECONDS_TO_POLL = 60
 PREEMPTIVE_CACHE_SIZE = 10
+PREEMPTIVE_CACHE_CONCURRENCY = 4
+
+# Adaptive hoisting averages arrivals over about half an hour, and sizes the pool
+# for the questions expected over the next 15 minutes.
+HOISTING_RATE_WINDOW = 1800
+HOISTING_RATE_ALPHA = 0.1
+HOISTING_HORIZON = 900
+
+# Dynamic channels are retired after an hour of the pool being under-used.
+SECONDS_UNTIL_RETIRE = 3600
+DYNAMIC_CHANNEL_KEY = "extra-{number}"
+
+# Discord refuses embed descriptions longer than this.
+EMBED_DESCRIPTION_LIMIT = 2048
+
+LOG_DIGEST_SIZE = 20
+LOG_DIGEST_COLOR = "#272A2D"
+LOG_DIGEST_TIMESTAMP_FORMAT = "%H:%M:%S"
+
+CHANNEL_STATE_NAMES = ("hoisted", "busy", "idle", "pending", "answered", "ducked")
+
+# The number of consecutive messages from the asker required to duck a channel.
+DUCK_MESSAGE_COUNT = 10
 
 RATE_LIMIT_EMOJI = "⏳"
 
@@ -104,6 +131,8 @@ LOG_ANSWERED_FROM_PENDING_EMOJI = PENDING_EMOJI
 LOG_HOISTED_FROM_PENDING_EMOJI = PENDING_EMOJI
 LOG_HOISTED_FROM_IDLE_EMOJI = IDLE_EMOJI
 LOG_NO_CHANNELS_TO_HOIST_EMOJI = "🚒"
+LOG_EXPANDED_EMOJI = "🏗️"
+LOG_RETIRED_EMOJI = "🏚️"
 
 LOG_RELOCATED_COLOR = "#3B88C3"
 LOG_REASSIGNED_COLOR = "#FFD983"
@@ -120,10 +149,13 @@ LOG_ANSWERED_FROM_PENDING_COLOR = "#41BEA4"
 LOG_HOISTED_FROM_PENDING_COLOR = "#FFAC33"
 LOG_HOISTED_FROM_IDLE_COLOR = "#FFAC33"
 LOG_NO_CHANNELS_TO_HOIST_COLOR = "#DD2E44"
+LOG_EXPANDED_COLOR = "#3B88C3"
+LOG_RETIRED_COLOR = "#C1694F"
 
 CHANNEL_TOPIC_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
 CHANNEL_TOPIC_TIMESTAMP_PREFIX = "Last update: "
 CHANNEL_TOPIC_ASKER_PREFIX = "Current asker: "
+CHANNEL_TOPIC_DYNAMIC_PREFIX = "Pool channel: "
 
 MENTION_PATTERN = re.compile(r"<@\!?(\w+)>")
 
@@ -140,9 +172,27 @@ class ChannelUpdateTooSoon(Exception):
 
 
 class HelpChatChannelEntry:
-    def __init__(self, key: str, index: int):
+    def __init__(self, key: str, index: int, dynamic: bool = False):
         self.key: str = key
         self.index: int = index
+        self.dynamic: bool = dynamic
+
+
+class HelpChatReactionHandler:
+    def __init__(
+        self,
+        handler: typing.Callable,
+        managed: bool = True,
+        human: bool = False,
+        recent: bool = False,
+    ):
+        self.handler: typing.Callable = handler
+        # Whether the reaction only counts in a managed channel.
+        self.managed: bool = managed
+        # Whether the reaction only counts on a message from a human.
+        self.human: bool = human
+        # Whether the reaction only counts on one of the latest messages.
+        self.recent: bool = recent
 
 
 class HelpChatServerState:
@@ -153,6 +203,9 @@ class HelpChatServerState:
         server: discord.Server,
         channels: typing.List[dict],
         log_channel: str = None,
+        log_digest_seconds: int = 0,
+        log_digest_size: int = LOG_DIGEST_SIZE,
+        log_digest_color: str = LOG_DIGEST_COLOR,
         relocate_message_with_channel: StringOrStrings = None,
         relocate_message_without_channel: StringOrStrings = None,
         reminder_message: StringOrStrings = None,
@@ -163,8 +216,18 @@ class HelpChatServerState:
         seconds_until_idle: int = SECONDS_UNTIL_IDLE,
         seconds_to_poll: int = SECONDS_TO_POLL,
         preemptive_cache_size: int = PREEMPTIVE_CACHE_SIZE,
+        preemptive_cache_concurrency: int = PREEMPTIVE_CACHE_CONCURRENCY,
         min_hoisted_channels: int = 0,
         max_hoisted_channels: int = 0,
+        hoisting_rate_window: int = HOISTING_RATE_WINDOW,
+        hoisting_rate_alpha: float = HOISTING_RATE_ALPHA,
+        hoisting_horizon: int = HOISTING_HORIZON,
+        template_channel: str = None,
+        max_dynamic_channels: int = 0,
+        seconds_until_retire: int = SECONDS_UNTIL_RETIRE,
+        dynamic_channel_key: str = DYNAMIC_CHANNEL_KEY,
+        stats_retention: int = STATS_RETENTION,
+        stats_database: str = None,
         rate_limit_emoji: str = RATE_LIMIT_EMOJI,
         # action emoji
         relocate_emoji: str = RELOCATE_EMOJI,
@@ -216,6 +279,8 @@ class HelpChatServerState:
         log_hoisted_from_pending_emoji: str = LOG_HOISTED_FROM_PENDING_EMOJI,
         log_hoisted_from_idle_emoji: str = LOG_HOISTED_FROM_IDLE_EMOJI,
         log_no_channels_to_hoist_emoji: str = LOG_NO_CHANNELS_TO_HOIST_EMOJI,
+        log_expanded_emoji: str = LOG_EXPANDED_EMOJI,
+        log_retired_emoji: str = LOG_RETIRED_EMOJI,
         # log color
         log_relocated_color: str = LOG_RELOCATED_COLOR,
         log_reassigned_color: str = LOG_REASSIGNED_COLOR,
@@ -232,6 +297,8 @@ class HelpChatServerState:
         log_hoisted_from_pending_color: str = LOG_HOISTED_FROM_PENDING_COLOR,
         log_hoisted_from_idle_color: str = LOG_HOISTED_FROM_IDLE_COLOR,
         log_no_channels_to_hoist_color: str = LOG_NO_CHANNELS_TO_HOIST_COLOR,
+        log_expanded_color: str = LOG_EXPANDED_COLOR,
+        log_retired_color: str = LOG_RETIRED_COLOR,
         # roles
         helper_role: str = None,
         ignored_role: str = None,
@@ -240,6 +307,7 @@ class HelpChatServerState:
         persist_asker: bool = False,
         log_verbose_usernames: bool = False,
         auto_poll: bool = True,
+        adaptive_hoisting: bool = False,
         **kwargs,
     ):
         self.log: logging.Logger = logging.getLogger(f"{ext}:{server.name}")
@@ -258,9 +326,50 @@ class HelpChatServerState:
             channel_entry = HelpChatChannelEntry(channel_key, index)
             self.channel_map[channel] = channel_entry
 
+        # Dynamic channels are named before they exist, so the hoisted name and
+        # description can't refer to the channel itself.
+        if max_dynamic_channels > 0 and (
+            refers_to_channel(hoisted_name)
+            or refers_to_channel(flatten_string(hoisted_description))
+        ):
+            self.log.error(
+                "Dynamic channels are DISABLED: the hoisted name and description must not use {channel}."
+            )
+            max_dynamic_channels = 0
+
+        # Adopt any dynamic channels left behind by a previous state object,
+        # but only if there are supposed to be any.
+        for channel in self.server.channels if max_dynamic_channels > 0 else ():
+            channel_key = self.get_dynamic_channel_key(channel)
+            if channel_key and channel not in self.channel_map:
+                channel_entry = HelpChatChannelEntry(
+                    channel_key, len(self.channel_map), dynamic=True
+                )
+                self.channel_map[channel] = channel_entry
+
         self.channels: typing.List[discord.Channel] = list(self.channel_map.keys())
+        self.managed_channel_ids: typing.Set[ChannelId] = {
+            channel.id for channel in self.channels if channel
+        }
 
-        self.log.info(f"Identified {len(self.channels)} help channels.")
+        self.log.info(
+            f"Identified {len(self.channels)} help channels. ({self.num_dynamic_channels} dynamic)"
+        )
+
+        self.template_channel: discord.Channel = self.bot.get_channel(
+            template_channel
+        ) if template_channel else None
+        self.max_dynamic_channels: int = max_dynamic_channels
+        self.seconds_until_retire: int = seconds_until_retire
+        self.delta_until_retire = timedelta(seconds=self.seconds_until_retire)
+        self.dynamic_channel_key: str = dynamic_channel_key
+        # When the pool started being under-used, if it currently is.
+        self.low_load_since: datetime = None
+
+        if self.max_dynamic_channels > 0:
+            self.log.info(
+                f"Pool may expand by up to {self.max_dynamic_channels} channels using template: {self.template_channel}"
+            )
 
         self.log_channel: discord.Channel = self.bot.get_channel(
             log_channel
@@ -268,11 +377,26 @@ class HelpChatServerState:
 
         if self.log_channel:
             self.log.info(f"Identified log channel: {self.log_channel}")
+            self.bot.rest.add_log_channel(self.log_channel)
         elif log_channel:
             self.log.warning(f"Unable to identify log channeL: {log_channel}")
         else:
             self.log.warning(f"No log channel was provided.")
 
+        # Log entries can be buffered and sent together as periodic digests.
+        self.log_digest_seconds: int = log_digest_seconds
+        self.log_digest_size: int = log_digest_size
+        self.log_digest_color: discord.Color = self.bot.color_from_hex(
+            log_digest_color
+        )
+        self.log_digest_buffer: typing.List[str] = []
+        self.log_digest_task: asyncio.Task = None
+
+        if self.log_channel and self.log_digest_seconds > 0:
+            self.log.info(
+                f"Log entries will be sent as digests every {self.log_digest_seconds} seconds."
+            )
+
         self.relocate_message_with_channel: str = flatten_string(
             relocate_message_with_channel
         )
@@ -294,10 +418,30 @@ class HelpChatServerState:
         self.seconds_to_poll: int = seconds_to_poll
 
         self.preemptive_cache_size: bool = preemptive_cache_size
+        self.preemptive_cache_concurrency: int = preemptive_cache_concurrency
+
+        # Keep enough recent message metadata around to answer every check
+        # that would otherwise need to look at channel history.
+        self.history_size: int = max(preemptive_cache_size, DUCK_MESSAGE_COUNT)
+        self.channel_history: typing.Dict[ChannelId, ChannelHistory] = {
+            channel.id: ChannelHistory(self.history_size) for channel in self.channels
+        }
 
         self.min_hoisted_channels: int = min_hoisted_channels
         self.max_hoisted_channels: int = max(min_hoisted_channels, max_hoisted_channels)
 
+        self.hoisting_horizon: int = hoisting_horizon
+        self.hoisting_horizon_delta = timedelta(seconds=self.hoisting_horizon)
+        self.hoisting_rate: HoistingRateTracker = HoistingRateTracker(
+            window=hoisting_rate_window, alpha=hoisting_rate_alpha
+        )
+        self.last_target_hoisted_channels: int = self.max_hoisted_channels
+
+        # Per-minute analytics, optionally rolled up to a local database.
+        self.stats: HelpChatStats = HelpChatStats(
+            retention=stats_retention, database=stats_database
+        )
+
         self.rate_limit_emoji: typing.Union[str, discord.Emoji] = self.bot.get_emoji(
             self.server, rate_limit_emoji
         )
@@ -421,6 +565,8 @@ class HelpChatServerState:
         self.log_hoisted_from_pending_emoji: str = log_hoisted_from_pending_emoji
         self.log_hoisted_from_idle_emoji: str = log_hoisted_from_idle_emoji
         self.log_no_channels_to_hoist_emoji: str = log_no_channels_to_hoist_emoji
+        self.log_expanded_emoji: str = log_expanded_emoji
+        self.log_retired_emoji: str = log_retired_emoji
 
         # @@ Init log colors
         self.log_relocated_color: str = self.bot.color_from_hex(log_relocated_color)
@@ -452,6 +598,8 @@ class HelpChatServerState:
         self.log_no_channels_to_hoist_color: str = self.bot.color_from_hex(
             log_no_channels_to_hoist_color
         )
+        self.log_expanded_color: str = self.bot.color_from_hex(log_expanded_color)
+        self.log_retired_color: str = self.bot.color_from_hex(log_retired_color)
 
         # @@ Identify roles
 
@@ -468,26 +616,77 @@ class HelpChatServerState:
         self.persist_asker: bool = persist_asker
         self.log_verbose_usernames: bool = log_verbose_usernames
         self.auto_poll: bool = auto_poll
+        self.adaptive_hoisting: bool = adaptive_hoisting
+
+        # @@ Dispatch tables, so events can be routed with a single lookup.
+        # Earlier entries win when several actions share the same emoji.
+        self.reaction_handlers: typing.Dict[
+            typing.Union[str, discord.Emoji], HelpChatReactionHandler
+        ] = {}
+        for emoji, reaction_handler in (
+            (
+                self.relocate_emoji,
+                HelpChatReactionHandler(self.do_relocate, managed=False, human=True),
+            ),
+            (self.reassign_emoji, HelpChatReactionHandler(self.do_reassign, human=True)),
+            (self.resolve_emoji, HelpChatReactionHandler(self.do_resolve, recent=True)),
+            (self.remind_emoji, HelpChatReactionHandler(self.do_remind, human=True)),
+            (self.rename_emoji, HelpChatReactionHandler(self.do_rename)),
+            (self.restore_emoji, HelpChatReactionHandler(self.do_restore)),
+        ):
+            self.reaction_handlers.setdefault(emoji, reaction_handler)
+        self.message_handlers: typing.Dict[str, typing.Callable] = {}
+        for emoji, handler in (
+            (self.resolve_emoji, self.do_resolve),
+            (self.remind_emoji, self.do_remind),
+            (self.rename_emoji, self.do_rename),
+            (self.restore_emoji, self.do_restore),
+            (self.ducked_emoji, self.do_duck),
+        ):
+            self.message_handlers.setdefault(str(emoji), handler)
+
+        # @@ Clock used for every timestamp; swappable for simulations.
+        self.clock: typing.Callable[[], datetime] = datetime.utcnow
+
+        # @@ Raw options, so that reloads can tell what changed.
+        self.options: dict = None
 
         ## @@ Rate limiting stuff
         self.throttle_notif_cache: typing.Dict[ChannelId, datetime] = {}
 
-        # @@ Setup polling task
-        self.polling_task: asyncio.Task = None
+        # Channels that need restyling after an options change, and which state
+        # to restyle them as.
+        self.pending_restyles: typing.Dict[ChannelId, str] = {}
+
+        # @@ Setup polling; the work itself is run by the shared scheduler.
         self.delta_until_idle = timedelta(seconds=self.seconds_until_idle)
-        if self.auto_poll:
-            self.start_polling_task()
-        else:
+        if not self.auto_poll:
             self.log.warning("Auto-polling is DISABLED.")
 
-    @property
-    def polling_task_str(self) -> str:
-        return str(getattr(self.polling_task, "_coro", None))
+    def now(self) -> datetime:
+        return self.clock()
 
     @property
     def num_hoisted_channels(self) -> int:
         return len(list(self.get_hoisted_channels()))
 
+    @property
+    def num_dynamic_channels(self) -> int:
+        return len(list(self.get_dynamic_channels()))
+
+    @property
+    def target_hoisted_channels(self) -> int:
+        # Without adaptive hoisting, always aim for the max.
+        if not self.adaptive_hoisting:
+            return self.max_hoisted_channels
+        return self.hoisting_rate.get_target(
+            now=self.now(),
+            horizon=self.hoisting_horizon_delta,
+            num_channels=len(self.channels),
+            min_target=self.min_hoisted_channels,
+            max_target=self.max_hoisted_channels,
+        )
+
     async def log_to_channel(
         self,
         emoji: str,
@@ -495,6 +694,7 @@ class HelpChatServerState:
         message: discord.Message = None,
         actor: discord.Member = None,
         color: discord.Color = discord.Embed.Empty,
+        urgent: bool = False,
     ):
         if not self.log_channel:
             return
@@ -506,47 +706,80 @@ class HelpChatServerState:
         if message:
             message_link = self.bot.make_message_link(message)
             parts.append(f"[(View)]({message_link})")
-        em = discord.Embed(color=color, description=" ".join(parts))
-        await self.bot.send_message(self.log_channel, embed=em)
-
-    def start_polling_task(self):
-        if not self.polling_task or self.polling_task.done():
-            # not already running
-            self.log.info(
-                f"Channels will be polled every {self.seconds_to_poll} seconds."
-            )
-            self.polling_task = asyncio.get_event_loop().create_task(
-                self.polling_loop()
+        line = " ".join(parts)
+        # Urgent entries skip the digest, but anything already buffered goes
+        # out first so that the log stays in order.
+        if urgent or self.log_digest_seconds <= 0:
+            await self.flush_log_digest()
+            em = discord.Embed(color=color, description=line)
+            await self.bot.send_message(self.log_channel, embed=em)
+        else:
+            await self.buffer_log_digest(line)
+
+    async def buffer_log_digest(self, line: str):
+        timestamp_str = self.now().strftime(LOG_DIGEST_TIMESTAMP_FORMAT)
+        line = f"`{timestamp_str}` {line}"
+        # Flush early if this entry wouldn't fit in the same embed.
+        buffered_length = sum(len(l) + 1 for l in self.log_digest_buffer)
+        if buffered_length + len(line) > EMBED_DESCRIPTION_LIMIT:
+            await self.flush_log_digest()
+        self.log_digest_buffer.append(line)
+        if len(self.log_digest_buffer) >= self.log_digest_size:
+            await self.flush_log_digest()
+        elif not self.log_digest_task or self.log_digest_task.done():
+            self.log_digest_task = asyncio.get_event_loop().create_task(
+                self.log_digest_timer()
             )
-            self.log.info(f"Created polling task: {self.polling_task_str}")
-            return True
 
-    def stop_polling_task(self):
-        if self.polling_task and not self.polling_task.done():
-            # running; can be cancelled
-            self.polling_task.cancel()
-            return True
+    async def log_digest_timer(self):
+        try:
+            await asyncio.sleep(self.log_digest_seconds)
+            await self.flush_log_digest()
+        except asyncio.CancelledError:
+            pass
+        except:
+            self.log.exception("Failed to flush log digest:")
 
-    async def polling_loop(self):
-        while not self.bot.is_closed:
-            try:
-                await asyncio.sleep(self.seconds_to_poll)
-                await self.poll()
-            except asyncio.CancelledError:
-                self.log.warning(
-                    f"Polling task {self.polling_task_str} was cancelled; breaking from loop..."
-                )
-                break
-            except:
-                self.log.exception(
-                    f"Polling task {self.polling_task_str} encountered an error; ignoring..."
-                )
+    async def flush_log_digest(self):
+        if not self.log_digest_buffer:
+            return
+        lines = self.log_digest_buffer
+        self.log_digest_buffer = []
+        description = "\n".join(lines)[:EMBED_DESCRIPTION_LIMIT]
+        em = discord.Embed(color=self.log_digest_color, description=description)
+        await self.bot.send_message(self.log_channel, embed=em)
 
     async def poll(self):
         self.log.debug(f"Polling {len(self.channels)} channels...")
-        await self.sync_all()
+        await self.sync_channel_positions()
+        await self.sync_idle_channels()
+        await self.poll_hoisting()
+
+    async def poll_hoisting(self):
+        if self.pending_restyles:
+            await self.sync_restyles()
+        if self.adaptive_hoisting:
+            self.update_hoisting_rate()
+        await self.sync_hoisted_channels()
+        if self.max_dynamic_channels > 0:
+            await self.maybe_contract_pool()
+
+    def update_hoisting_rate(self):
+        now = self.now()
+        self.hoisting_rate.update_profile(now)
+        target = self.target_hoisted_channels
+        if target != self.last_target_hoisted_channels:
+            rate = self.hoisting_rate.get_rate_per_minute(now)
+            self.log.info(
+                f"Target hoisted channels changed from {self.last_target_hoisted_channels} to {target} ({rate:.2f} questions per minute)"
+            )
+            self.last_target_hoisted_channels = target
 
     def get_channel_state(self, channel: discord.Channel) -> ChannelState:
+        # Channels still waiting to be restyled keep their previous state.
+        state_name = self.pending_restyles.get(channel.id)
+        if state_name:
+            return getattr(self, f"{state_name}_state")
         if self.is_channel_hoisted(channel):
             return self.hoisted_state
         if self.is_channel_busy(channel):
@@ -560,7 +793,16 @@ class HelpChatServerState:
         if self.is_channel_ducked(channel):
             return self.ducked_state
 
+    def get_channel_state_name(self, channel_state: ChannelState) -> str:
+        for state_name in CHANNEL_STATE_NAMES:
+            if getattr(self, f"{state_name}_state") is channel_state:
+                return state_name
+
     def is_channel(self, channel: discord.Channel, channel_state: ChannelState) -> bool:
+        # Channels still waiting to be restyled don't look like their state yet.
+        state_name = self.pending_restyles.get(channel.id)
+        if state_name:
+            return getattr(self, f"{state_name}_state") is channel_state
         return channel_state.matches(channel)
 
     def is_channel_hoisted(self, channel: discord.Channel) -> bool:
@@ -625,12 +867,38 @@ class HelpChatServerState:
     def get_random_answered_channel(self) -> discord.Channel:
         return self.get_random_channel(self.answered_state)
 
+    async def get_latest_message_timestamps(
+        self, channels: typing.List[discord.Channel]
+    ) -> typing.List[typing.Tuple[datetime, discord.Channel]]:
+        # Use the channel histories where they know the latest message, and
+        # only go to the API for the rest. Empty channels are left out.
+        timestamps = []
+        unknown_channels = []
+        for channel in channels:
+            history = self.get_channel_history(channel)
+            if history and history.covers(1):
+                latest_entry = history.latest()
+                if latest_entry:
+                    timestamps.append((latest_entry.timestamp, channel))
+            else:
+                unknown_channels.append(channel)
+        if unknown_channels:
+            for message in await self.bot.get_latest_messages(unknown_channels):
+                timestamps.append((message.timestamp, message.channel))
+        return timestamps
+
+    async def get_latest_message_timestamp(
+        self, channel: discord.Channel
+    ) -> typing.Optional[datetime]:
+        for timestamp, _ in await self.get_latest_message_timestamps([channel]):
+            return timestamp
+
     async def get_oldest_channel(self, state: ChannelState) -> discord.Channel:
         channels: typing.List[discord.Channel] = list(self.get_channels(state))
-        latest_messages = await self.bot.get_latest_messages(channels)
-        if latest_messages:
-            latest_messages.sort(key=lambda message: message.timestamp)
-            oldest_channel = latest_messages[0].channel
+        latest_timestamps = await self.get_latest_message_timestamps(channels)
+        if latest_timestamps:
+            latest_timestamps.sort(key=lambda pair: pair[0])
+            _, oldest_channel = latest_timestamps[0]
             return oldest_channel
 
     async def get_oldest_hoisted_channel(self) -> discord.Channel:
@@ -654,17 +922,16 @@ class HelpChatServerState:
         # plus some, so that we can be reasonably sure it has the capacity to
         # transition states twice in quick succession.
         channels: typing.List[discord.Channel] = list(self.get_channels(state))
-        latest_messages = await self.bot.get_latest_messages(channels)
-        now = datetime.utcnow()
-        if latest_messages:
-            latest_messages.sort(key=lambda message: message.timestamp)
-            for message in latest_messages:
-                channel = message.channel
+        latest_timestamps = await self.get_latest_message_timestamps(channels)
+        now = self.now()
+        if latest_timestamps:
+            latest_timestamps.sort(key=lambda pair: pair[0])
+            for latest, channel in latest_timestamps:
                 last_update = self.get_last_update_timestamp(channel)
                 # If the channel does not have a last update recorded, just use
                 # the timestamp of the latest message as a fall-back.
                 if not last_update:
-                    last_update = message.timestamp
+                    last_update = latest
                 can_hoist_at = last_update + self.channel_update_delta
                 can_hoist_now = can_hoist_at < now
                 if can_hoist_now:
@@ -689,20 +956,83 @@ class HelpChatServerState:
         if channel_entry:
             return channel_entry.index
 
+    def is_channel_dynamic(self, channel: discord.Channel) -> bool:
+        channel_entry: HelpChatChannelEntry = self.channel_map.get(channel)
+        return bool(channel_entry and channel_entry.dynamic)
+
+    def get_dynamic_channels(self) -> typing.Iterable[discord.Channel]:
+        for channel, channel_entry in self.channel_map.items():
+            if channel_entry.dynamic:
+                yield channel
+
+    def get_dynamic_channel_key(self, channel: discord.Channel) -> str:
+        # Dynamic channels remember their key in the topic, so that they can be
+        # picked up again after a reload or restart.
+        if channel.topic:
+            for line in reversed(str(channel.topic).splitlines()):
+                if line.startswith(CHANNEL_TOPIC_DYNAMIC_PREFIX):
+                    return line[len(CHANNEL_TOPIC_DYNAMIC_PREFIX) :]
+
+    def get_next_dynamic_channel_key(self) -> str:
+        used_keys = {self.get_channel_key(ch) for ch in self.get_dynamic_channels()}
+        number = 1
+        while self.dynamic_channel_key.format(number=number) in used_keys:
+            number += 1
+        return self.dynamic_channel_key.format(number=number)
+
+    def add_channel(self, channel: discord.Channel, key: str, dynamic: bool = False):
+        # Append the channel to the end of the pool, without a full reload.
+        self.channel_map[channel] = HelpChatChannelEntry(
+            key, len(self.channel_map), dynamic=dynamic
+        )
+        self.channels = list(self.channel_map.keys())
+        self.managed_channel_ids = {ch.id for ch in self.channels if ch}
+        history = ChannelHistory(self.history_size)
+        history.seed(())
+        self.channel_history[channel.id] = history
+
+    def remove_channel(self, channel: discord.Channel):
+        # Drop the channel and close the gap it leaves in the indices.
+        self.channel_map.pop(channel, None)
+        for index, channel_entry in enumerate(self.channel_map.values()):
+            channel_entry.index = index
+        self.channels = list(self.channel_map.keys())
+        self.managed_channel_ids = {ch.id for ch in self.channels if ch}
+        self.channel_history.pop(channel.id, None)
+        self.throttle_notif_cache.pop(channel.id, None)
+        self.hoisting_rate.asked_at.pop(channel.id, None)
+        self.stats.forget_channel(channel.id)
+
+    def build_channel_name(
+        self,
+        channel: discord.Channel,
+        state: ChannelState,
+        asker: discord.Member = None,
+    ) -> str:
+        channel_key = self.get_channel_key(channel)
+        if asker and self.renamed_role in asker.roles:
+            return state.format_name(key=channel_key, channel=channel)
+        return state.format_name(key=channel_key, channel=channel, asker=asker)
+
     def build_channel_description(
         self,
         channel: discord.Channel,
         state: ChannelState,
-        timestamp: datetime,
+        timestamp: typing.Optional[datetime],
         asker: discord.Member = None,
     ) -> str:
-        timestamp_str = timestamp.strftime(CHANNEL_TOPIC_TIMESTAMP_FORMAT)
         description = state.format_description(channel, asker)
-        # store the last update timestamp
-        description += f"\n\n{CHANNEL_TOPIC_TIMESTAMP_PREFIX}{timestamp_str}"
+        # store the last update timestamp, if there is one
+        if timestamp:
+            timestamp_str = timestamp.strftime(CHANNEL_TOPIC_TIMESTAMP_FORMAT)
+            description += f"\n\n{CHANNEL_TOPIC_TIMESTAMP_PREFIX}{timestamp_str}"
         # store the asker, if enabled
         if self.persist_asker and asker:
             description += f"\n\n{CHANNEL_TOPIC_ASKER_PREFIX}{asker.mention}"
+        # store the key of dynamic channels
+        if self.is_channel_dynamic(channel):
+            channel_key = self.get_channel_key(channel)
+            description += f"\n\n{CHANNEL_TOPIC_DYNAMIC_PREFIX}{channel_key}"
         return description
 
     def log_username(self, user: discord.User) -> str:
@@ -735,7 +1065,7 @@ class HelpChatServerState:
         # If no timestamp has been recorded yet, just return something that's
         # guaranteed to be old enough.
         if not last_update:
-            return datetime.utcnow() - self.channel_update_delta
+            return self.now() - self.channel_update_delta
         next_update = last_update + self.channel_update_delta
         return next_update
 
@@ -774,44 +1104,49 @@ class HelpChatServerState:
 
     async def sync_idle_channels(self):
         for channel in self.channels:
-            state = self.get_channel_state(channel)
-            # Busy channels can become idle; and, instead of becoming idle,
-            # pending channels will automatically be assumed answered.
-            if state in (self.busy_state, self.pending_state):
-                latest_message = await self.bot.get_latest_message(channel)
-                # If there's no latest message, then... set it as answered?
-                if not latest_message:
+            await self.sync_idle_channel(channel)
+
+    async def sync_idle_channel(self, channel: discord.Channel):
+        # The channel may have been retired since this was scheduled.
+        if channel not in self.channel_map:
+            return
+        state = self.get_channel_state(channel)
+        # Busy channels can become idle; and, instead of becoming idle,
+        # pending channels will automatically be assumed answered.
+        if state in (self.busy_state, self.pending_state):
+            latest: datetime = await self.get_latest_message_timestamp(channel)
+            # If there's no latest message, then... set it as answered?
+            if not latest:
+                try:
+                    await self.set_channel_answered(channel)
+                except ChannelUpdateTooSoon:
+                    pass
+                return
+            now: datetime = self.now()
+            then: datetime = latest + self.delta_until_idle
+            if now > then:
+                # Busy channels become idle.
+                if state == self.busy_state:
                     try:
-                        await self.set_channel_answered(channel)
+                        await self.set_channel_idle(channel)
+                    except ChannelUpdateTooSoon:
+                        pass
+                # Pending channels become answered.
+                elif state == self.pending_state:
+                    try:
+                        if await self.set_channel_answered(channel):
+                            await self.log_to_channel(
+                                emoji=self.log_answered_from_pending_emoji,
+                                description=f"{channel.mention} remained inactive and was automatically resolved",
+                                color=self.log_answered_from_pending_color,
+                            )
                     except ChannelUpdateTooSoon:
                         pass
-                    continue
-                now: datetime = datetime.utcnow()
-                latest: datetime = latest_message.timestamp
-                then: datetime = latest + self.delta_until_idle
-                if now > then:
-                    # Busy channels become idle.
-                    if state == self.busy_state:
-                        try:
-                            await self.set_channel_idle(channel)
-                        except ChannelUpdateTooSoon:
-                            pass
-                    # Pending channels become answered.
-                    elif state == self.pending_state:
-                        try:
-                            if await self.set_channel_answered(channel):
-                                await self.log_to_channel(
-                                    emoji=self.log_answered_from_pending_emoji,
-                                    description=f"{channel.mention} remained inactive and was automatically resolved",
-                                    color=self.log_answered_from_pending_color,
-                                )
-                        except ChannelUpdateTooSoon:
-                            pass
 
     async def sync_hoisted_channels(self):
         # Don't do anything unless we care about hoisted channels.
         if self.max_hoisted_channels > 0:
-            delta = self.max_hoisted_channels - self.num_hoisted_channels
+            delta = self.target_hoisted_channels - self.num_hoisted_channels
             # Recycle available channels to top-off the hoisted ones.
             if delta > 0:
                 for i in range(delta):
@@ -831,23 +1166,20 @@ class HelpChatServerState:
         asker: typing.Union[discord.User, bool] = None,
         clear_asker: bool = False,
     ):
-        now = datetime.utcnow()
+        now = self.now()
         # If we're not ignoring throttling, make sure it's not too soon for the
         # channel to update again.
         if not ignore_throttling:
             next_update = self.get_next_update_timestamp(channel)
             if next_update > now:
+                self.stats.record_throttle(now)
                 raise ChannelUpdateTooSoon(next_update)
         # If askers are enabled, one was not provided, and we have not been
         # asked to clear the asker, then determine the asker automatically.
         if self.persist_asker and (not asker) and (not clear_asker):
             asker = await self.get_asker(channel)
         # Set the new channel name, which doubles as its persistent state.
-        channel_key = self.get_channel_key(channel)
-        if asker and self.renamed_role in asker.roles:
-            new_name = state.format_name(key=channel_key, channel=channel)
-        else:
-            new_name = state.format_name(key=channel_key, channel=channel, asker=asker)
+        new_name = self.build_channel_name(channel, state, asker=asker)
         # Determine the new topic based on the new channel state.
         new_topic = self.build_channel_description(
             channel, state, timestamp=now, asker=asker
@@ -858,6 +1190,31 @@ class HelpChatServerState:
         await self.bot.edit_channel(
             channel, name=new_name, topic=new_topic, category=new_category
         )
+        # Any restyle that was waiting on this channel is now moot.
+        self.pending_restyles.pop(channel.id, None)
+        self.stats.record_transition(
+            channel.id, self.get_channel_state_name(state), now
+        )
+
+    async def restyle_channel(self, channel: discord.Channel, state: ChannelState):
+        # Like `set_channel`, but the channel stays in the same state and only
+        # its style changes, so it keeps its last update timestamp (and with it
+        # the throttle) and no transition is recorded.
+        now = self.now()
+        next_update = self.get_next_update_timestamp(channel)
+        if next_update > now:
+            raise ChannelUpdateTooSoon(next_update)
+        asker = await self.get_asker(channel) if self.persist_asker else None
+        timestamp = self.get_last_update_timestamp(channel)
+        await self.bot.edit_channel(
+            channel,
+            name=self.build_channel_name(channel, state, asker=asker),
+            topic=self.build_channel_description(
+                channel, state, timestamp=timestamp, asker=asker
+            ),
+            category=state.category,
+        )
+        self.pending_restyles.pop(channel.id, None)
 
     async def set_channel_hoisted(
         self,
@@ -871,7 +1228,7 @@ class HelpChatServerState:
         # The reason we have more strict checks here is to try and protect from
         # a variety of async race conditions.
         if force or (
-            (self.num_hoisted_channels < self.max_hoisted_channels)
+            (self.num_hoisted_channels < self.target_hoisted_channels)
             and (
                 self.is_channel_answered(channel)
                 or self.is_channel_pending(channel)
@@ -896,6 +1253,7 @@ class HelpChatServerState:
         force: bool = False,
         ignore_throttling: bool = False,
         asker: discord.User = None,
+        asked_at: datetime = None,
     ) -> bool:
         # Any channel that's not already busy can become busy.
         if force or not self.is_channel_busy(channel):
@@ -905,6 +1263,11 @@ class HelpChatServerState:
                 ignore_throttling=ignore_throttling,
                 asker=asker,
             )
+            # A new question only counts once the channel has actually taken it,
+            # so that throttled or failed transitions aren't counted as arrivals.
+            if asked_at:
+                self.hoisting_rate.record_question(channel.id, asked_at)
+                self.stats.record_question(channel.id, asker.id, asked_at)
             await self.sync_hoisted_channels()
             return True
 
@@ -942,6 +1305,8 @@ class HelpChatServerState:
             await self.set_channel(
                 channel, self.answered_state, ignore_throttling=ignore_throttling
             )
+            self.hoisting_rate.record_resolution(channel.id, self.now())
+            self.stats.record_resolution(channel.id, self.now())
             return True
 
     async def set_channel_ducked(
@@ -967,20 +1332,81 @@ class HelpChatServerState:
             except ChannelUpdateTooSoon:
                 pass
 
-    async def is_channel_prompted(self, channel: discord.Channel) -> bool:
-        # Check if the latest message is the hoisted message prompt. We do this
-        # by comparing the color of the embed strip and, if that matches, the
+    def get_channel_history(self, channel: discord.Channel) -> ChannelHistory:
+        return self.channel_history.get(channel.id)
+
+    def seed_channel_history(
+        self,
+        messages: typing.List[discord.Message],
+        channels: typing.List[discord.Channel] = None,
+    ):
+        # Messages come in newest-first, but histories are kept oldest-first.
+        channel_ids = (
+            [channel.id for channel in channels]
+            if channels is not None
+            else list(self.channel_history)
+        )
+        messages_by_channel: typing.Dict[ChannelId, typing.List[discord.Message]] = {
+            channel_id: [] for channel_id in channel_ids
+        }
+        for message in messages:
+            if message.channel.id in messages_by_channel:
+                messages_by_channel[message.channel.id].append(message)
+        for channel_id, channel_messages in messages_by_channel.items():
+            self.channel_history[channel_id].seed(
+                ChannelHistory.entry_from_message(m, self.is_prompt_message(m))
+                for m in reversed(channel_messages)
+            )
+
+    def record_message(self, message: discord.Message):
+        history = self.get_channel_history(message.channel)
+        if history:
+            history.append(
+                ChannelHistory.entry_from_message(
+                    message, self.is_prompt_message(message)
+                )
+            )
+
+    def forget_message(self, message: discord.Message):
+        history = self.get_channel_history(message.channel)
+        if history:
+            history.remove(message.id)
+
+    def refresh_message(self, message: discord.Message):
+        # Embeds may be attached after the fact, so re-evaluate the prompt.
+        history = self.get_channel_history(message.channel)
+        if history:
+            history.update(message.id, self.is_prompt_message(message))
+
+    def is_prompt_message(self, message: discord.Message) -> bool:
+        # Check if the message is the hoisted message prompt. We do this by
+        # comparing the color of the embed strip and, if that matches, the
         # first few characters of text as well.
-        latest_message: discord.Message = await self.bot.get_latest_message(channel)
-        if latest_message.author == self.bot.user and latest_message.embeds:
-            latest_embed: discord.Embed = latest_message.embeds[0]
-            em_color = latest_embed.get("color", None)
-            em_description = latest_embed.get("description", None)
-            return (
+        if self.prompt_message and message.author == self.bot.user and message.embeds:
+            embed: dict = message.embeds[0]
+            em_color = embed.get("color", None)
+            em_description = embed.get("description", None)
+            return bool(
                 em_color == self.prompt_color.value
                 and em_description
                 and em_description[:20] == self.prompt_message[:20]
             )
+        return False
+
+    async def is_latest_message(self, message: discord.Message, limit: int = 1) -> bool:
+        history = self.get_channel_history(message.channel)
+        if history and history.covers(limit):
+            return history.is_latest(message.id, limit=limit)
+        return await self.bot.is_latest_message(message, limit=limit)
+
+    async def is_channel_prompted(self, channel: discord.Channel) -> bool:
+        # Check if the latest message is the hoisted message prompt.
+        history = self.get_channel_history(channel)
+        if history and history.covers(1):
+            latest_entry = history.latest()
+            return bool(latest_entry and latest_entry.is_prompt)
+        latest_message: discord.Message = await self.bot.get_latest_message(channel)
+        return bool(latest_message and self.is_prompt_message(latest_message))
 
     async def maybe_send_prompt_message(self, channel: discord.Channel) -> bool:
         # Send hoisted message, if any, into the newly-hoisted channel - but
@@ -1004,11 +1430,19 @@ class HelpChatServerState:
         # because then there's no way to tell if they're the true asker.
         elif self.ignored_role in author.roles:
             return False
-        # Regardless of whether askers are enabled, the last 10 messages in the
-        # channel must all be from the ducker.
-        async for m in self.bot.iter_latest_messages(channels=[channel], limit=10):
-            if author.id != m.author.id:
-                return False
+        # Regardless of whether askers are enabled, the last few messages in
+        # the channel must all be from the ducker.
+        history = self.get_channel_history(channel)
+        if history and history.covers(DUCK_MESSAGE_COUNT):
+            for entry in history.iter_latest(DUCK_MESSAGE_COUNT):
+                if author.id != entry.author_id:
+                    return False
+        else:
+            async for m in self.bot.iter_latest_messages(
+                channels=[channel], limit=DUCK_MESSAGE_COUNT
+            ):
+                if author.id != m.author.id:
+                    return False
         # Finally, if we get all the way here, we can duck the channel.
         try:
             if await self.set_channel_ducked(channel):
@@ -1022,6 +1456,11 @@ class HelpChatServerState:
         except ChannelUpdateTooSoon as ex:
             await self.notify_throttling(ex, message, actor=author)
 
+    async def do_duck(
+        self, channel: discord.Channel, message: discord.Message, actor: discord.Member
+    ):
+        await self.maybe_duck_channel(channel, message)
+
     async def notify_throttling(
         self,
         ex: ChannelUpdateTooSoon,
@@ -1031,7 +1470,7 @@ class HelpChatServerState:
     ):
         channel: discord.Channel = message.channel
         # Make sure we're only notifying about rate-limiting once per cycle.
-        now = datetime.utcnow()
+        now = self.now()
         last_notif = self.throttle_notif_cache.get(channel.id, None)
         # Don't notify at all if there action was indirect (no actor).
         do_notif = actor is not None
@@ -1072,6 +1511,9 @@ class HelpChatServerState:
         to_channel = (
             self.get_random_hoisted_channel() or self.get_random_answered_channel()
         )
+        # Grow the pool if there's nowhere to send them.
+        if not to_channel and self.max_dynamic_channels > 0:
+            to_channel = await self.try_expand_pool()
         if to_channel:
             await self.log_to_channel(
                 emoji=self.log_relocated_emoji,
@@ -1345,8 +1787,8 @@ class HelpChatServerState:
             await self.notify_throttling(ex, message, actor=actor, reaction=reaction)
 
     async def try_hoist_channel(self):
-        # If we've hit the max, don't hoist any more channels.
-        if self.num_hoisted_channels < self.max_hoisted_channels:
+        # If we've hit the target, don't hoist any more channels.
+        if self.num_hoisted_channels < self.target_hoisted_channels:
             # Always try to get the oldest answered channel first.
             channel_to_hoist = await self.get_hoistable_answered_channel()
             # If there weren't any answered channels available, but we're
@@ -1373,6 +1815,10 @@ class HelpChatServerState:
                             description=f"Idle channel {channel_to_hoist.mention} was hoisted because no answered or pending channels were available",
                             color=self.log_hoisted_from_idle_color,
                         )
+                # As a last resort, grow the pool with a brand new channel.
+                if not channel_to_hoist:
+                    if await self.try_expand_pool():
+                        return True
                 # Warn if we still haven't found a channel to recycle.
                 if not channel_to_hoist:
                     warning_text = f"No channels available to replenish the minimum amount of {self.min_hoisted_channels} hoisted channels!"
@@ -1381,6 +1827,7 @@ class HelpChatServerState:
                         emoji=self.log_no_channels_to_hoist_emoji,
                         description=warning_text,
                         color=self.log_no_channels_to_hoist_color,
+                        urgent=True,
                     )
             # Otherwise, if we're still meeting the min, we're fine even if we
             # don't have another channel to hoist.
@@ -1392,21 +1839,116 @@ class HelpChatServerState:
                 except ChannelUpdateTooSoon:
                     return None
 
-    async def on_ready(self):
-        self.log.info("Readying state...")
+    async def try_expand_pool(self) -> discord.Channel:
+        # Only expand if it's enabled and we haven't hit the cap.
+        if self.num_dynamic_channels >= self.max_dynamic_channels:
+            return None
+        channel_key = self.get_next_dynamic_channel_key()
+        now = self.now()
+        # Create the channel directly in the hoisted state, rather than editing
+        # it afterwards, to save an update.
+        name = self.hoisted_state.format_name(key=channel_key, channel=None)
+        topic = self.hoisted_state.format_description(channel=None)
+        topic += f"\n\n{CHANNEL_TOPIC_TIMESTAMP_PREFIX}{now.strftime(CHANNEL_TOPIC_TIMESTAMP_FORMAT)}"
+        topic += f"\n\n{CHANNEL_TOPIC_DYNAMIC_PREFIX}{channel_key}"
+        try:
+            data = await self.bot.create_text_channel(
+                self.server,
+                name=name,
+                topic=topic,
+                category=self.hoisted_state.category,
+                template=self.template_channel,
+            )
+        except:
+            self.log.exception(f"Failed to create dynamic channel {channel_key}:")
+            return None
+        channel = await self.bot.wait_for_channel(data["id"])
+        if not channel:
+            self.log.error(f"Created dynamic channel {channel_key} but never saw it.")
+            return None
+        self.add_channel(channel, channel_key, dynamic=True)
+        self.low_load_since = None
+        self.log.info(f"Expanded pool with dynamic channel: {channel}")
+        await self.log_to_channel(
+            emoji=self.log_expanded_emoji,
+            description=f"Created {channel.mention} because no channels were available ({self.num_dynamic_channels}/{self.max_dynamic_channels} dynamic)",
+            color=self.log_expanded_color,
+        )
+        await self.maybe_send_prompt_message(channel)
+        return channel
+
+    def is_pool_under_used(self) -> bool:
+        # The pool is under-used when, even without the dynamic channels, there
+        # would be enough free channels to meet the hoisting target.
+        num_free_static = len(
+            [
+                ch
+                for ch in self.channels
+                if not self.is_channel_dynamic(ch)
+                and (self.is_channel_hoisted(ch) or self.is_channel_answered(ch))
+            ]
+        )
+        return num_free_static >= max(1, self.target_hoisted_channels)
+
+    async def maybe_contract_pool(self):
+        if not self.num_dynamic_channels:
+            self.low_load_since = None
+            return
+        now = self.now()
+        if not self.is_pool_under_used():
+            self.low_load_since = None
+            return
+        if not self.low_load_since:
+            self.low_load_since = now
+        if now < self.low_load_since + self.delta_until_retire:
+            return
+        # Retire one free dynamic channel per poll, preferring answered ones.
+        for state in (self.answered_state, self.hoisted_state):
+            for channel in self.get_dynamic_channels():
+                if self.is_channel(channel, state):
+                    await self.retire_channel(channel)
+                    return
+
+    async def retire_channel(self, channel: discord.Channel):
+        try:
+            await self.bot.delete_channel(channel)
+        except:
+            self.log.exception(f"Failed to delete dynamic channel: {channel}")
+            return
+        self.remove_channel(channel)
+        self.log.info(f"Retired dynamic channel: {channel}")
+        await self.log_to_channel(
+            emoji=self.log_retired_emoji,
+            description=f"Retired #{channel.name} after sustained low load ({self.num_dynamic_channels}/{self.max_dynamic_channels} dynamic)",
+            color=self.log_retired_color,
+        )
+
+    async def preemptively_cache(self, channels: typing.List[discord.Channel]):
         # Add the latest X messages from every channel into the client cache
         # so that discord.py will care about any reactions applied to them.
         # We do this so that emoji actions on recent messages will be seen.
+        # The same messages seed the channel histories, which are maintained
+        # by events from here on out.
         try:
+            started_at = time.perf_counter()
             messages_to_cache = await self.bot.get_latest_messages(
-                self.channels, limit=self.preemptive_cache_size
+                channels,
+                limit=self.history_size,
+                concurrency=self.preemptive_cache_concurrency,
             )
-            self.bot.connection.messages.extend(messages_to_cache)
+            num_cached = self.bot.cache_messages(messages_to_cache)
+            self.seed_channel_history(messages_to_cache, channels=channels)
+            elapsed = time.perf_counter() - started_at
             self.log.info(
-                f"Preemptively cached the {self.preemptive_cache_size} most recent messages across {len(self.channels)} managed channels. ({len(messages_to_cache)} total)"
+                f"Preemptively cached the {self.history_size} most recent messages across {len(channels)} managed channels in {elapsed:.2f}s. ({len(messages_to_cache)} fetched, {num_cached} newly cached)"
             )
         except:
             self.log.exception("Failed to cache messages preemptively:")
+
+    async def on_ready(self):
+        self.log.info("Readying state...")
+        self.stats.start(self.now())
+        await self.preemptively_cache(self.channels)
         # Sync all channels. Avoid resetting them and triggerring their cooldown immediately.
         await self.sync_all()
         # Let people know we're ready.
@@ -1417,97 +1959,157 @@ class HelpChatServerState:
             color=self.bot.color_from_hex("#272A2D"),
         )
 
+    def get_changed_styles(
+        self, changed_options: typing.Set[str]
+    ) -> typing.Set[str]:
+        # Figure out which channel states look different under the new options.
+        if "persist_asker" in changed_options:
+            return set(CHANNEL_STATE_NAMES)
+        changed_styles = set()
+        for state_name in CHANNEL_STATE_NAMES:
+            # Ducked channels live in the busy category.
+            category_name = "busy" if state_name == "ducked" else state_name
+            style_options = (
+                f"{state_name}_emoji",
+                f"{state_name}_name",
+                f"{state_name}_description",
+                f"{category_name}_category",
+            )
+            if changed_options.intersection(style_options):
+                changed_styles.add(state_name)
+        return changed_styles
+
+    async def adopt(self, old: "HelpChatServerState"):
+        # Take over from an older state object for the same server, keeping
+        # everything that's still valid instead of starting from scratch.
+        self.log.info("Adopting previous state...")
+        old_options = old.options or {}
+        new_options = self.options or {}
+        changed_options = {
+            key
+            for key in set(old_options) | set(new_options)
+            if old_options.get(key) != new_options.get(key)
+        }
+        self.log.info(
+            f"Changed options: {', '.join(sorted(changed_options)) or 'none'}"
+        )
+        # Carry over per-channel caches for channels we're keeping.
+        new_channels = []
+        for channel in self.channels:
+            old_history = old.get_channel_history(channel)
+            if old_history and old_history.seeded:
+                self.channel_history[channel.id] = old_history.resized(
+                    self.history_size
+                )
+                if channel.id in old.throttle_notif_cache:
+                    self.throttle_notif_cache[channel.id] = old.throttle_notif_cache[
+                        channel.id
+                    ]
+            else:
+                new_channels.append(channel)
+        removed_channels = [ch for ch in old.channels if ch not in self.channel_map]
+        # Carry over timers and anything still waiting to happen.
+        old.hoisting_rate.window = self.hoisting_rate.window
+        old.hoisting_rate.alpha = self.hoisting_rate.alpha
+        self.hoisting_rate = old.hoisting_rate
+        self.stats.adopt(old.stats)
+        self.last_target_hoisted_channels = old.last_target_hoisted_channels
+        self.low_load_since = old.low_load_since
+        for channel_id, state_name in old.pending_restyles.items():
+            self.pending_restyles.setdefault(channel_id, state_name)
+        # Restyle channels whose current state looks different now. This has to
+        # be based on the old state, since emoji may have changed, and it has to
+        # happen before anything awaits, or those channels would match no state.
+        changed_styles = self.get_changed_styles(changed_options)
+        if changed_styles:
+            for channel in self.channels:
+                for state_name in changed_styles:
+                    if getattr(old, f"{state_name}_state").matches(channel):
+                        self.pending_restyles[channel.id] = state_name
+                        break
+        # Channels whose key changed are named after the old one.
+        for channel in self.channels:
+            old_key = old.get_channel_key(channel)
+            if old_key is not None and old_key != self.get_channel_key(channel):
+                old_state_name = old.get_channel_state_name(
+                    old.get_channel_state(channel)
+                )
+                if old_state_name:
+                    self.pending_restyles.setdefault(channel.id, old_state_name)
+        # Only fetch history for channels we haven't seen before.
+        if new_channels:
+            await self.preemptively_cache(new_channels)
+        await self.sync_restyles()
+        # Keep positions and the hoisted pool in line with the new options.
+        if new_channels or removed_channels:
+            await self.sync_channel_positions()
+        await self.sync_hoisted_channels()
+        self.log.info(
+            f"Adopted previous state: {len(new_channels)} channels added, {len(removed_channels)} removed, {len(changed_styles)} states restyled."
+        )
+        await self.log_to_channel(
+            emoji="👍",
+            description="Help-chat reload complete!",
+            color=self.bot.color_from_hex("#272A2D"),
+        )
+
+    async def sync_restyles(self):
+        # Apply restyles that were waiting on throttling, if it's time yet.
+        for channel_id, state_name in list(self.pending_restyles.items()):
+            channel = self.bot.get_channel(channel_id)
+            if channel not in self.channel_map:
+                del self.pending_restyles[channel_id]
+                continue
+            try:
+                await self.restyle_channel(
+                    channel, getattr(self, f"{state_name}_state")
+                )
+            except ChannelUpdateTooSoon:
+                pass
+
     async def on_reaction(self, reaction: discord.Reaction, reactor: discord.Member):
+        # Only the first reaction of each action emoji does anything. Relocating
+        # works in *any* channel; everything else needs a *managed* channel.
+        reaction_handler = self.reaction_handlers.get(reaction.emoji)
+        if not reaction_handler or reaction.count != 1:
+            return
         message: discord.Message = reaction.message
         channel: discord.Channel = message.channel
         author: discord.Member = message.author
-        # @@ RELOCATE
-        # On the first reaction to a *human* message in *any* channel.
-        if (
-            reaction.emoji == self.relocate_emoji
-            and reaction.count == 1
-            and author != self.bot.user
-        ):
-            await self.do_relocate(channel, message, reactor, reaction=reaction)
-        # @@ REASSIGN
-        # On the first reaction to a *human* message in a *managed* channel.
-        elif (
-            reaction.emoji == self.reassign_emoji
-            and reaction.count == 1
-            and author != self.bot.user
-            and channel in self.channels
-        ):
-            await self.do_reassign(channel, message, reactor, reaction=reaction)
-        # @@ RESOLVE
-        # On the first reaction to a *recent* message in a *managed* channel.
-        elif (
-            reaction.emoji == self.resolve_emoji
-            and reaction.count == 1
-            and channel in self.channels
-            and await self.bot.is_latest_message(
-                message, limit=self.preemptive_cache_size
-            )
-        ):
-            await self.do_resolve(channel, message, reactor, reaction=reaction)
-        # @@ REMIND
-        # On the first reaction to a *human* message in a *managed* channel.
-        elif (
-            reaction.emoji == self.remind_emoji
-            and reaction.count == 1
-            and author != self.bot.user
-            and channel in self.channels
-        ):
-            await self.do_remind(channel, message, reactor, reaction=reaction)
-        # @@ RENAME
-        # On the first reaction to *any* message in a *managed* channel.
-        elif (
-            reaction.emoji == self.rename_emoji
-            and reaction.count == 1
-            and channel in self.channels
-        ):
-            await self.do_rename(channel, message, reactor, reaction=reaction)
-        # @@ RESTORE
-        # On the first reaction to any message in a managed channel.
-        elif (
-            reaction.emoji == self.restore_emoji
-            and reaction.count == 1
-            and channel in self.channels
+        if reaction_handler.managed and channel.id not in self.managed_channel_ids:
+            return
+        # Some actions only apply to *human* messages.
+        if reaction_handler.human and author == self.bot.user:
+            return
+        # And some only to *recent* messages.
+        if reaction_handler.recent and not await self.is_latest_message(
+            message, limit=self.preemptive_cache_size
         ):
-            await self.do_restore(channel, message, reactor, reaction=reaction)
+            return
+        await reaction_handler.handler(channel, message, reactor, reaction=reaction)
 
     async def on_message(self, message: discord.Message):
         channel: discord.Channel = message.channel
         author: discord.Member = message.author
-        # Some actions may vary depending on the prior channel state.
-        prior_state: ChannelState = self.get_channel_state(channel)
         # Unlike with reactions, we only care about managed channels here.
-        if channel in self.channels:
-            # @@ RESOLVE
-            # Only when the message contains exactly the resolve emoji.
-            if message.content == str(self.resolve_emoji):
-                await self.do_resolve(channel, message, author)
-            # @@ REMIND
-            # Only when the message contains exactly the remind emoji.
-            elif message.content == str(self.remind_emoji):
-                await self.do_remind(channel, message, author)
-            # @@ RENAME
-            # Only when the message contains exactly the rename emoji.
-            elif message.content == str(self.rename_emoji):
-                await self.do_rename(channel, message, author)
-            # @@ RESTORE
-            # Only when the message contains exactly the restore emoji.
-            elif message.content == str(self.restore_emoji):
-                await self.do_restore(channel, message, author)
-            # @@ DUCK
-            # Only when the message contains exactly the ducked emoji.
-            elif message.content == str(self.ducked_emoji):
-                await self.maybe_duck_channel(channel, message)
+        if channel.id in self.managed_channel_ids:
+            self.stats.record_message(channel.id, author.id, self.now())
+            # Some actions may vary depending on the prior channel state.
+            prior_state: ChannelState = self.get_channel_state(channel)
+            # @@ RESOLVE, REMIND, RENAME, RESTORE, DUCK
+            # Only when the message contains exactly the action emoji.
+            handler = self.message_handlers.get(message.content)
+            if handler:
+                await handler(channel, message, author)
             # @@ MESSAGE: HOISTED
             # Update asker, change to busy, and log.
             elif prior_state == self.hoisted_state:
                 try:
                     await self.set_channel_busy(
-                        channel, ignore_throttling=True, asker=author
+                        channel,
+                        ignore_throttling=True,
+                        asker=author,
+                        asked_at=self.now(),
                     )
                     await self.log_to_channel(
                         emoji=self.log_busied_from_hoisted_emoji,
@@ -1563,7 +2165,7 @@ class HelpChatServerState:
         channel: discord.Channel = message.channel
         author: discord.Member = message.author
         # Again, we only care about managed channels here.
-        if channel in self.channels:
+        if channel.id in self.managed_channel_ids:
             # Furthermore, we only care about busy/idle channels.
             if self.is_channel_busy(channel) or self.is_channel_idle(channel):
                 # Do we need to nag the user about resolving the channel first?
@@ -1598,4 +2200,13 @@ class HelpChatServerState:
                     )
 
     async def destroy(self) -> bool:
-        return self.stop_polling_task()
+        # Don't lose any log entries that were still waiting for a digest.
+        if self.log_digest_task and not self.log_digest_task.done():
+            self.log_digest_task.cancel()
+        try:
+            await self.flush_log_digest()
+        except:
+            self.log.exception("Failed to flush log digest:")
+            return False
+        self.stats.close()
+        return True
@@ -0,0 +1,290 @@
+import collections
+import json
+import logging
+import sqlite3
+import typing
+from datetime import datetime, timedelta
+
+from cogbot.types import ChannelId, UserId
+
+log = logging.getLogger(__name__)
+
+# Keep a day's worth of per-minute buckets in memory by default.
+STATS_RETENTION = 1440
+STATS_WINDOW = "1h"
+
+WINDOW_UNITS = {"m": 1, "h": 60, "d": 1440}
+
+# Anything longer than this is almost certainly a typo.
+MAX_WINDOW_MINUTES = 366 * 1440
+
+
+def parse_window(window: str) -> timedelta:
+    """ Parse a window like `90`, `30m`, `6h` or `1d`; bare numbers are minutes. """
+    window = window.strip().lower()
+    unit = window[-1:]
+    if unit in WINDOW_UNITS:
+        minutes = float(window[:-1]) * WINDOW_UNITS[unit]
+    else:
+        minutes = float(window)
+    # This also catches `nan`, which compares false to everything.
+    if not (0 < minutes <= MAX_WINDOW_MINUTES):
+        raise ValueError(f"Window must be positive and at most a year: {window}")
+    return timedelta(minutes=minutes)
+
+
+class HelpChatStatsBucket:
+    def __init__(self, minute: datetime):
+        self.minute: datetime = minute
+        self.questions: int = 0
+        self.resolutions: int = 0
+        self.throttles: int = 0
+        # Samples, in seconds.
+        self.first_response_times: typing.List[float] = []
+        self.resolve_times: typing.List[float] = []
+        self.state_durations: typing.Dict[str, typing.List[float]] = {}
+
+    def to_row(self) -> tuple:
+        return (
+            self.minute.isoformat(),
+            self.questions,
+            self.resolutions,
+            self.throttles,
+            json.dumps(self.first_response_times),
+            json.dumps(self.resolve_times),
+            json.dumps(self.state_durations),
+        )
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "HelpChatStatsBucket":
+        bucket = cls(datetime.strptime(row[0], "%Y-%m-%dT%H:%M:%S"))
+        bucket.questions, bucket.resolutions, bucket.throttles = row[1:4]
+        bucket.first_response_times = json.loads(row[4])
+        bucket.resolve_times = json.loads(row[5])
+        bucket.state_durations = json.loads(row[6])
+        return bucket
+
+
+class HelpChatChannelStats:
+    def __init__(self):
+        self.state_name: str = None
+        self.state_since: datetime = None
+        self.asker_id: UserId = None
+        self.asked_at: datetime = None
+        self.responded: bool = False
+
+
+class HelpChatStatsSummary:
+    def __init__(
+        self,
+        window: timedelta,
+        covered: timedelta,
+        buckets: typing.List[HelpChatStatsBucket],
+    ):
+        self.window: timedelta = window
+        # How much of the window there are stats for, which may be less.
+        self.covered: timedelta = covered
+        self.minutes: int = int(covered.total_seconds() // 60)
+        self.questions: int = sum(b.questions for b in buckets)
+        self.resolutions: int = sum(b.resolutions for b in buckets)
+        self.throttles: int = sum(b.throttles for b in buckets)
+        self.first_response_times: typing.List[float] = [
+            t for b in buckets for t in b.first_response_times
+        ]
+        self.resolve_times: typing.List[float] = [
+            t for b in buckets for t in b.resolve_times
+        ]
+        self.state_durations: typing.Dict[str, typing.List[float]] = {}
+        for bucket in buckets:
+            for state_name, durations in bucket.state_durations.items():
+                self.state_durations.setdefault(state_name, []).extend(durations)
+
+    @property
+    def questions_per_hour(self) -> float:
+        hours = self.covered.total_seconds() / 3600
+        return self.questions / hours if hours else 0.0
+
+
+class HelpChatStats:
+    """
+    Per-minute help-chat statistics for one server, kept in a fixed-size ring
+    and optionally rolled up into a local SQLite database as each minute ends.
+    Summaries reach back into the database for anything older than the ring.
+    """
+
+    def __init__(self, retention: int = STATS_RETENTION, database: str = None):
+        self.buckets: typing.Deque[HelpChatStatsBucket] = collections.deque(
+            maxlen=retention
+        )
+        self.channels: typing.Dict[ChannelId, HelpChatChannelStats] = {}
+        # When collecting began, to know how much of a window is covered.
+        self.started_at: datetime = None
+        self.database: str = database
+        self.connection: sqlite3.Connection = None
+        if self.database:
+            self.open_database()
+
+    def open_database(self):
+        try:
+            self.connection = sqlite3.connect(self.database)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS helpchat_stats ("
+                " minute TEXT PRIMARY KEY,"
+                " questions INTEGER,"
+                " resolutions INTEGER,"
+                " throttles INTEGER,"
+                " first_response_times TEXT,"
+                " resolve_times TEXT,"
+                " state_durations TEXT"
+                ")"
+            )
+            self.connection.commit()
+        except:
+            log.exception(f"Failed to open stats database: {self.database}")
+            self.connection = None
+
+    def close(self):
+        if self.buckets:
+            self.rollup(self.buckets[-1])
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def start(self, now: datetime):
+        if self.started_at is None:
+            self.started_at = now
+
+    def adopt(self, old: "HelpChatStats"):
+        # Keep collecting where the old stats object left off.
+        self.buckets.extend(old.buckets)
+        self.channels.update(old.channels)
+        self.started_at = old.started_at or self.started_at
+
+    def rollup(self, bucket: HelpChatStatsBucket):
+        if not self.connection:
+            return
+        try:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO helpchat_stats VALUES (?, ?, ?, ?, ?, ?, ?)",
+                bucket.to_row(),
+            )
+            self.connection.commit()
+        except:
+            log.exception("Failed to roll up stats:")
+
+    def get_bucket(self, now: datetime) -> HelpChatStatsBucket:
+        minute = now.replace(second=0, microsecond=0)
+        self.start(minute)
+        if not self.buckets or self.buckets[-1].minute < minute:
+            # The previous minute is done; persist it before moving on.
+            if self.buckets:
+                self.rollup(self.buckets[-1])
+            self.buckets.append(HelpChatStatsBucket(minute))
+        return self.buckets[-1]
+
+    def get_channel(self, channel_id: ChannelId) -> HelpChatChannelStats:
+        channel_stats = self.channels.get(channel_id)
+        if not channel_stats:
+            channel_stats = HelpChatChannelStats()
+            self.channels[channel_id] = channel_stats
+        return channel_stats
+
+    def forget_channel(self, channel_id: ChannelId):
+        self.channels.pop(channel_id, None)
+
+    def record_transition(self, channel_id: ChannelId, state_name: str, now: datetime):
+        channel_stats = self.get_channel(channel_id)
+        # Close out the time spent in the previous state.
+        if channel_stats.state_name and channel_stats.state_name != state_name:
+            duration = (now - channel_stats.state_since).total_seconds()
+            bucket = self.get_bucket(now)
+            bucket.state_durations.setdefault(channel_stats.state_name, []).append(
+                duration
+            )
+        if channel_stats.state_name != state_name:
+            channel_stats.state_name = state_name
+            channel_stats.state_since = now
+
+    def record_question(self, channel_id: ChannelId, asker_id: UserId, now: datetime):
+        channel_stats = self.get_channel(channel_id)
+        channel_stats.asker_id = asker_id
+        channel_stats.asked_at = now
+        channel_stats.responded = False
+        self.get_bucket(now).questions += 1
+
+    def record_message(self, channel_id: ChannelId, author_id: UserId, now: datetime):
+        # The first message from anyone but the asker counts as a response.
+        channel_stats = self.channels.get(channel_id)
+        if (
+            channel_stats
+            and channel_stats.asked_at
+            and not channel_stats.responded
+            and author_id != channel_stats.asker_id
+        ):
+            channel_stats.responded = True
+            self.get_bucket(now).first_response_times.append(
+                (now - channel_stats.asked_at).total_seconds()
+            )
+
+    def record_resolution(self, channel_id: ChannelId, now: datetime):
+        channel_stats = self.channels.get(channel_id)
+        bucket = self.get_bucket(now)
+        bucket.resolutions += 1
+        if channel_stats and channel_stats.asked_at:
+            bucket.resolve_times.append((now - channel_stats.asked_at).total_seconds())
+            channel_stats.asked_at = None
+
+    def record_throttle(self, now: datetime):
+        self.get_bucket(now).throttles += 1
+
+    def get_oldest_stored_minute(self) -> typing.Optional[datetime]:
+        if not self.connection:
+            return None
+        try:
+            (minute,) = self.connection.execute(
+                "SELECT MIN(minute) FROM helpchat_stats"
+            ).fetchone()
+        except:
+            log.exception("Failed to read stats:")
+            return None
+        if minute:
+            return datetime.strptime(minute, "%Y-%m-%dT%H:%M:%S")
+
+    def load_buckets(
+        self, since: datetime, until: datetime = None
+    ) -> typing.List[HelpChatStatsBucket]:
+        if not self.connection:
+            return []
+        query = "SELECT * FROM helpchat_stats WHERE minute >= ?"
+        params = [since.replace(second=0, microsecond=0).isoformat()]
+        if until:
+            query += " AND minute < ?"
+            params.append(until.isoformat())
+        try:
+            rows = self.connection.execute(query + " ORDER BY minute", params)
+            return [HelpChatStatsBucket.from_row(row) for row in rows]
+        except:
+            log.exception("Failed to read stats:")
+            return []
+
+    def get_covered_since(self) -> typing.Optional[datetime]:
+        # The earliest moment there are stats for, in memory or on disk.
+        covered_since = self.started_at
+        if self.buckets and len(self.buckets) == self.buckets.maxlen:
+            # The ring has started dropping minutes; only the database has them.
+            covered_since = self.buckets[0].minute
+        stored_since = self.get_oldest_stored_minute()
+        if stored_since and (covered_since is None or stored_since < covered_since):
+            covered_since = stored_since
+        return covered_since
+
+    def summarize(self, window: timedelta, now: datetime) -> HelpChatStatsSummary:
+        since = now - window
+        buckets = [b for b in self.buckets if b.minute >= since]
+        # Anything older than the ring has to come from the database.
+        oldest = self.buckets[0].minute if self.buckets else None
+        if oldest is None or oldest > since:
+            buckets = self.load_buckets(since, until=oldest) + buckets
+        covered_since = self.get_covered_since() or now
+        covered = max(timedelta(), now - max(since, covered_since))
+        return HelpChatStatsSummary(window, covered, buckets)
@@ -0,0 +1,84 @@
+import math
+import typing
+from datetime import datetime, timedelta
+
+from cogbot.types import ChannelId
+
+
+class HoistingRateTracker:
+    """
+    Keeps exponentially-weighted moving averages of question arrivals and
+    resolution times, plus an hour-of-day profile of arrivals so that demand
+    can be anticipated before it happens.
+    """
+
+    def __init__(self, window: int, alpha: float):
+        # Time constant of the arrival rate average, in seconds.
+        self.window: float = float(window)
+        # Weight of each new sample in the resolution time and hourly averages.
+        self.alpha: float = alpha
+        # Questions per second, as of the last arrival.
+        self._rate: float = 0.0
+        self._rate_at: datetime = None
+        # Seconds from being asked to being resolved.
+        self.resolution_time: float = None
+        # Questions per second for each hour of the (UTC) day.
+        self.hourly_rates: typing.List[float] = [0.0] * 24
+        # When each currently-open question was asked.
+        self.asked_at: typing.Dict[ChannelId, datetime] = {}
+
+    def get_rate(self, now: datetime) -> float:
+        """ Return the current arrival rate, in questions per second. """
+        if self._rate_at is None:
+            return 0.0
+        elapsed = max(0.0, (now - self._rate_at).total_seconds())
+        return self._rate * math.exp(-elapsed / self.window)
+
+    def get_rate_per_minute(self, now: datetime) -> float:
+        return 60 * self.get_rate(now)
+
+    def record_question(self, channel_id: ChannelId, now: datetime):
+        self._rate = self.get_rate(now) + 1 / self.window
+        self._rate_at = now
+        self.asked_at[channel_id] = now
+
+    def record_resolution(self, channel_id: ChannelId, now: datetime):
+        asked_at = self.asked_at.pop(channel_id, None)
+        if asked_at:
+            sample = (now - asked_at).total_seconds()
+            if self.resolution_time is None:
+                self.resolution_time = sample
+            else:
+                self.resolution_time += self.alpha * (sample - self.resolution_time)
+
+    def update_profile(self, now: datetime):
+        # Fold the current rate into this hour's slot of the daily profile.
+        hourly_rate = self.hourly_rates[now.hour]
+        self.hourly_rates[now.hour] = hourly_rate + self.alpha * (
+            self.get_rate(now) - hourly_rate
+        )
+
+    def get_expected_rate(self, now: datetime, lookahead: timedelta) -> float:
+        # Take whichever is higher: what we're seeing right now, or what we
+        # usually see at the time of day we're getting ready for.
+        upcoming_hour = (now + lookahead).hour
+        return max(self.get_rate(now), self.hourly_rates[upcoming_hour])
+
+    def get_target(
+        self,
+        now: datetime,
+        horizon: timedelta,
+        num_channels: int,
+        min_target: int,
+        max_target: int,
+    ) -> int:
+        rate = self.get_expected_rate(now, horizon)
+        # Enough hoisted channels to absorb the questions we expect to arrive
+        # before the pool gets replenished again.
+        target = math.ceil(rate * horizon.total_seconds())
+        # But leave room for the questions that are still being discussed; by
+        # Little's law that's roughly the arrival rate times resolution time.
+        if self.resolution_time is not None:
+            expected_busy = math.ceil(rate * self.resolution_time)
+            target = min(target, num_channels - expected_busy)
+        return max(min_target, min(max_target, target))
@@ -0,0 +1,561 @@
+"""
+Discrete-event simulator for the help-chat hoisting policy.
+
+Drives a real `HelpChatServerState` with a fake bot and a fake clock, feeding it
+synthetic questions, replies, resolutions and deletions, so that policy options
+such as `seconds_until_idle`, `second_to_throttle` and the hoisted min/max can
+be benchmarked offline:
+
+    python -m cogbot.extensions.helpchat.simulator --options helpchat.json --hours 48
+
+The options file holds the same server options as the help-chat extension
+state; channels and categories are generated by the simulator itself. An
+optional `simulation` object in the same file configures the workload.
+"""
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import random
+import statistics
+import typing
+from datetime import datetime, timedelta
+
+import discord
+
+from cogbot.extensions.helpchat.help_chat_server_state import (
+    ChannelUpdateTooSoon,
+    HelpChatServerState,
+)
+from cogbot.lib.percentile import percentile
+
+log = logging.getLogger(__name__)
+
+SIMULATION_START = datetime(2020, 1, 6)
+
+
+class FakeClock:
+    def __init__(self, start: datetime = SIMULATION_START):
+        self.start: datetime = start
+        self.elapsed: float = 0.0
+
+    def __call__(self) -> datetime:
+        return self.start + timedelta(seconds=self.elapsed)
+
+    @property
+    def hours(self) -> float:
+        return self.elapsed / 3600
+
+
+class FakeUser:
+    def __init__(self, user_id: str, name: str):
+        self.id: str = user_id
+        self.name: str = name
+        self.roles: typing.List[discord.Role] = []
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeChannel:
+    def __init__(self, server: "FakeServer", channel_id: str, name: str):
+        self.server: FakeServer = server
+        self.id: str = channel_id
+        self.name: str = name
+        self.topic: str = None
+        self.position: int = 0
+        self.parent: FakeChannel = None
+        self.overwrites: list = []
+        self.messages: typing.List[FakeMessage] = []
+        # Bumped whenever a new question starts, so stale replies can be dropped.
+        self.session: int = 0
+
+    @property
+    def mention(self) -> str:
+        return f"<#{self.id}>"
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeServer:
+    def __init__(self):
+        self.id: str = "server"
+        self.name: str = "simulation"
+        self.channels_by_id: typing.Dict[str, FakeChannel] = {}
+        self.members_by_id: typing.Dict[str, FakeUser] = {}
+        self.roles: list = []
+        self.emojis: list = []
+
+    @property
+    def channels(self) -> typing.List[FakeChannel]:
+        return list(self.channels_by_id.values())
+
+    def get_member(self, user_id: str) -> FakeUser:
+        return self.members_by_id.get(user_id)
+
+
+class FakeMessage:
+    def __init__(
+        self,
+        message_id: str,
+        channel: FakeChannel,
+        author: FakeUser,
+        content: str,
+        timestamp: datetime,
+        embeds: typing.List[dict] = None,
+    ):
+        self.id: str = message_id
+        self.channel: FakeChannel = channel
+        self.server: FakeServer = channel.server
+        self.author: FakeUser = author
+        self.content: str = content
+        self.timestamp: datetime = timestamp
+        self.embeds: typing.List[dict] = embeds or []
+
+
+class FakeBot:
+    """ Just enough of `CogBot` to run help-chat, counting every API call. """
+
+    def __init__(self, clock: FakeClock, server: FakeServer):
+        self.clock: FakeClock = clock
+        self.server: FakeServer = server
+        self.user: FakeUser = FakeUser("bot", "cogbot")
+        self.is_closed: bool = False
+        self.connection = argparse.Namespace(messages=[])
+        self.state: HelpChatServerState = None
+        self.api_calls: typing.Dict[str, int] = {}
+        self._ids = itertools.count(1)
+
+    def _count(self, route: str):
+        self.api_calls[route] = self.api_calls.get(route, 0) + 1
+
+    def next_id(self) -> str:
+        return str(next(self._ids))
+
+    def color_from_hex(self, color: str) -> discord.Color:
+        return discord.Color(int(f"0x{color[1:]}", base=16))
+
+    def get_emoji(self, server: FakeServer, emoji: str):
+        return emoji
+
+    def get_role(self, server: FakeServer, role_id: str):
+        return None
+
+    def get_channel(self, channel_id: str) -> FakeChannel:
+        return self.server.channels_by_id.get(channel_id)
+
+    def make_message_link(self, message: FakeMessage) -> str:
+        return f"https://discordapp.com/channels/{message.server.id}/{message.channel.id}/{message.id}"
+
+    async def deliver(self, message: FakeMessage):
+        # What the gateway and the help-chat cog would do with a new message.
+        message.channel.messages.append(message)
+        self.state.record_message(message)
+        if message.author != self.user:
+            await self.state.on_message(message)
+
+    async def send_message(self, destination, content: str = None, embed=None):
+        self._count("send_message")
+        message = FakeMessage(
+            self.next_id(),
+            destination,
+            self.user,
+            content or "",
+            self.clock(),
+            embeds=[embed.to_dict()] if embed else None,
+        )
+        await self.deliver(message)
+        return message
+
+    async def edit_channel(
+        self,
+        channel: FakeChannel,
+        name: str = None,
+        topic: str = None,
+        position: int = None,
+        category: FakeChannel = None,
+    ):
+        self._count("edit_channel")
+        if name is not None:
+            channel.name = name
+        if topic is not None:
+            channel.topic = topic
+        if position is not None:
+            channel.position = position
+        if category is not None:
+            channel.parent = category
+
+    async def create_text_channel(
+        self,
+        server: FakeServer,
+        name: str,
+        topic: str = None,
+        category: FakeChannel = None,
+        **options,
+    ) -> dict:
+        self._count("create_channel")
+        channel = FakeChannel(server, f"dynamic-{self.next_id()}", name)
+        channel.topic = topic
+        channel.parent = category
+        server.channels_by_id[channel.id] = channel
+        return {"id": channel.id}
+
+    async def wait_for_channel(self, channel_id: str, **kwargs) -> FakeChannel:
+        return self.get_channel(channel_id)
+
+    async def delete_channel(self, channel: FakeChannel):
+        self._count("delete_channel")
+        self.server.channels_by_id.pop(channel.id, None)
+
+    async def add_reaction(self, message: FakeMessage, emoji):
+        self._count("add_reaction")
+
+    async def remove_reaction(self, message: FakeMessage, emoji, member: FakeUser):
+        self._count("remove_reaction")
+
+    async def add_roles(self, member: FakeUser, *roles):
+        self._count("add_roles")
+
+    async def remove_roles(self, member: FakeUser, *roles):
+        self._count("remove_roles")
+
+    async def get_latest_message(self, channel: FakeChannel) -> FakeMessage:
+        self._count("logs_from")
+        if channel.messages:
+            return channel.messages[-1]
+
+    async def iter_latest_messages(
+        self, channels: typing.List[FakeChannel], limit: int = 1
+    ) -> typing.Iterable[FakeMessage]:
+        for channel in channels:
+            self._count("logs_from")
+            for message in reversed(channel.messages[-limit:]):
+                yield message
+
+    async def get_latest_messages(
+        self, channels: typing.List[FakeChannel], limit: int = 1, concurrency: int = 1
+    ) -> typing.List[FakeMessage]:
+        return [m async for m in self.iter_latest_messages(channels, limit=limit)]
+
+    def cache_messages(self, messages: typing.Iterable[FakeMessage]) -> int:
+        messages = list(messages)
+        self.connection.messages.extend(messages)
+        return len(messages)
+
+    async def is_latest_message(self, message: FakeMessage, limit: int = 1) -> bool:
+        self._count("logs_from")
+        return any(m.id == message.id for m in message.channel.messages[-limit:])
+
+
+class SimulationOptions:
+    def __init__(self, **options):
+        # Length of the simulation, in hours.
+        self.hours: float = float(options.get("hours", 24))
+        # Questions per hour; either a constant or 24 values, one per hour.
+        arrivals = options.get("arrivals_per_hour", 6)
+        self.arrivals_per_hour: typing.List[float] = (
+            [float(a) for a in arrivals]
+            if isinstance(arrivals, list)
+            else [float(arrivals)] * 24
+        )
+        # Number of channels to generate for the pool.
+        self.num_channels: int = int(options.get("num_channels", 10))
+        # Mean number of follow-up messages per question.
+        self.replies_per_question: float = float(
+            options.get("replies_per_question", 8)
+        )
+        # Mean number of seconds between follow-up messages.
+        self.seconds_between_replies: float = float(
+            options.get("seconds_between_replies", 120)
+        )
+        # Chance that the asker marks their question as resolved.
+        self.resolve_probability: float = float(options.get("resolve_probability", 0.6))
+        # Chance that the asker deletes their question right after asking.
+        self.fake_out_probability: float = float(
+            options.get("fake_out_probability", 0.05)
+        )
+        # How long an asker waits for an ask-here channel before giving up.
+        self.seconds_to_give_up: float = float(options.get("seconds_to_give_up", 900))
+        # How often to sample channel utilization.
+        self.seconds_to_sample: float = float(options.get("seconds_to_sample", 60))
+        self.seed: int = options.get("seed")
+
+
+class SimulationMetrics:
+    def __init__(self):
+        self.questions: int = 0
+        self.gave_up: int = 0
+        self.fake_outs: int = 0
+        self.resolutions: int = 0
+        self.throttled: int = 0
+        self.time_to_hoisted: typing.List[float] = []
+        self.utilization: typing.List[float] = []
+        self.hoisted: typing.List[int] = []
+
+    def report(self, bot: FakeBot, clock: FakeClock) -> dict:
+        hours = clock.hours or 1
+        return {
+            "hours": clock.hours,
+            "questions": self.questions,
+            "gave_up": self.gave_up,
+            "fake_outs": self.fake_outs,
+            "resolutions": self.resolutions,
+            "time_to_hoisted_mean": statistics.mean(self.time_to_hoisted)
+            if self.time_to_hoisted
+            else None,
+            "time_to_hoisted_p50": percentile(self.time_to_hoisted, 0.5),
+            "time_to_hoisted_p90": percentile(self.time_to_hoisted, 0.9),
+            "time_to_hoisted_max": max(self.time_to_hoisted)
+            if self.time_to_hoisted
+            else None,
+            "utilization_mean": statistics.mean(self.utilization)
+            if self.utilization
+            else None,
+            "hoisted_mean": statistics.mean(self.hoisted) if self.hoisted else None,
+            "edits_per_hour": bot.api_calls.get("edit_channel", 0) / hours,
+            "throttled_transitions": self.throttled,
+            "api_calls": dict(bot.api_calls),
+        }
+
+
+class Simulator:
+    def __init__(self, server_options: dict, options: SimulationOptions):
+        self.options: SimulationOptions = options
+        self.random = random.Random(options.seed)
+        self.clock = FakeClock()
+        self.server = FakeServer()
+        self.bot = FakeBot(self.clock, self.server)
+        self.metrics = SimulationMetrics()
+        self.events: typing.List[tuple] = []
+        self._seq = itertools.count()
+        self.waiting: typing.List[typing.Tuple[float, FakeUser]] = []
+        self.helper = self.make_member("helper")
+        self.state: HelpChatServerState = self.make_state(server_options)
+        self.bot.state = self.state
+
+    def make_member(self, name: str) -> FakeUser:
+        member = FakeUser(f"user-{self.bot.next_id()}", name)
+        self.server.members_by_id[member.id] = member
+        return member
+
+    def make_state(self, server_options: dict) -> HelpChatServerState:
+        options = dict(server_options)
+        # Generate the categories and the channel pool.
+        for category in ("hoisted", "busy", "idle", "pending", "answered"):
+            channel = FakeChannel(self.server, f"{category}-category", category)
+            self.server.channels_by_id[channel.id] = channel
+            options.setdefault(f"{category}_category", channel.id)
+        channels = []
+        for i in range(self.options.num_channels):
+            channel = FakeChannel(self.server, f"channel-{i}", f"channel-{i}")
+            channel.position = (i + 1) * 100
+            self.server.channels_by_id[channel.id] = channel
+            channels.append({"id": channel.id, "key": str(i + 1)})
+        options["channels"] = channels
+        options.setdefault("prompt_message", "Ask your question here!")
+        options.setdefault("min_hoisted_channels", 2)
+        options.setdefault("max_hoisted_channels", 3)
+        options["auto_poll"] = False
+        state = HelpChatServerState("simulator", self.bot, self.server, **options)
+        state.clock = self.clock
+        # Every channel starts out answered, with an old conversation in it.
+        long_ago = self.clock() - timedelta(days=1)
+        for channel in state.channels:
+            key = state.get_channel_key(channel)
+            channel.name = state.answered_state.format_name(key=key, channel=channel)
+            channel.messages.append(
+                FakeMessage(self.bot.next_id(), channel, self.helper, "...", long_ago)
+            )
+        # Count every transition that gets throttled.
+        set_channel = state.set_channel
+
+        async def counting_set_channel(*args, **kwargs):
+            try:
+                return await set_channel(*args, **kwargs)
+            except ChannelUpdateTooSoon:
+                self.metrics.throttled += 1
+                raise
+
+        state.set_channel = counting_set_channel
+        return state
+
+    def schedule(self, delay: float, callback: typing.Callable[[], typing.Awaitable]):
+        heapq.heappush(
+            self.events, (self.clock.elapsed + delay, next(self._seq), callback)
+        )
+
+    def arrival_rate(self, elapsed: float) -> float:
+        hour = int(elapsed // 3600) % 24
+        return self.options.arrivals_per_hour[hour] / 3600
+
+    def schedule_arrivals(self):
+        # Non-homogeneous Poisson arrivals, by thinning at the peak rate.
+        peak = max(self.options.arrivals_per_hour) / 3600
+        if peak <= 0:
+            return
+        end = self.options.hours * 3600
+        t = 0.0
+        while True:
+            t += self.random.expovariate(peak)
+            if t >= end:
+                break
+            if self.random.random() < self.arrival_rate(t) / peak:
+                heapq.heappush(self.events, (t, next(self._seq), self.on_arrival))
+
+    async def on_arrival(self):
+        asker = self.make_member("asker")
+        self.waiting.append((self.clock.elapsed, asker))
+        self.schedule(self.options.seconds_to_give_up, self.give_up_factory(asker))
+        await self.seat_waiting()
+
+    def give_up_factory(self, asker: FakeUser):
+        async def give_up():
+            for i, (_, waiting_asker) in enumerate(self.waiting):
+                if waiting_asker is asker:
+                    del self.waiting[i]
+                    self.metrics.gave_up += 1
+                    return
+
+        return give_up
+
+    async def seat_waiting(self):
+        while self.waiting:
+            channel = self.state.get_random_hoisted_channel()
+            if not channel:
+                return
+            arrived_at, asker = self.waiting.pop(0)
+            self.metrics.time_to_hoisted.append(self.clock.elapsed - arrived_at)
+            await self.ask(channel, asker)
+
+    async def post(self, channel: FakeChannel, author: FakeUser, content: str):
+        message = FakeMessage(
+            self.bot.next_id(), channel, author, content, self.clock()
+        )
+        await self.bot.deliver(message)
+        return message
+
+    async def ask(self, channel: FakeChannel, asker: FakeUser):
+        self.metrics.questions += 1
+        channel.session += 1
+        session = channel.session
+        question = await self.post(channel, asker, "How do I do the thing?")
+        # Some askers immediately think better of it.
+        if self.random.random() < self.options.fake_out_probability:
+            self.schedule(
+                self.random.uniform(5, 60), self.fake_out_factory(channel, question)
+            )
+            return
+        # Otherwise a discussion follows.
+        num_replies = int(self.random.expovariate(1 / self.options.replies_per_question))
+        delay = 0.0
+        for i in range(num_replies):
+            delay += self.random.expovariate(1 / self.options.seconds_between_replies)
+            author = self.helper if i % 2 == 0 else asker
+            self.schedule(delay, self.reply_factory(channel, session, author, "..."))
+        # And, maybe, a resolution.
+        if self.random.random() < self.options.resolve_probability:
+            delay += self.random.expovariate(1 / self.options.seconds_between_replies)
+            resolve = str(self.state.resolve_emoji)
+            self.schedule(delay, self.reply_factory(channel, session, asker, resolve))
+
+    def reply_factory(
+        self, channel: FakeChannel, session: int, author: FakeUser, content: str
+    ):
+        async def reply():
+            # Drop replies to a conversation whose channel has moved on.
+            if channel.session != session:
+                return
+            if content == str(self.state.resolve_emoji):
+                self.metrics.resolutions += 1
+            await self.post(channel, author, content)
+
+        return reply
+
+    def fake_out_factory(self, channel: FakeChannel, message: FakeMessage):
+        async def fake_out():
+            self.metrics.fake_outs += 1
+            if message in channel.messages:
+                channel.messages.remove(message)
+            self.state.forget_message(message)
+            await self.state.on_message_delete(message)
+
+        return fake_out
+
+    async def poll(self):
+        await self.state.poll()
+        self.schedule(self.state.seconds_to_poll, self.poll)
+
+    async def sample(self):
+        channels = self.state.channels
+        in_use = [
+            ch
+            for ch in channels
+            if not (self.state.is_channel_hoisted(ch) or self.state.is_channel_answered(ch))
+        ]
+        self.metrics.utilization.append(len(in_use) / len(channels) if channels else 0)
+        self.metrics.hoisted.append(self.state.num_hoisted_channels)
+        self.schedule(self.options.seconds_to_sample, self.sample)
+
+    async def run(self) -> dict:
+        await self.state.on_ready()
+        self.schedule_arrivals()
+        self.schedule(self.state.seconds_to_poll, self.poll)
+        self.schedule(0, self.sample)
+        end = self.options.hours * 3600
+        while self.events:
+            at, _, callback = heapq.heappop(self.events)
+            if at > end:
+                break
+            self.clock.elapsed = at
+            try:
+                await callback()
+            except ChannelUpdateTooSoon:
+                pass
+            # A transition may have freed up a channel for whoever is waiting.
+            await self.seat_waiting()
+        self.clock.elapsed = end
+        return self.metrics.report(self.bot, self.clock)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--options", help="Help-chat server options file")
+    arg_parser.add_argument("--hours", type=float, help="Hours to simulate")
+    arg_parser.add_argument("--seed", type=int, help="Random seed")
+    arg_parser.add_argument("--output", help="Write the report to this file")
+    arg_parser.add_argument("--log", help="Log level", default="WARNING")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=args.log)
+
+    server_options = {}
+    if args.options:
+        with open(args.options, encoding="utf-8") as fp:
+            server_options = json.load(fp)
+    simulation_options = server_options.pop("simulation", {})
+    if args.hours is not None:
+        simulation_options["hours"] = args.hours
+    if args.seed is not None:
+        simulation_options["seed"] = args.seed
+
+    simulator = Simulator(server_options, SimulationOptions(**simulation_options))
+    loop = asyncio.get_event_loop()
+    report = loop.run_until_complete(simulator.run())
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            fp.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
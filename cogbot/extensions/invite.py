@@ -1,8 +1,7 @@
+import asyncio
 import itertools
-import json
 import logging
 import typing
-import urllib.request
 
 import discord
 from discord.ext import commands
@@ -27,26 +26,31 @@ class Invite:
         self.invites_by_server_id: typing.Dict[str, discord.Invite] = {}
         self.invites_by_tag: typing.Dict[str, typing.Set[discord.Invite]] = {}
 
-    async def reload_data(self):
+    async def reload_data(self, cached: bool = False):
         log.info('Reloading invites from: {}'.format(self.config.database))
 
-        response = urllib.request.urlopen(self.config.database)
-        content = response.read().decode('utf8')
-
+        # fetch and parse off the event loop
+        # if cached, start with the last snapshot and pick up changes later
         try:
-            data = json.loads(content)
+            data = await self.bot.datasets.load(
+                self.config.database, on_update=self.apply_data if cached else None)
         except Exception as e:
             raise CommandError('Failed to reload invites: {}'.format(e))
 
-        # dynamically reload servers using the invites
+        await self.apply_data(data)
+
+    async def apply_data(self, data: list):
+        # dynamically reload servers using the invites, all at once
+        results = await asyncio.gather(
+            *(self.bot.get_invite(raw_entry['invite']) for raw_entry in data),
+            return_exceptions=True)
+
         invites_by_server_id = {}
         invites_by_server_name = {}
         invites_by_tag = {}
-        for raw_entry in data:
+        for raw_entry, invite in zip(data, results):
             invite_url = raw_entry['invite']
-            try:
-                invite: discord.Invite = await self.bot.get_invite(invite_url)
-            except:
+            if isinstance(invite, Exception):
                 log.error(f'Failed to get invite for server at: {invite_url}')
                 continue
             server: discord.Server = invite.server
@@ -80,7 +84,7 @@ class Invite:
         return result
 
     async def on_ready(self):
-        await self.reload_data()
+        await self.reload_data(cached=True)
 
     @commands.group(pass_context=True, name='invite')
     async def cmd_invite(self, ctx: Context, *, tags: str = ''):
@@ -2,7 +2,6 @@ import logging
 import re
 import typing
 import urllib.parse
-import urllib.request
 from datetime import datetime
 from xml.etree import ElementTree
 
@@ -91,7 +90,7 @@ class Jira:
         self.bot = bot
         self.config = JiraConfig(**bot.state.get_extension_state(ext))
 
-    def fetch_report(self, base_url: str, report_project: str, report_id: int) -> JiraReport:
+    async def fetch_report(self, base_url: str, report_project: str, report_id: int) -> JiraReport:
         report_no = f'{report_project}-{report_id}'
 
         url = f'{base_url}/si/jira.issueviews:issue-xml/' \
@@ -99,8 +98,7 @@ class Jira:
 
         log.info(f'Requesting JIRA report XML from: {url}')
 
-        response = urllib.request.urlopen(url)
-        content = response.read().decode('utf8')
+        content = await self.bot.web.get_text(url)
 
         # access child 'channel' at index 0
         # and then access child 'item' at index 5
@@ -170,7 +168,7 @@ class Jira:
             versions=versions, fix_version=fix_version, votes=votes_int, watches=watches_int,
             category=category, priority=priority)
 
-    def get_report(self, query: str) -> typing.Optional[JiraReport]:
+    async def get_report(self, query: str) -> typing.Optional[JiraReport]:
         id_match = self.ID_PATTERN.match(query)
         bug_match = self.BUG_PATTERN.match(query)
         url_match = self.URL_PATTERN.match(query)
@@ -180,22 +178,22 @@ class Jira:
         if id_match:
             report_project = self.config.default_project
             report_id = id_match.groups()[0]
-            return self.fetch_report(base_url, report_project, report_id)
+            return await self.fetch_report(base_url, report_project, report_id)
 
         elif bug_match:
             report_project = str(bug_match.groups()[0]).upper()
             report_id = bug_match.groups()[1]
-            return self.fetch_report(base_url, report_project, report_id)
+            return await self.fetch_report(base_url, report_project, report_id)
 
         elif url_match:
             base_url = url_match.groups()[0]
             report_project = str(url_match.groups()[1]).upper()
             report_id = url_match.groups()[2]
-            return self.fetch_report(base_url, report_project, report_id)
+            return await self.fetch_report(base_url, report_project, report_id)
 
     @commands.command(pass_context=True, aliases=['mojira', 'bug'])
     async def jira(self, ctx: Context, *, query: str):
-        report = self.get_report(query)
+        report = await self.get_report(query)
         
         if report:
             favicon_url = f'{report.base_url}/favicon.png'
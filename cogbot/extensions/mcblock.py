@@ -1,7 +1,5 @@
-import json
 import logging
 import typing
-import urllib.request
 
 from discord.ext import commands
 from discord.ext.commands import CommandError, Context
@@ -43,17 +41,7 @@ class McBlock:
         self.config = McBlockConfig(**options)
         self.block_map: BlockMap = {}
 
-    def reload_data(self):
-        log.info('Reloading blocks from: {}'.format(self.config.database))
-
-        response = urllib.request.urlopen(self.config.database)
-        content = response.read().decode('utf8')
-
-        try:
-            data = json.loads(content)
-        except Exception as e:
-            raise CommandError('Failed to reload blocks: {}'.format(e))
-
+    def build_block_map(self, data: dict) -> BlockMap:
         block_map: BlockMap = {}
         for block_name, block_obj in data.items():
             raw_properties = block_obj.get('properties', {})
@@ -63,13 +51,29 @@ class McBlock:
                 name=block_name,
                 properties=block_properties
             )
+        return block_map
 
+    def apply_block_map(self, block_map: BlockMap):
         self.block_map = block_map
 
-        log.info('Successfully reloaded {} blocks'.format(len(data)))
+        log.info('Successfully reloaded {} blocks'.format(len(block_map)))
+
+    async def reload_data(self, cached: bool = False):
+        log.info('Reloading blocks from: {}'.format(self.config.database))
+
+        # fetch, parse and index off the event loop
+        # if cached, start with the last snapshot and pick up changes later
+        try:
+            block_map = await self.bot.datasets.load(
+                self.config.database, build=self.build_block_map,
+                on_update=self.apply_block_map if cached else None)
+        except Exception as e:
+            raise CommandError('Failed to reload blocks: {}'.format(e))
+
+        self.apply_block_map(block_map)
 
     async def on_ready(self):
-        self.reload_data()
+        await self.reload_data(cached=True)
 
     def get_block(self, query: str) -> Block:
         return self.block_map.get(query) or self.block_map.get('minecraft:' + query)
@@ -97,7 +101,7 @@ class McBlock:
     @commands.command(pass_context=True, name='blockreload', hidden=True)
     async def cmd_invitereload(self, ctx: Context):
         try:
-            self.reload_data()
+            await self.reload_data()
             await self.bot.react_success(ctx)
         except:
             await self.bot.react_failure(ctx)
@@ -1,6 +1,4 @@
-import json
 import logging
-import urllib.request
 
 from cogbot import checks
 from cogbot.cog_bot import CogBot
@@ -27,7 +25,6 @@ class LegacyMinecraftCommands:
         options = bot.state.get_extension_state(ext)
         self.config = LegacyMinecraftCommandsConfig(**options)
         self.command_messages = {}
-        self._reload_commands()
 
     def _message_lines(self, cmd, data):
         yield '```'
@@ -59,22 +56,32 @@ class LegacyMinecraftCommands:
         else:
             yield f'See: <{self.config.command_page}#{cmd}>'
 
-    def _reload_commands(self):
+    def _build_command_messages(self, cmd_data: dict) -> dict:
+        return {cmd: '\n'.join(self._message_lines(cmd, data)) for cmd, data in cmd_data.items()}
+
+    def _apply_command_messages(self, command_messages: dict):
+        self.command_messages = command_messages
+
+        log.info(f'finished loading {len(command_messages)} commands')
+
+    async def _reload_commands(self, cached: bool = False):
         manifest = self.config.command_manifest
 
         log.info(f'reloading Minecraft commands from: {manifest}')
 
-        response = urllib.request.urlopen(manifest)
-        content = response.read().decode('utf8')
-
+        # fetch, parse and render off the event loop
+        # if cached, start with the last snapshot and pick up changes later
         try:
-            cmd_data = json.loads(content)
+            command_messages = await self.bot.datasets.load(
+                manifest, build=self._build_command_messages,
+                on_update=self._apply_command_messages if cached else None)
         except Exception as e:
-            raise CommandError(f'failed to load command manifest json: {e.args[0]}')
+            raise CommandError(f'failed to load command manifest json: {e}')
 
-        self.command_messages = {cmd: '\n'.join(self._message_lines(cmd, data)) for cmd, data in cmd_data.items()}
+        self._apply_command_messages(command_messages)
 
-        log.info(f'finished loading {len(cmd_data)} commands')
+    async def on_ready(self):
+        await self._reload_commands(cached=True)
 
     async def mcc(self, ctx: Context, command: str):
         if command not in self.command_messages:
@@ -83,7 +90,7 @@ class LegacyMinecraftCommands:
 
     async def mccreload(self, ctx: Context):
         try:
-            self._reload_commands()
+            await self._reload_commands()
             await self.bot.react_success(ctx)
         except:
             await self.bot.react_failure(ctx)
@@ -1,8 +1,7 @@
 import json
 import logging
 import typing
-import urllib.request
-
+import aiohttp
 import shlex
 import argparse
 
@@ -17,6 +16,7 @@ from datetime import datetime, timedelta
 
 from cogbot import checks
 from cogbot.cog_bot import CogBot
+from cogbot.web_client import WebError
 
 import math
 
@@ -145,37 +145,62 @@ class McNbtDoc:
         self.version_data = {}
         self.active_embeds: typing.Dict[discord.Server, typing.Dict[str, ActiveEmbed]] = {}
         self.last_poll: datetime = datetime.utcnow()
+        bot.caches.register('mcnbtdoc versions', lambda: len(self.version_data))
+        bot.caches.register(
+            'mcnbtdoc embeds',
+            lambda: sum(len(embeds) for embeds in self.active_embeds.values()),
+        )
+
+    def __unload(self):
+        self.bot.caches.unregister('mcnbtdoc versions')
+        self.bot.caches.unregister('mcnbtdoc embeds')
+
+    def apply_data(self, data):
+        self.data = data
+        self.version_data = {}
 
-    def reload_data(self):
+        log.info('Successfully reloaded NBT schemas')
+
+    def apply_registries(self, registries):
+        self.registries = registries
+
+        log.info('Successfully reloaded NBT registries')
+
+    async def reload_data(self, cached: bool = False):
         log.info('Reloading NBT schemas from: {}'.format(self.config.database))
 
-        response = urllib.request.urlopen(self.config.database)
-        mcregres = urllib.request.urlopen(self.config.registry_database)
+        # fetch and parse both off the event loop, at the same time
+        # if cached, start with the last snapshots and pick up changes later
         try:
-            self.data = json.loads(response.read().decode('utf8'))
-            self.registries = json.loads(mcregres.read().decode('utf8'))
-            self.version_data = {}
+            data, registries = await asyncio.gather(
+                self.bot.datasets.load(
+                    self.config.database,
+                    on_update=self.apply_data if cached else None),
+                self.bot.datasets.load(
+                    self.config.registry_database,
+                    on_update=self.apply_registries if cached else None)
+            )
         except Exception as e:
             raise CommandError('Failed to reload NBT schemas: {}'.format(e))
 
-        log.info('Successfully reloaded NBT schemas')
+        self.apply_data(data)
+        self.apply_registries(registries)
 
     async def on_ready(self):
-        self.reload_data()
+        await self.reload_data(cached=True)
 
     async def get_version(self, version: str, ctx: Context):
         if not version in self.version_data:
             log.info('Loading NBT schemas for version {}'.format(version))
             try:
                 url = self.config.versions.format(version)
-                res = urllib.request.urlopen(url)
-                self.version_data[version] = json.loads(res.read().decode('utf8'))
+                self.version_data[version] = await self.bot.datasets.load(url)
                 return True
             except json.JSONDecodeError as e:
                 await self.bot.add_reaction(ctx.message, u'❗')
                 raise CommandError('JSON decode error from loading schema at {}'.format(url))
-            except urllib.request.URLError as e:
-                log.error('URLError when loading schema at {}: {}'.format(url, e))
+            except (WebError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log.error('Error when loading schema at {}: {!r}'.format(url, e))
                 return False
         return True
 
@@ -412,7 +437,7 @@ class McNbtDoc:
     @commands.command(pass_context=True, name='nbtreload', hidden=True)
     async def cmd_nbtreload(self, ctx: Context):
         try:
-            self.reload_data()
+            await self.reload_data()
             await self.bot.react_success(ctx)
         except:
             await self.bot.react_failure(ctx)
@@ -1,3 +1,4 @@
+import io
 import sys
 
 import discord
@@ -8,11 +9,15 @@ from discord.ext.commands import Context
 import cogbot
 from cogbot import checks
 from cogbot.cog_bot import CogBot
+from cogbot.sampling_profiler import profile_loop
 
 
 class Status:
+    MAX_PROFILE_SECONDS = 120
+
     def __init__(self, bot: CogBot, ext: str):
         self.bot = bot
+        self.profiling = False
 
     @checks.is_manager()
     @commands.command(pass_context=True, name='status')
@@ -21,14 +26,111 @@ class Status:
 
         uptime = datetime.now() - self.bot.started_at
 
+        bot = self.bot
+        bot.metrics.collect()
+        rest_responses = bot.rest.responses
+
         rows = (
             ('python version', f'{pyv[0]}.{pyv[1]}.{pyv[2]}'),
             ('discord.py version', discord.__version__),
             ('cogbot version', cogbot.__version__),
-            ('started at', str(self.bot.started_at)),
+            ('started at', str(bot.started_at)),
             ('uptime', str(uptime)),
+            ('events dispatched', f'{bot.events_total.total():.0f}'),
+            *(
+                (('events skipped', f'{bot.lean_cache.skipped.total():.0f}'),)
+                if bot.lean_cache else ()
+            ),
+            ('commands invoked', f'{bot.commands_total.total():.0f}'),
+            ('rest responses', f'{rest_responses.total():.0f}'),
+            ('rest rate limits', f'{rest_responses.total(status=429):.0f}'),
+            *(
+                (f'cached {cache}', f'{size}')
+                for cache, size in bot.caches.get_sizes().items()
+            ),
+            *bot.rest.get_summary_rows(),
+            *(bot.watchdog.get_summary_rows() if bot.watchdog else ()),
         )
 
+        await self.say_rows(rows)
+
+    @checks.is_manager()
+    @commands.command(pass_context=True, name='listeners')
+    async def cmd_listeners(self, ctx: Context, limit: int = 10):
+        rows = self.bot.listener_timings.get_summary_rows(limit)
+        if rows:
+            await self.say_rows(rows)
+        else:
+            await self.bot.say('No listeners have run yet.')
+
+    @checks.is_manager()
+    @commands.command(pass_context=True, name='profile')
+    async def cmd_profile(
+        self,
+        ctx: Context,
+        seconds: float = 10.0,
+        top: int = 10,
+        collapsed: bool = False,
+    ):
+        # one at a time, or they'd just be profiling each other
+        if self.profiling:
+            await self.bot.react_cooldown(ctx)
+            return
+        seconds = max(1.0, min(seconds, self.MAX_PROFILE_SECONDS))
+        self.profiling = True
+        try:
+            # let them know we're working on it
+            await self.bot.add_reaction(ctx.message, '🤖')
+            result = await profile_loop(seconds)
+        finally:
+            self.profiling = False
+        await self.say_block(result.to_lines(top))
+        if collapsed:
+            fp = io.BytesIO(result.to_collapsed().encode('utf8'))
+            await self.bot.send_file(
+                ctx.message.channel, fp, filename='profile.collapsed'
+            )
+
+    @checks.is_manager()
+    @commands.group(pass_context=True, name='mem')
+    async def cmd_mem(self, ctx: Context):
+        if ctx.invoked_subcommand is None:
+            await self.bot.react_question(ctx)
+
+    @cmd_mem.command(pass_context=True, name='snapshot')
+    async def cmd_mem_snapshot(self, ctx: Context, top: int = 10):
+        # snapshots take a while on a big heap, so keep them off the loop
+        lines = await self.bot.loop.run_in_executor(
+            None, self.bot.memory.snapshot, top
+        )
+        await self.say_block(lines)
+
+    @cmd_mem.command(pass_context=True, name='diff')
+    async def cmd_mem_diff(self, ctx: Context, top: int = 10):
+        lines = await self.bot.loop.run_in_executor(None, self.bot.memory.diff, top)
+        if lines is None:
+            await self.bot.say('Take a snapshot first, with `mem snapshot`.')
+        else:
+            await self.say_block(lines)
+
+    @cmd_mem.command(pass_context=True, name='stop')
+    async def cmd_mem_stop(self, ctx: Context):
+        self.bot.memory.stop()
+        await self.bot.react_success(ctx)
+
+    @cmd_mem.command(pass_context=True, name='caches')
+    async def cmd_mem_caches(self, ctx: Context):
+        sizes = self.bot.caches.get_sizes()
+        await self.say_rows([(cache, str(size)) for cache, size in sizes.items()])
+
+    async def say_block(self, lines):
+        report = '\n'.join(lines)
+        # stay within the message length limit
+        if len(report) > 1900:
+            report = report[:1900] + '\n...'
+        await self.bot.say('\n'.join(('```', report, '```')))
+
+    async def say_rows(self, rows):
         pad = 1 + max(len(row[0]) for row in rows)
 
         innards = (''.join((f'{row[0]}:'.ljust(pad), '  ', row[1])) for row in rows)
@@ -14,9 +14,7 @@ class Proto:
         self.options = bot.state.get_extension_state(ext)
 
     def get_role(self, server: discord.Server, role_id) -> discord.Role:
-        for r in server.roles:
-            if r.id == role_id:
-                return r
+        return self.bot.get_role(server, role_id)
 
     async def on_member_join(self, member: discord.Member):
         server: discord.Server = member.server
@@ -0,0 +1,383 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import typing
+from datetime import datetime
+
+import discord
+
+log = logging.getLogger(__name__)
+
+# The gateway opcode for events, as opposed to heartbeats and the like.
+OP_DISPATCH = 0
+
+# What discord.py waits for before it says it's ready.
+STARTUP_EVENTS = ("READY", "GUILD_CREATE", "GUILD_MEMBERS_CHUNK")
+
+# Python 3.7 moved this off of `Task`.
+all_tasks = getattr(asyncio, "all_tasks", None) or asyncio.Task.all_tasks
+
+# Ids in REST urls, so that calls can be grouped by route.
+SNOWFLAKE_PATTERN = re.compile(r"/\d{15,21}")
+
+
+def get_route_name(method: str, url: str) -> str:
+    path = url.split("/api/", 1)[-1].split("?", 1)[0]
+    # Drop the version too, for paths like `v6/channels/...`.
+    path = re.sub(r"^v\d+/", "", path)
+    return f"{method} /{SNOWFLAKE_PATTERN.sub('/{id}', '/' + path)[1:]}"
+
+
+def open_run_file(path: str, started_at: datetime) -> typing.TextIO:
+    # Every run gets a file of its own, named after when it started, so that a
+    # restart never writes over (or onto the end of) an earlier recording.
+    root, ext = os.path.splitext(path)
+    name = f"{root}-{started_at:%Y%m%d-%H%M%S}"
+    for index in range(1000):
+        try:
+            suffix = f"-{index}" if index else ""
+            return open(f"{name}{suffix}{ext}", "x", encoding="utf8")
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"Too many recordings named {name}{ext}")
+
+
+class GatewayRecorder:
+    """
+    Writes every gateway dispatch the bot receives to a JSONL file, one
+    `{"t": seconds, "event": name, "d": payload}` line per event, where `t` is
+    relative to the first event recorded. Replay the file with `cogbot.replay`.
+    Each run records to a new file next to `path`, with the time it started in
+    its name; reconnects within a run stay in the same file.
+    """
+
+    def __init__(self, path: str):
+        self.fp = open_run_file(path, datetime.now())
+        self.path: str = self.fp.name
+        log.info(f"Recording gateway events to: {self.path}")
+        self.started: float = None
+        self.recorded: int = 0
+
+    def record(self, msg: dict):
+        if msg.get("op") != OP_DISPATCH:
+            return
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+        line = {"t": round(now - self.started, 4), "event": msg["t"], "d": msg["d"]}
+        self.fp.write(json.dumps(line, separators=(",", ":")) + "\n")
+        self.recorded += 1
+
+    def close(self):
+        self.fp.close()
+
+
+class FakeGateway:
+    """
+    Stands in for `DiscordWebSocket`: feeds recorded dispatches into the
+    client's connection state just like the real thing does, and swallows
+    anything the client tries to send back.
+    """
+
+    def __init__(self, client: discord.Client):
+        self.client: discord.Client = client
+        self.open: bool = False
+        self.sequence: int = 0
+        self.sent: typing.List[dict] = []
+
+    def feed(self, event: str, data: dict):
+        state = self.client.connection
+        msg = {"op": OP_DISPATCH, "t": event, "s": self.sequence, "d": data}
+        self.sequence += 1
+        self.client.dispatch("socket_response", msg)
+        if event == "READY":
+            state.clear()
+            state.session_id = data.get("session_id")
+        state.sequence = msg["s"]
+        parser = getattr(state, "parse_" + event.lower(), None)
+        if parser is None:
+            log.info(f"Unhandled event {event}")
+            return
+        parser(data)
+
+    async def send_as_json(self, data: dict):
+        self.sent.append(data)
+
+    async def change_presence(self, **kwargs):
+        self.sent.append({"presence": kwargs})
+
+    async def request_sync(self, guild_ids):
+        self.sent.append({"sync": guild_ids})
+
+    async def close(self):
+        pass
+
+
+class FakeResponse:
+    def __init__(self, status: int, data: typing.Any = None):
+        self.status: int = status
+        if data is None:
+            self.headers = {"content-type": "text/plain"}
+            self.body = ""
+        else:
+            self.headers = {"content-type": "application/json"}
+            self.body = json.dumps(data)
+
+    async def text(self, encoding: str = "utf-8") -> str:
+        return self.body
+
+    async def release(self):
+        pass
+
+
+class FakeRest:
+    """
+    Stands in for the aiohttp session under `HTTPClient`, so every outbound
+    request still goes through discord.py (and our scheduler) on its way here.
+    Each one is counted by route and answered with just enough of a payload
+    for discord.py to build its objects from, after `latency` seconds.
+    """
+
+    def __init__(self, client: discord.Client, latency: float = 0.0):
+        self.client: discord.Client = client
+        self.latency: float = latency
+        self.ids = iter(range(10 ** 17, 10 ** 18))
+        self.calls: typing.Dict[str, int] = {}
+
+    def get_user_data(self) -> dict:
+        user = self.client.connection.user
+        return {
+            "id": user.id if user else "0",
+            "username": user.name if user else "cogbot",
+            "discriminator": user.discriminator if user else "0000",
+            "avatar": None,
+            "bot": True,
+        }
+
+    def make_message(self, channel_id: str, message_id: str, payload: dict) -> dict:
+        return {
+            "id": message_id,
+            "channel_id": channel_id,
+            "author": self.get_user_data(),
+            "content": payload.get("content") or "",
+            "timestamp": datetime.utcnow().isoformat(),
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": [payload["embed"]] if payload.get("embed") else [],
+            "reactions": [],
+            "pinned": False,
+            "type": 0,
+        }
+
+    def respond(self, method: str, url: str, payload: dict) -> FakeResponse:
+        route = get_route_name(method, url)
+        ids = [part[1:] for part in SNOWFLAKE_PATTERN.findall(url)]
+        if route == "POST /channels/{id}/messages":
+            message_id = str(next(self.ids))
+            return FakeResponse(200, self.make_message(ids[0], message_id, payload))
+        if route == "PATCH /channels/{id}/messages/{id}":
+            return FakeResponse(200, self.make_message(ids[0], ids[1], payload))
+        if route == "POST /users/@me/channels":
+            recipient = dict(self.get_user_data(), id=payload.get("recipient_id"))
+            recipient.pop("bot")
+            channel = {"id": str(next(self.ids)), "type": 1, "recipients": [recipient]}
+            return FakeResponse(200, channel)
+        if method == "GET":
+            return FakeResponse(200, [] if url.endswith("/messages") else {})
+        return FakeResponse(204)
+
+    async def request(self, method: str, url: str, **kwargs) -> FakeResponse:
+        route = get_route_name(method, url)
+        self.calls[route] = self.calls.get(route, 0) + 1
+        data = kwargs.get("data")
+        payload = json.loads(data) if isinstance(data, str) else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.respond(method, url, payload)
+
+    async def close(self):
+        pass
+
+
+class ReplayReport:
+    def __init__(self):
+        self.sessions: int = 0
+        self.startup_events: int = 0
+        self.startup: float = 0.0
+        self.events: int = 0
+        self.events_by_type: typing.Dict[str, int] = {}
+        self.recorded_duration: float = 0.0
+        self.duration: float = 0.0
+        self.unfinished: int = 0
+        self.rest_calls: typing.Dict[str, int] = {}
+
+    @property
+    def events_per_second(self) -> float:
+        return self.events / self.duration if self.duration else 0.0
+
+    def to_json(self) -> dict:
+        return {
+            "sessions": self.sessions,
+            "startup_events": self.startup_events,
+            "startup": self.startup,
+            "events": self.events,
+            "events_by_type": self.events_by_type,
+            "recorded_duration": self.recorded_duration,
+            "duration": self.duration,
+            "events_per_second": self.events_per_second,
+            "unfinished": self.unfinished,
+            "rest_calls": self.rest_calls,
+        }
+
+    def to_lines(self) -> typing.List[str]:
+        lines = [
+            f"Started up {self.sessions}x from {self.startup_events} events"
+            f" in {self.startup:.2f}s",
+            f"Replayed {self.events} events in {self.duration:.2f}s"
+            f" ({self.events_per_second:.1f} events/s);"
+            f" recorded over {self.recorded_duration:.2f}s",
+        ]
+        if self.unfinished:
+            lines.append(f"{self.unfinished} listeners were still running at the end")
+        lines += ["", "Events:"]
+        for event, count in sorted(self.events_by_type.items(), key=lambda kv: -kv[1]):
+            lines.append(f"  {count:>8}  {event}")
+        lines += ["", "REST calls:"]
+        for route, count in sorted(self.rest_calls.items(), key=lambda kv: -kv[1]):
+            lines.append(f"  {count:>8}  {route}")
+        return lines
+
+
+def read_recording(path: str) -> typing.Iterable[dict]:
+    with open(path, encoding="utf8") as fp:
+        for line in fp:
+            if line.strip():
+                yield json.loads(line)
+
+
+class GatewayReplay:
+    """
+    Replays a recording into a bot that never logs in, at `speed` times the
+    recorded pace (or as fast as possible, with a speed of 0). The login burst
+    is fed in first and timed on its own; everything after it is measured.
+    Listeners are given `drain_timeout` seconds to finish after the last event,
+    and the time until they do counts towards events per second. When the bot
+    logged in again partway through, the clock is stopped until it's ready, and
+    that login counts towards startup instead.
+    """
+
+    def __init__(
+        self,
+        client: discord.Client,
+        speed: float = 1.0,
+        rest_latency: float = 0.0,
+        drain_timeout: float = 30.0,
+    ):
+        self.client: discord.Client = client
+        self.speed: float = speed
+        self.drain_timeout: float = drain_timeout
+        self.gateway = FakeGateway(client)
+        self.rest = FakeRest(client, latency=rest_latency)
+        client.ws = self.gateway
+        # The real session is never used; it's closed once the replay starts.
+        self.real_session = client.http.session
+        client.http.session = self.rest
+        client.connection.is_bot = True
+
+    async def close_real_session(self):
+        if self.real_session and not self.real_session.closed:
+            closed = self.real_session.close()
+            # Older versions close synchronously.
+            if asyncio.iscoroutine(closed):
+                await closed
+        self.real_session = None
+
+    async def replay(self, path: str) -> ReplayReport:
+        await self.close_real_session()
+        loop = self.client.loop
+        report = ReplayReport()
+        pending: typing.Set[asyncio.Future] = set()
+        # When the pace was last set, in real and recorded time.
+        clock, recorded_clock = time.monotonic(), 0.0
+        # When the current login began, and how many REST calls had been made.
+        login_started, login_events, login_rest_calls = clock, 0, {}
+        # REST calls made while logging in, which aren't part of the results.
+        startup_rest_calls: typing.Dict[str, int] = {}
+        # When the current measured stretch began, in real and recorded time.
+        measured_since, recorded_since = clock, 0.0
+        measuring = False
+        last_recorded: float = None
+        for entry in read_recording(path):
+            event = entry["event"]
+            if measuring and event == "READY":
+                # The bot connected again, with a new session; stop the clock
+                # while it logs in, as it did the first time around.
+                report.duration += time.monotonic() - measured_since
+                report.recorded_duration += last_recorded - recorded_since
+                measuring = False
+                login_started, login_events = time.monotonic(), 0
+                login_rest_calls = dict(self.rest.calls)
+                # discord.py only ever sets this, since it never logs in twice.
+                self.client._is_ready.clear()
+            if last_recorded is not None and entry["t"] < last_recorded:
+                # Older recordings may have several runs in them, each of which
+                # starts from zero; keep the pace from there instead.
+                clock, recorded_clock = time.monotonic(), entry["t"]
+            last_recorded = entry["t"]
+            if event == "READY":
+                report.sessions += 1
+            if not measuring and event not in STARTUP_EVENTS:
+                # Logging in is mostly discord.py waiting for servers to trickle
+                # in, so only start counting once the bot is ready.
+                if login_events:
+                    await asyncio.wait_for(
+                        self.client.wait_until_ready(), self.drain_timeout
+                    )
+                measuring = True
+                report.startup += time.monotonic() - login_started
+                for route, count in self.rest.calls.items():
+                    startup_rest_calls[route] = (
+                        startup_rest_calls.get(route, 0)
+                        + count
+                        - login_rest_calls.get(route, 0)
+                    )
+                clock, recorded_clock = time.monotonic(), entry["t"]
+                measured_since, recorded_since = clock, entry["t"]
+            if self.speed:
+                delay = (
+                    clock + (entry["t"] - recorded_clock) / self.speed - time.monotonic()
+                )
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            # Whatever tasks the event spawns are the work it caused.
+            before = all_tasks(loop)
+            self.gateway.feed(event, entry["d"])
+            if not measuring:
+                report.startup_events += 1
+                login_events += 1
+                continue
+            pending |= all_tasks(loop) - before
+            pending = {task for task in pending if not task.done()}
+            report.events += 1
+            report.events_by_type[event] = report.events_by_type.get(event, 0) + 1
+            # Let the loop breathe, as it would between socket reads.
+            await asyncio.sleep(0)
+        if pending:
+            _, still_pending = await asyncio.wait(pending, timeout=self.drain_timeout)
+            report.unfinished = len(still_pending)
+        if measuring:
+            report.duration += time.monotonic() - measured_since
+            report.recorded_duration += last_recorded - recorded_since
+        report.rest_calls = {
+            route: count - startup_rest_calls.get(route, 0)
+            for route, count in self.rest.calls.items()
+            if count > startup_rest_calls.get(route, 0)
+        }
+        return report
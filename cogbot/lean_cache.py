@@ -0,0 +1,127 @@
+import logging
+import sys
+import typing
+
+import discord
+from discord.member import VoiceState
+
+from cogbot.metrics import MetricsRegistry
+from cogbot.types import ServerId
+
+log = logging.getLogger(__name__)
+
+# Nothing in the bot looks at presences, typing or members' voice state.
+SKIPPED_EVENTS = ("PRESENCE_UPDATE", "TYPING_START", "VOICE_STATE_UPDATE")
+
+# The parts of a server payload that only exist to fill in the above.
+SKIPPED_SERVER_KEYS = ("presences", "voice_states")
+
+RoleSet = typing.Tuple[discord.Role, ...]
+
+
+class LeanCache:
+    """
+    Trims discord.py's connection state down to what the bot actually uses.
+    Presence, typing and voice state events are dropped before they're parsed,
+    and so are the presences that come with every server. Members keep their
+    identity, roles, join date and nickname; their voice state is shared, their
+    game is dropped, and members with the same roles share one (immutable)
+    tuple of them instead of a list each. Without presences, usernames and
+    avatars only change when a member update comes in.
+    """
+
+    def __init__(
+        self, connection: discord.state.ConnectionState, metrics: MetricsRegistry = None
+    ):
+        self.connection: discord.state.ConnectionState = connection
+        # Members never get voice state updates, so they can all share this one.
+        self.voice = VoiceState()
+        # Role tuples by the identities of the roles in them, per server.
+        self.role_sets: typing.Dict[
+            ServerId, typing.Dict[typing.Tuple[int, ...], RoleSet]
+        ] = {}
+        self.skipped = None
+        if metrics:
+            self.skipped = metrics.counter(
+                "cogbot_events_skipped_total",
+                "Gateway events dropped by the lean cache, by event.",
+                labels=("event",),
+            )
+        for event in SKIPPED_EVENTS:
+            self.skip(event)
+        self.wrap("GUILD_CREATE", self.after_server, strip=True)
+        self.wrap("GUILD_UPDATE", self.after_server, strip=True)
+        self.wrap("GUILD_SYNC", self.after_server, strip=True)
+        self.wrap("GUILD_MEMBERS_CHUNK", self.after_members_chunk)
+        self.wrap("GUILD_MEMBER_ADD", self.after_member)
+        self.wrap("GUILD_MEMBER_UPDATE", self.after_member)
+
+    def skip(self, event: str):
+        def skip_event(data: dict):
+            if self.skipped:
+                self.skipped.inc(event=event)
+
+        # discord.py looks parsers up on the instance, so this shadows the method.
+        setattr(self.connection, "parse_" + event.lower(), skip_event)
+
+    def wrap(
+        self,
+        event: str,
+        after: typing.Callable[[dict], typing.Any],
+        strip: bool = False,
+    ):
+        name = "parse_" + event.lower()
+        parse = getattr(self.connection, name)
+
+        def parse_event(data: dict):
+            if strip:
+                for key in SKIPPED_SERVER_KEYS:
+                    data.pop(key, None)
+            parse(data)
+            after(data)
+
+        setattr(self.connection, name, parse_event)
+
+    def get_role_set(self, member: discord.Member) -> RoleSet:
+        role_sets = self.role_sets.setdefault(member.server.id, {})
+        key = tuple(map(id, member.roles))
+        role_set = role_sets.get(key)
+        if role_set is None:
+            role_set = tuple(member.roles)
+            role_sets[key] = role_set
+        return role_set
+
+    def slim_member(self, member: discord.Member):
+        member.voice = self.voice
+        member.game = None
+        # There are only ten thousand of these, however many members there are.
+        member.discriminator = sys.intern(member.discriminator)
+        member.roles = self.get_role_set(member)
+
+    def slim_server(self, server: discord.Server):
+        # Roles may have been replaced, so start the shared tuples over.
+        self.role_sets.pop(server.id, None)
+        for member in server.members:
+            self.slim_member(member)
+
+    def after_server(self, data: dict):
+        server = self.connection._get_server(data.get("id"))
+        if server is not None:
+            self.slim_server(server)
+
+    def after_members_chunk(self, data: dict):
+        server = self.connection._get_server(data.get("guild_id"))
+        if server is None:
+            return
+        for member_data in data.get("members", ()):
+            member = server.get_member(member_data["user"]["id"])
+            if member is not None:
+                self.slim_member(member)
+
+    def after_member(self, data: dict):
+        server = self.connection._get_server(data.get("guild_id"))
+        if server is None:
+            return
+        member = server.get_member(data["user"]["id"])
+        if member is not None:
+            self.slim_member(member)
@@ -0,0 +1,10 @@
+import typing
+
+
+def percentile(values: typing.List[float], p: float) -> typing.Optional[float]:
+    """ Return the nearest-rank percentile `p` (0-1) of `values`, if any. """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p * len(ordered))) - 1))
+    return ordered[index]
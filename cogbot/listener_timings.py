@@ -0,0 +1,105 @@
+import collections
+import logging
+import typing
+
+import discord
+
+from cogbot.lib.percentile import percentile
+
+log = logging.getLogger(__name__)
+
+LISTENER_SAMPLES = 1000
+SLOW_LISTENER_THRESHOLD = 0.5
+
+# (cog, event)
+ListenerKey = typing.Tuple[str, str]
+
+
+def summarize_event_arg(arg) -> str:
+    if isinstance(arg, discord.Message):
+        return f"message {arg.id} in #{arg.channel} by {arg.author}"
+    if isinstance(arg, discord.Reaction):
+        return f"reaction {arg.emoji} on message {arg.message.id}"
+    if isinstance(arg, discord.Member):
+        return f"member {arg} of {arg.server}"
+    if isinstance(arg, discord.User):
+        return f"user {arg}"
+    return type(arg).__name__
+
+
+def summarize_event(args: typing.Iterable) -> str:
+    return ", ".join(summarize_event_arg(arg) for arg in args)
+
+
+class ListenerStats:
+    def __init__(self, samples: int = LISTENER_SAMPLES):
+        self.calls: int = 0
+        self.slow_calls: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+        # Only the most recent calls, so percentiles follow current behaviour.
+        self.samples: typing.Deque[float] = collections.deque(maxlen=samples)
+
+    def record(self, duration: float):
+        self.calls += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.samples.append(duration)
+
+    def get_percentile(self, p: float) -> typing.Optional[float]:
+        return percentile(list(self.samples), p)
+
+
+class ListenerTimings:
+    """
+    Rolling timings for every (cog, event) listener. Recording a call is just a
+    couple of dict lookups and a deque append; percentiles are only worked out
+    when someone asks. Any call slower than `threshold` seconds is logged along
+    with a summary of the event that triggered it.
+    """
+
+    def __init__(
+        self,
+        threshold: float = SLOW_LISTENER_THRESHOLD,
+        samples: int = LISTENER_SAMPLES,
+    ):
+        self.threshold: float = threshold
+        self.samples: int = samples
+        self.stats: typing.Dict[ListenerKey, ListenerStats] = {}
+
+    def get_stats(self, cog: str, event: str) -> ListenerStats:
+        key = (cog, event)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = ListenerStats(self.samples)
+            self.stats[key] = stats
+        return stats
+
+    def record(self, cog: str, event: str, duration: float, args: typing.Iterable):
+        stats = self.get_stats(cog, event)
+        stats.record(duration)
+        if self.threshold and duration > self.threshold:
+            stats.slow_calls += 1
+            log.warning(
+                f"Slow listener {cog}.on_{event} took {duration:.3f}s"
+                f" for: {summarize_event(args)}"
+            )
+
+    def get_summary_rows(self, limit: int = 10) -> typing.List[typing.Tuple[str, str]]:
+        rows = []
+        for (cog, event), stats in self.stats.items():
+            p50 = stats.get_percentile(0.5)
+            p95 = stats.get_percentile(0.95)
+            p99 = stats.get_percentile(0.99)
+            rows.append(
+                (
+                    p95,
+                    f"{cog}.on_{event}",
+                    f"p50 {p50 * 1000:.1f}ms, p95 {p95 * 1000:.1f}ms,"
+                    f" p99 {p99 * 1000:.1f}ms, max {stats.max * 1000:.1f}ms,"
+                    f" {stats.calls} calls, {stats.slow_calls} slow",
+                )
+            )
+        # Slowest first.
+        rows.sort(key=lambda row: -row[0])
+        return [(name, summary) for _, name, summary in rows[:limit]]
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import typing
+
+log = logging.getLogger(__name__)
+
+WATCHDOG_THRESHOLD = 1.0
+WATCHDOG_INTERVAL = 0.25
+
+
+class LoopStall:
+    def __init__(
+        self,
+        started_at: float,
+        culprit: str,
+        stack: typing.List[traceback.FrameSummary],
+    ):
+        self.started_at: float = started_at
+        self.culprit: str = culprit
+        self.stack: typing.List[traceback.FrameSummary] = stack
+        self.duration: float = None
+
+
+def find_culprit(frame) -> str:
+    # The innermost frame of our own code is what's to blame; anything below it
+    # is a library call it made.
+    culprit = None
+    while frame:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("cogbot.") and module != __name__:
+            culprit = f"{module}.{frame.f_code.co_name}"
+            break
+        frame = frame.f_back
+    return culprit or "<unknown>"
+
+
+class LoopWatchdog:
+    """
+    Measures event loop lag continuously. A heartbeat on the loop records when
+    it last ran, and a helper thread checks on it; if the loop goes quiet for
+    longer than `threshold` seconds, the thread grabs the loop thread's stack
+    while it's still stuck and logs the code that's blocking it.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop = None,
+        threshold: float = WATCHDOG_THRESHOLD,
+        interval: float = WATCHDOG_INTERVAL,
+    ):
+        self.loop: asyncio.AbstractEventLoop = loop or asyncio.get_event_loop()
+        self.threshold: float = threshold
+        self.interval: float = interval
+        self.loop_thread_id: int = None
+        self.last_beat: float = None
+        self.current_stall: LoopStall = None
+        self.last_stall: LoopStall = None
+        # Counters, for anyone who wants to know.
+        self.lag: float = 0.0
+        self.max_lag: float = 0.0
+        self.stalls: int = 0
+        self.stalls_by_culprit: typing.Dict[str, int] = {}
+        self.task: asyncio.Task = None
+        self.thread: threading.Thread = None
+        self.stopped = threading.Event()
+        # Keeps the heartbeat from slipping in while a stall is being captured.
+        self.lock = threading.Lock()
+
+    def start(self):
+        if self.task:
+            return
+        self.task = self.loop.create_task(self.beat())
+        self.thread = threading.Thread(
+            target=self.watch, name="loop-watchdog", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def beat(self):
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag = max(0.0, now - self.last_beat - self.interval)
+            self.max_lag = max(self.max_lag, self.lag)
+            with self.lock:
+                self.last_beat = now
+                stall = self.current_stall
+                self.current_stall = None
+            if stall:
+                stall.duration = now - stall.started_at
+                log.warning(
+                    f"Event loop unblocked after {stall.duration:.2f}s; "
+                    f"blocked by: {stall.culprit}"
+                )
+
+    def watch(self):
+        while not self.stopped.wait(self.interval):
+            last_beat = self.last_beat
+            if last_beat is None or self.current_stall:
+                continue
+            if time.monotonic() - last_beat - self.interval > self.threshold:
+                self.capture(last_beat)
+
+    def capture(self, last_beat: float):
+        with self.lock:
+            frame = sys._current_frames().get(self.loop_thread_id)
+            # If the loop has beaten since `watch` looked, then it isn't stuck
+            # anymore and this is just the stack of it idling.
+            if frame is None or self.last_beat != last_beat:
+                return
+            stack = traceback.extract_stack(frame)
+            stall = LoopStall(last_beat, find_culprit(frame), stack)
+            self.current_stall = stall
+        self.last_stall = stall
+        self.stalls += 1
+        self.stalls_by_culprit[stall.culprit] = (
+            self.stalls_by_culprit.get(stall.culprit, 0) + 1
+        )
+        stack_str = "".join(traceback.format_list(stall.stack))
+        log.warning(
+            f"Event loop blocked for over {self.threshold}s by: {stall.culprit}\n"
+            f"{stack_str}"
+        )
+
+    def get_summary_rows(self) -> typing.List[typing.Tuple[str, str]]:
+        rows = [
+            ("loop lag", f"{self.lag * 1000:.0f}ms"),
+            ("max loop lag", f"{self.max_lag * 1000:.0f}ms"),
+            ("loop stalls", str(self.stalls)),
+        ]
+        by_culprit = dict(self.stalls_by_culprit)
+        worst = sorted(by_culprit.items(), key=lambda kv: -kv[1])[:3]
+        for culprit, count in worst:
+            rows.append(("  blocked by", f"{culprit} ({count}x)"))
+        return rows
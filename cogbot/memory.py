@@ -0,0 +1,147 @@
+import logging
+import os
+import sys
+import tracemalloc
+import typing
+
+log = logging.getLogger(__name__)
+
+MEMORY_FRAMES = 16
+
+# The directory containing the `cogbot` package, for turning paths into modules.
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+Site = typing.Tuple[str, str]
+
+
+def format_size(size: float) -> str:
+    sign = "-" if size < 0 else ""
+    size = abs(size)
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{sign}{size:.1f} {unit}"
+        size /= 1024
+    return f"{sign}{size:.1f} GiB"
+
+
+def get_module_name(filename: str) -> typing.Optional[str]:
+    # Only our own files have a module name worth reporting.
+    path = os.path.relpath(os.path.abspath(filename), PACKAGE_ROOT)
+    if not path.startswith("cogbot" + os.sep) or not path.endswith(".py"):
+        return None
+    module = path[:-3].replace(os.sep, ".")
+    return module[: -len(".__init__")] if module.endswith(".__init__") else module
+
+
+def get_site(traceback: tracemalloc.Traceback) -> Site:
+    """ Blame the innermost frame of our own code, or else the innermost frame. """
+    frames = list(traceback)
+    # Frames are listed oldest first since Python 3.7.
+    if sys.version_info < (3, 7):
+        frames.reverse()
+    for frame in reversed(frames):
+        module = get_module_name(frame.filename)
+        if module and module != __name__:
+            return module, f"{module}:{frame.lineno}"
+    innermost = frames[-1]
+    return "<other>", f"{innermost.filename}:{innermost.lineno}"
+
+
+class CacheRegistry:
+    """
+    Named callables that report how big each of the bot's caches is. Anything
+    that holds on to data for the life of the bot should register one, so that
+    growth shows up in `>status`, `>mem` and metrics.
+    """
+
+    def __init__(self):
+        self.caches: typing.Dict[str, typing.Callable[[], int]] = {}
+
+    def register(self, name: str, size: typing.Callable[[], int]):
+        # Replaces any previous registration, so reloaded extensions just work.
+        self.caches[name] = size
+
+    def unregister(self, name: str):
+        self.caches.pop(name, None)
+
+    def get_sizes(self) -> typing.Dict[str, int]:
+        sizes = {}
+        for name, size in self.caches.items():
+            try:
+                sizes[name] = size()
+            except:
+                log.exception(f"Failed to measure cache: {name}")
+        return sizes
+
+
+class MemoryTracker:
+    """
+    Takes tracemalloc snapshots on request, and reports where memory went by
+    cogbot module and allocation site. Tracing only starts with the first
+    snapshot, because it isn't free; stop it again once you're done.
+    """
+
+    def __init__(self, frames: int = MEMORY_FRAMES):
+        self.frames: int = frames
+        self.baseline: tracemalloc.Snapshot = None
+
+    @property
+    def is_tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def take_snapshot(self) -> tracemalloc.Snapshot:
+        if not tracemalloc.is_tracing():
+            log.info(f"Starting tracemalloc with {self.frames} frames")
+            tracemalloc.start(self.frames)
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            )
+        )
+
+    def stop(self):
+        self.baseline = None
+        tracemalloc.stop()
+
+    def snapshot(self, limit: int) -> typing.List[str]:
+        """ Take a new baseline, and report what's allocated right now. """
+        self.baseline = self.take_snapshot()
+        sizes: typing.Dict[Site, typing.List[int]] = {}
+        for stat in self.baseline.statistics("traceback"):
+            totals = sizes.setdefault(get_site(stat.traceback), [0, 0])
+            totals[0] += stat.size
+            totals[1] += stat.count
+        return self.to_lines("Allocated since tracing started", sizes, limit)
+
+    def diff(self, limit: int) -> typing.Optional[typing.List[str]]:
+        """ Report what's changed since the baseline, if there is one. """
+        if not self.baseline:
+            return None
+        snapshot = self.take_snapshot()
+        sizes: typing.Dict[Site, typing.List[int]] = {}
+        for stat in snapshot.compare_to(self.baseline, "traceback"):
+            totals = sizes.setdefault(get_site(stat.traceback), [0, 0])
+            totals[0] += stat.size_diff
+            totals[1] += stat.count_diff
+        return self.to_lines("Change since snapshot", sizes, limit)
+
+    def to_lines(
+        self, title: str, sizes: typing.Dict[Site, typing.List[int]], limit: int
+    ) -> typing.List[str]:
+        by_module: typing.Dict[str, int] = {}
+        for (module, _), (size, _) in sizes.items():
+            by_module[module] = by_module.get(module, 0) + size
+        total = sum(by_module.values())
+        lines = [f"{title}: {format_size(total)}", "", "By module:"]
+        # Biggest changes first, whichever way they went.
+        for module, size in sorted(by_module.items(), key=lambda kv: -abs(kv[1]))[
+            :limit
+        ]:
+            lines.append(f"  {format_size(size):>12}  {module}")
+        lines += ["", "Top allocation sites:"]
+        top_sites = sorted(sizes.items(), key=lambda kv: -abs(kv[1][0]))[:limit]
+        for (_, site), (size, count) in top_sites:
+            lines.append(f"  {format_size(size):>12}  {site} ({count:+d} blocks)")
+        return lines
@@ -0,0 +1,297 @@
+import json
+import logging
+import sqlite3
+import time
+import typing
+from datetime import datetime, timezone
+
+import discord
+
+from cogbot.types import ChannelId, UserId
+
+log = logging.getLogger(__name__)
+
+# Discord's epoch, in milliseconds, for turning timestamps into snowflakes.
+DISCORD_EPOCH = 1420070400000
+
+MESSAGE_FLUSH_EVERY = 100
+
+Interval = typing.Tuple[float, float]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    author_id INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_channel ON messages (channel_id, timestamp);
+CREATE TABLE IF NOT EXISTS coverage (
+    channel_id INTEGER NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverage_by_channel ON coverage (channel_id);
+CREATE TABLE IF NOT EXISTS sessions (
+    start REAL NOT NULL,
+    end REAL NOT NULL
+);
+"""
+
+
+def to_epoch(dt: datetime) -> float:
+    # Discord timestamps are naive UTC.
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def to_snowflake(epoch: float) -> str:
+    return str((int(epoch * 1000) - DISCORD_EPOCH) << 22)
+
+
+def merge_intervals(intervals: typing.Iterable[Interval]) -> typing.List[Interval]:
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def user_to_data(user: discord.User) -> dict:
+    return {
+        "id": user.id,
+        "username": user.name,
+        "discriminator": user.discriminator,
+        "avatar": user.avatar,
+        "bot": user.bot,
+    }
+
+
+def message_to_data(message: discord.Message) -> dict:
+    # Just enough of the raw payload to rebuild the message, like `logs_from` does.
+    return {
+        "id": message.id,
+        "channel_id": message.channel.id,
+        "author": user_to_data(message.author),
+        "content": message.content,
+        "timestamp": message.timestamp.isoformat(),
+        "edited_timestamp": message.edited_timestamp.isoformat()
+        if message.edited_timestamp
+        else None,
+        "tts": message.tts,
+        "pinned": message.pinned,
+        "mention_everyone": message.mention_everyone,
+        "mentions": [user_to_data(user) for user in message.mentions],
+        "mention_roles": list(message.raw_role_mentions),
+        "embeds": message.embeds,
+        "attachments": message.attachments,
+        "type": message.type.value,
+    }
+
+
+class MessageStore:
+    """
+    A local, append-only record of every message the bot sees, kept in SQLite.
+
+    The store also remembers which stretches of each channel's history it holds
+    completely: either because the bot was connected to the gateway at the time
+    (a session, which covers every channel) or because the stretch was fetched
+    over REST. Queries inside those stretches never need to hit the API.
+
+    Messages from the gateway are buffered and written in batches; anything
+    still buffered is flushed before the store is read.
+    """
+
+    def __init__(self, path: str, flush_every: int = MESSAGE_FLUSH_EVERY):
+        self.path: str = path
+        self.flush_every: int = flush_every
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.sessions: typing.List[Interval] = merge_intervals(
+            self.connection.execute("SELECT start, end FROM sessions")
+        )
+        self.coverage: typing.Dict[ChannelId, typing.List[Interval]] = {}
+        for channel_id, start, end in self.connection.execute(
+            "SELECT channel_id, start, end FROM coverage"
+        ):
+            self.coverage.setdefault(str(channel_id), []).append((start, end))
+        for channel_id, intervals in self.coverage.items():
+            self.coverage[channel_id] = merge_intervals(intervals)
+        # The current gateway session, if any, and the last time we heard from it.
+        self.live_since: float = None
+        self.last_event_at: float = None
+        # Gateway writes not yet on disk, by message id so edits replace them.
+        self.buffered_messages: typing.Dict[int, discord.Message] = {}
+        self.buffered_deletes: typing.List[int] = []
+
+    def close(self):
+        self.end_session()
+        self.connection.close()
+
+    def start_session(self):
+        # A new session might have missed events since the last one.
+        self.end_session()
+        self.live_since = time.time()
+        self.last_event_at = self.live_since
+
+    def end_session(self):
+        self.flush()
+        # Only vouch for the session up to the last event we actually received.
+        if self.live_since is not None and self.last_event_at > self.live_since:
+            self.connection.execute(
+                "INSERT INTO sessions (start, end) VALUES (?, ?)",
+                (self.live_since, self.last_event_at),
+            )
+            self.sessions = merge_intervals(
+                self.sessions + [(self.live_since, self.last_event_at)]
+            )
+        self.live_since = None
+
+    def touch(self):
+        if self.live_since is not None:
+            self.last_event_at = time.time()
+
+    def flush(self):
+        if not (self.buffered_messages or self.buffered_deletes):
+            return
+        self.connection.execute("BEGIN")
+        try:
+            self.write_messages(self.buffered_messages.values())
+            self.connection.executemany(
+                "UPDATE messages SET deleted = 1 WHERE id = ?",
+                [(message_id,) for message_id in self.buffered_deletes],
+            )
+        except:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+        self.buffered_messages = {}
+        self.buffered_deletes = []
+
+    def buffer_write(self):
+        buffered = len(self.buffered_messages) + len(self.buffered_deletes)
+        if buffered >= self.flush_every:
+            self.flush()
+
+    def record(self, message: discord.Message):
+        self.buffered_messages[int(message.id)] = message
+        self.buffer_write()
+        self.touch()
+
+    def write_messages(self, messages: typing.Iterable[discord.Message]):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO messages (id, channel_id, author_id, timestamp, data)"
+            " VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    int(message.id),
+                    int(message.channel.id),
+                    int(message.author.id),
+                    to_epoch(message.timestamp),
+                    json.dumps(message_to_data(message)),
+                )
+                for message in messages
+            ],
+        )
+
+    def record_delete(self, message: discord.Message):
+        self.buffered_deletes.append(int(message.id))
+        self.buffer_write()
+        self.touch()
+
+    def record_range(
+        self,
+        channel_id: ChannelId,
+        start: float,
+        end: float,
+        messages: typing.List[discord.Message],
+        until_id: int = None,
+    ):
+        # `messages` is everything in the channel from `start` up to the newest
+        # of them (or `until_id`, if the fetch vouches for more), so anything
+        # else we have for that stretch must have been deleted since. The bound
+        # is a message id rather than `end`: our clock isn't Discord's, and
+        # whatever the gateway delivered after the fetch isn't in `messages`.
+        self.flush()
+        fetched_ids = [int(message.id) for message in messages]
+        until_id = max(fetched_ids + [until_id or 0]) or None
+        if until_id is not None:
+            self.connection.execute(
+                "UPDATE messages SET deleted = 1"
+                " WHERE channel_id = ? AND timestamp >= ? AND id <= ?",
+                (int(channel_id), start, until_id),
+            )
+        self.write_messages(messages)
+        self.add_coverage(channel_id, start, end)
+
+    def get_intervals(self, channel_id: ChannelId) -> typing.List[Interval]:
+        intervals = self.sessions + self.coverage.get(channel_id, [])
+        if self.live_since is not None:
+            intervals.append((self.live_since, float("inf")))
+        return merge_intervals(intervals)
+
+    def get_gaps(
+        self, channel_id: ChannelId, start: float, end: float = None
+    ) -> typing.List[Interval]:
+        end = time.time() if end is None else end
+        gaps = []
+        cursor = start
+        for interval_start, interval_end in self.get_intervals(channel_id):
+            if interval_end <= cursor:
+                continue
+            if interval_start >= end:
+                break
+            if interval_start > cursor:
+                gaps.append((cursor, interval_start))
+            cursor = max(cursor, interval_end)
+            if cursor >= end:
+                break
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def is_covered(self, channel_id: ChannelId, start: float) -> bool:
+        return not self.get_gaps(channel_id, start)
+
+    def add_coverage(self, channel_id: ChannelId, start: float, end: float):
+        self.coverage[channel_id] = merge_intervals(
+            self.coverage.get(channel_id, []) + [(start, end)]
+        )
+        self.connection.execute(
+            "INSERT INTO coverage (channel_id, start, end) VALUES (?, ?, ?)",
+            (int(channel_id), start, end),
+        )
+
+    def get_latest(
+        self, channel_id: ChannelId, limit: int
+    ) -> typing.List[typing.Tuple[float, dict]]:
+        # Newest first, like `logs_from`.
+        self.flush()
+        return [
+            (timestamp, json.loads(data))
+            for timestamp, data in self.connection.execute(
+                "SELECT timestamp, data FROM messages"
+                " WHERE channel_id = ? AND deleted = 0"
+                " ORDER BY timestamp DESC LIMIT ?",
+                (int(channel_id), limit),
+            )
+        ]
+
+    def count_by_author(
+        self, channel_id: ChannelId, since: float
+    ) -> typing.Dict[UserId, int]:
+        self.flush()
+        return {
+            str(author_id): count
+            for author_id, count in self.connection.execute(
+                "SELECT author_id, COUNT(*) FROM messages"
+                " WHERE channel_id = ? AND timestamp >= ? AND deleted = 0"
+                " GROUP BY author_id",
+                (int(channel_id), since),
+            )
+        }
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import math
+import typing
+
+log = logging.getLogger(__name__)
+
+METRICS_HOST = "127.0.0.1"
+
+# In seconds; suits anything from a cache hit to a slow API call.
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+LabelValues = typing.Tuple[str, ...]
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(names: typing.Iterable[str], values: typing.Iterable[str]) -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", r"\\").replace('"', r"\""))
+        for name, value in zip(names, values)
+    ]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    type: str = None
+
+    def __init__(self, name: str, help: str, labels: typing.Iterable[str] = ()):
+        self.name: str = name
+        self.help: str = help
+        self.labels: typing.Tuple[str, ...] = tuple(labels)
+
+    def get_key(self, labels: typing.Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def iter_samples(self) -> typing.Iterable[typing.Tuple[str, str, float]]:
+        raise NotImplementedError()
+
+    def render(self) -> typing.List[str]:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for name, labels, value in self.iter_samples():
+            lines.append(f"{name}{labels} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: typing.Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: typing.Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.get_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self.get_key(labels), 0)
+
+    def total(self, **labels) -> float:
+        # Sum across every label value, or just those matching `labels`.
+        indices = [
+            (self.labels.index(name), str(value)) for name, value in labels.items()
+        ]
+        return sum(
+            value
+            for key, value in self.values.items()
+            if all(key[i] == expected for i, expected in indices)
+        )
+
+    def iter_samples(self):
+        for key, value in self.values.items():
+            yield self.name, format_labels(self.labels, key), value
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self.get_key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: typing.Iterable[str] = (),
+        buckets: typing.Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets: typing.Tuple[float, ...] = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [per-bucket counts..., sum, count]
+        self.values: typing.Dict[LabelValues, typing.List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self.get_key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = [0] * (len(self.buckets) + 2)
+            self.values[key] = state
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += value
+        state[-1] += 1
+
+    def iter_samples(self):
+        for key, state in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = format_labels(
+                    self.labels + ("le",), key + (format_value(bound),)
+                )
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = format_labels(self.labels, key)
+            yield f"{self.name}_sum", labels, state[-2]
+            yield f"{self.name}_count", labels, state[-1]
+
+
+MetricType = typing.TypeVar("MetricType", bound=Metric)
+
+
+class MetricsRegistry:
+    """
+    Every metric the bot keeps, by name. Metrics are created on first use, so
+    any part of the bot can ask for one without worrying about who goes first.
+    Collectors run just before the metrics are read, to refresh gauges that
+    are cheaper to compute on demand than to keep current.
+    """
+
+    def __init__(self):
+        self.metrics: typing.Dict[str, Metric] = {}
+        self.collectors: typing.List[typing.Callable[[], typing.Any]] = []
+
+    def get_or_create(
+        self, cls: typing.Type[MetricType], name: str, help: str, **kwargs
+    ) -> MetricType:
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = cls(name, help, **kwargs)
+            self.metrics[name] = metric
+        return metric
+
+    def counter(
+        self, name: str, help: str, labels: typing.Iterable[str] = ()
+    ) -> Counter:
+        return self.get_or_create(Counter, name, help, labels=labels)
+
+    def gauge(
+        self, name: str, help: str, labels: typing.Iterable[str] = ()
+    ) -> Gauge:
+        return self.get_or_create(Gauge, name, help, labels=labels)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: typing.Iterable[str] = (),
+        buckets: typing.Iterable[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.get_or_create(
+            Histogram, name, help, labels=labels, buckets=buckets
+        )
+
+    def add_collector(self, collector: typing.Callable[[], typing.Any]):
+        self.collectors.append(collector)
+
+    def collect(self):
+        for collector in self.collectors:
+            try:
+                collector()
+            except:
+                log.exception(f"Metrics collector failed: {collector}")
+
+    def render(self) -> str:
+        """ Render every metric in the Prometheus text exposition format. """
+        self.collect()
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """ A tiny HTTP server that answers every request with the current metrics. """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        port: int,
+        host: str = METRICS_HOST,
+    ):
+        self.registry: MetricsRegistry = registry
+        self.port: int = port
+        self.host: str = host
+        self.server: asyncio.AbstractServer = None
+
+    async def start(self):
+        if self.server:
+            return
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        log.info(f"Serving metrics at: http://{self.host}:{self.port}/metrics")
+
+    def close(self):
+        if self.server:
+            self.server.close()
+            self.server = None
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            # We don't care what was asked for, but read the request anyway.
+            while (await reader.readline()).strip():
+                pass
+            body = self.registry.render().encode("utf8")
+            writer.write(
+                b"HTTP/1.0 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode("ascii")
+                + body
+            )
+            await writer.drain()
+        except:
+            log.exception("Failed to serve metrics")
+        finally:
+            writer.close()
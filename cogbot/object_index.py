@@ -0,0 +1,96 @@
+import logging
+import re
+import typing
+
+import discord
+
+from cogbot.types import ChannelId, EmojiId, RoleId, ServerId
+
+log = logging.getLogger(__name__)
+
+CUSTOM_EMOJI_ID_PATTERN = re.compile(r"\:(\d+)\>$")
+
+
+def get_custom_emoji_id(emoji: str) -> typing.Optional[EmojiId]:
+    match = CUSTOM_EMOJI_ID_PATTERN.search(emoji)
+    return match.group(1) if match else None
+
+
+class ServerIndex:
+    def __init__(self, server: discord.Server):
+        self.server: discord.Server = server
+        self.roles: typing.Dict[RoleId, discord.Role] = {
+            role.id: role for role in server.roles
+        }
+        self.emojis: typing.Dict[EmojiId, discord.Emoji] = {
+            emoji.id: emoji for emoji in server.emojis
+        }
+        self.channels: typing.Dict[ChannelId, discord.Channel] = {
+            channel.id: channel for channel in server.channels
+        }
+
+
+class ObjectIndex:
+    """
+    Id-to-object maps for the roles, custom emoji and channels of every server,
+    plus one map of every server channel, so that lookups don't have to scan.
+
+    The maps are kept current by gateway events. A server that was replaced
+    wholesale (say, after a reconnect) is re-indexed the next time it's used.
+    """
+
+    def __init__(self):
+        self.servers: typing.Dict[ServerId, ServerIndex] = {}
+        self.channels: typing.Dict[ChannelId, discord.Channel] = {}
+
+    def add_server(self, server: discord.Server) -> ServerIndex:
+        self.remove_server(server)
+        index = ServerIndex(server)
+        self.servers[server.id] = index
+        self.channels.update(index.channels)
+        return index
+
+    def remove_server(self, server: discord.Server):
+        index = self.servers.pop(server.id, None)
+        if index:
+            for channel_id in index.channels:
+                self.channels.pop(channel_id, None)
+
+    def get_server_index(self, server: discord.Server) -> ServerIndex:
+        index = self.servers.get(server.id)
+        if index is None or index.server is not server:
+            index = self.add_server(server)
+        return index
+
+    def add_channel(self, channel: discord.Channel):
+        # private channels aren't indexed
+        if not channel.is_private:
+            self.get_server_index(channel.server).channels[channel.id] = channel
+            self.channels[channel.id] = channel
+
+    def remove_channel(self, channel: discord.Channel):
+        if not channel.is_private:
+            self.get_server_index(channel.server).channels.pop(channel.id, None)
+            self.channels.pop(channel.id, None)
+
+    def add_role(self, role: discord.Role):
+        self.get_server_index(role.server).roles[role.id] = role
+
+    def remove_role(self, role: discord.Role):
+        self.get_server_index(role.server).roles.pop(role.id, None)
+
+    def set_emojis(self, server: discord.Server, emojis: typing.List[discord.Emoji]):
+        self.get_server_index(server).emojis = {emoji.id: emoji for emoji in emojis}
+
+    def get_channel(self, channel_id: ChannelId) -> typing.Optional[discord.Channel]:
+        return self.channels.get(channel_id)
+
+    def get_role(
+        self, server: discord.Server, role_id: RoleId
+    ) -> typing.Optional[discord.Role]:
+        return self.get_server_index(server).roles.get(role_id)
+
+    def get_emoji(
+        self, server: discord.Server, emoji_id: EmojiId
+    ) -> typing.Optional[discord.Emoji]:
+        return self.get_server_index(server).emojis.get(emoji_id)
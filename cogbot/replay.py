@@ -0,0 +1,55 @@
+import argparse
+import logging
+
+# parse args and setup logging before anything else
+
+arg_parser = argparse.ArgumentParser(description='Replay recorded gateway events into a bot, offline.')
+arg_parser.add_argument('recording', help='Recorded events file, from `gateway_record`')
+arg_parser.add_argument('--state', help='Bot state file', default='bot.json')
+arg_parser.add_argument('--speed', help='Speed multiplier, or 0 for flat out', type=float, default=1.0)
+arg_parser.add_argument('--rest-latency', help='Seconds per fake REST call', type=float, default=0.0)
+arg_parser.add_argument('--drain-timeout', help='Seconds to let listeners finish', type=float, default=30.0)
+arg_parser.add_argument('--report', help='Also write the report to this JSON file')
+arg_parser.add_argument('--log', help='Log level', default='WARNING')
+args = arg_parser.parse_args()
+
+logging.basicConfig(
+    level=args.log,
+    format='%(asctime)s [%(name)s/%(levelname)s] %(message)s')
+
+log = logging.getLogger(__name__)
+
+import asyncio
+import json
+
+from cogbot.cog_bot import CogBot
+from cogbot.cog_bot_state import CogBotState
+from cogbot.gateway_replay import GatewayReplay
+
+
+async def replay(bot: CogBot):
+    harness = GatewayReplay(
+        bot,
+        speed=args.speed,
+        rest_latency=args.rest_latency,
+        drain_timeout=args.drain_timeout)
+    try:
+        return await harness.replay(args.recording)
+    finally:
+        await bot.close()
+
+
+def run():
+    loop = asyncio.get_event_loop()
+    state = CogBotState(args.state)
+    # don't record the replay over the top of itself
+    state.gateway_record = None
+    bot = CogBot(state=state, loop=loop)
+    report = loop.run_until_complete(replay(bot))
+    print('\n'.join(report.to_lines()))
+    if args.report:
+        with open(args.report, 'w') as fp:
+            json.dump(report.to_json(), fp, indent=2)
+
+
+run()
@@ -0,0 +1,285 @@
+import asyncio
+import collections
+import heapq
+import itertools
+import logging
+import time
+import typing
+
+import discord.http
+
+from cogbot.lib.percentile import percentile
+from cogbot.metrics import MetricsRegistry
+from cogbot.types import ChannelId
+
+log = logging.getLogger(__name__)
+
+REST_CONCURRENCY = 8
+REST_WAIT_SAMPLES = 1000
+
+# Lower goes first.
+PRIORITY_MODERATION = 0
+PRIORITY_REPLY = 1
+PRIORITY_LOG = 2
+PRIORITY_COSMETIC = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_MODERATION: "moderation",
+    PRIORITY_REPLY: "reply",
+    PRIORITY_LOG: "log",
+    PRIORITY_COSMETIC: "cosmetic",
+}
+
+MODERATION_ROUTES = (
+    ("DELETE", "/channels/{channel_id}/messages/{message_id}"),
+    ("POST", "/channels/{channel_id}/messages/bulk_delete"),
+    ("POST", "/channels/{channel_id}/messages/bulk-delete"),
+    ("DELETE", "/guilds/{guild_id}/members/{user_id}"),
+    ("PATCH", "/guilds/{guild_id}/members/{user_id}"),
+    ("PUT", "/guilds/{guild_id}/members/{user_id}/roles/{role_id}"),
+    ("DELETE", "/guilds/{guild_id}/members/{user_id}/roles/{role_id}"),
+    ("PUT", "/guilds/{guild_id}/bans/{user_id}"),
+    ("DELETE", "/guilds/{guild_id}/bans/{user_id}"),
+)
+
+COSMETIC_ROUTES = (("POST", "/channels/{channel_id}/typing"),)
+
+ROUTE_PRIORITIES = {
+    **{route: PRIORITY_MODERATION for route in MODERATION_ROUTES},
+    **{route: PRIORITY_COSMETIC for route in COSMETIC_ROUTES},
+}
+
+
+class RestJob:
+    def __init__(
+        self,
+        priority: int,
+        seq: int,
+        bucket: str,
+        route: discord.http.Route,
+        kwargs: dict,
+        future: asyncio.Future,
+    ):
+        self.priority: int = priority
+        self.seq: int = seq
+        self.bucket: str = bucket
+        self.route: discord.http.Route = route
+        self.kwargs: dict = kwargs
+        self.future: asyncio.Future = future
+        self.queued_at: float = time.monotonic()
+        self.coalesce_key: typing.Tuple[str, str] = None
+
+    def __lt__(self, other: "RestJob") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class RestPriorityStats:
+    def __init__(self):
+        self.queued: int = 0
+        self.sent: int = 0
+        self.coalesced: int = 0
+        self.errors: int = 0
+        self.max_wait: float = 0.0
+        self.waits: typing.Deque[float] = collections.deque(maxlen=REST_WAIT_SAMPLES)
+
+    def record_wait(self, wait: float):
+        self.sent += 1
+        self.max_wait = max(self.max_wait, wait)
+        self.waits.append(wait)
+
+    def get_wait_percentile(self, p: float) -> typing.Optional[float]:
+        return percentile(list(self.waits), p)
+
+
+class RestScheduler:
+    """
+    Sits in front of `bot.http.request` and decides which outbound request goes
+    next. Requests are ranked by priority class (moderation, replies, logs, then
+    cosmetic reactions), and each route bucket only has one request in flight
+    at a time, so a burst of reactions can't hold up a delete. Moderation is
+    never held back by the concurrency limit.
+
+    Edits to the same message or channel that are still waiting are merged into
+    one request, and every caller gets its result.
+
+    With a metrics registry, every HTTP response (including the 429s that
+    discord.py retries internally) is counted by route and status.
+    """
+
+    def __init__(
+        self,
+        http: discord.http.HTTPClient,
+        loop: asyncio.AbstractEventLoop = None,
+        concurrency: int = REST_CONCURRENCY,
+        metrics: MetricsRegistry = None,
+    ):
+        self.http: discord.http.HTTPClient = http
+        self._request = http.request
+        http.request = self.request
+        self.loop: asyncio.AbstractEventLoop = loop or asyncio.get_event_loop()
+        self.concurrency: int = concurrency
+        self.log_channels: typing.Set[ChannelId] = set()
+        self.seq = itertools.count()
+        # Jobs that may start as soon as there's room, one per bucket.
+        self.ready: typing.List[RestJob] = []
+        # Jobs waiting for their bucket, which is either ready or in flight.
+        self.waiting: typing.Dict[str, typing.List[RestJob]] = {}
+        self.active_buckets: typing.Set[str] = set()
+        self.pending_edits: typing.Dict[typing.Tuple[str, str], RestJob] = {}
+        self.in_flight: int = 0
+        self.stats: typing.Dict[int, RestPriorityStats] = {
+            priority: RestPriorityStats() for priority in PRIORITY_NAMES
+        }
+        # Which route each in-flight url belongs to, for labelling responses.
+        self.routes_by_url: typing.Dict[str, str] = {}
+        self.session = None
+        self.responses = None
+        if metrics:
+            self.responses = metrics.counter(
+                "cogbot_rest_responses_total",
+                "REST responses received, by route and status.",
+                labels=("method", "route", "status"),
+            )
+            self.queue_depth = metrics.gauge(
+                "cogbot_rest_queue_depth",
+                "REST requests waiting to be sent, by priority.",
+                labels=("priority",),
+            )
+            self.wait_seconds = metrics.histogram(
+                "cogbot_rest_wait_seconds",
+                "Time REST requests spent queued, by priority.",
+                labels=("priority",),
+            )
+            metrics.add_collector(self.collect)
+
+    def collect(self):
+        for priority, name in PRIORITY_NAMES.items():
+            self.queue_depth.set(self.stats[priority].queued, priority=name)
+
+    def watch_session(self):
+        # discord.py retries 429s on its own, so the only place to see them is
+        # the session itself; it may be recreated, so check every time.
+        session = self.http.session
+        if self.responses is None or session is self.session:
+            return
+        self.session = session
+        request = session.request
+
+        async def watched_request(method: str, url: str, *args, **kwargs):
+            response = await request(method, url, *args, **kwargs)
+            route = self.routes_by_url.get(url, "other")
+            self.responses.inc(method=method, route=route, status=response.status)
+            return response
+
+        session.request = watched_request
+
+    def add_log_channel(self, channel: discord.Channel):
+        self.log_channels.add(channel.id)
+
+    def get_priority(self, route: discord.http.Route) -> int:
+        priority = ROUTE_PRIORITIES.get((route.method, route.path))
+        if priority is not None:
+            return priority
+        if "/reactions" in route.path:
+            return PRIORITY_COSMETIC
+        if getattr(route, "channel_id", None) in self.log_channels:
+            return PRIORITY_LOG
+        return PRIORITY_REPLY
+
+    def get_bucket(self, route: discord.http.Route) -> str:
+        # Discord rate-limits each route per major parameter.
+        channel_id = getattr(route, "channel_id", None)
+        guild_id = getattr(route, "guild_id", None)
+        return f"{route.method} {route.path} {channel_id}:{guild_id}"
+
+    def get_depth(self) -> int:
+        return sum(stats.queued for stats in self.stats.values())
+
+    async def request(self, route: discord.http.Route, **kwargs) -> typing.Any:
+        payload = kwargs.get("json")
+        coalesce_key = None
+        if route.method == "PATCH" and isinstance(payload, dict):
+            coalesce_key = (route.method, route.url)
+            job = self.pending_edits.get(coalesce_key)
+            if job:
+                # Later fields win, just as if both edits had been sent in turn.
+                job.kwargs["json"].update(payload)
+                self.stats[job.priority].coalesced += 1
+                return await asyncio.shield(job.future)
+            kwargs["json"] = dict(payload)
+
+        priority = self.get_priority(route)
+        future = self.loop.create_future()
+        job = RestJob(
+            priority, next(self.seq), self.get_bucket(route), route, kwargs, future
+        )
+        if coalesce_key:
+            job.coalesce_key = coalesce_key
+            self.pending_edits[coalesce_key] = job
+        self.stats[priority].queued += 1
+        self.enqueue(job)
+        self.dispatch()
+        # Shielded so that one caller giving up doesn't cancel it for the others.
+        return await asyncio.shield(future)
+
+    def enqueue(self, job: RestJob):
+        if job.bucket in self.active_buckets:
+            heapq.heappush(self.waiting.setdefault(job.bucket, []), job)
+        else:
+            self.active_buckets.add(job.bucket)
+            heapq.heappush(self.ready, job)
+
+    def dispatch(self):
+        while self.ready:
+            job = self.ready[0]
+            at_capacity = self.in_flight >= self.concurrency
+            if at_capacity and job.priority != PRIORITY_MODERATION:
+                break
+            heapq.heappop(self.ready)
+            self.in_flight += 1
+            self.loop.create_task(self.run(job))
+
+    async def run(self, job: RestJob):
+        stats = self.stats[job.priority]
+        stats.queued -= 1
+        wait = time.monotonic() - job.queued_at
+        stats.record_wait(wait)
+        if self.responses:
+            self.wait_seconds.observe(wait, priority=PRIORITY_NAMES[job.priority])
+        # Too late to merge anything else into this one.
+        if job.coalesce_key:
+            del self.pending_edits[job.coalesce_key]
+        self.watch_session()
+        self.routes_by_url[job.route.url] = job.route.path
+        try:
+            result = await self._request(job.route, **job.kwargs)
+        except Exception as e:
+            stats.errors += 1
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+        finally:
+            self.routes_by_url.pop(job.route.url, None)
+            self.in_flight -= 1
+            waiting = self.waiting.get(job.bucket)
+            if waiting:
+                heapq.heappush(self.ready, heapq.heappop(waiting))
+            else:
+                self.waiting.pop(job.bucket, None)
+                self.active_buckets.discard(job.bucket)
+            self.dispatch()
+
+    def get_summary_rows(self) -> typing.List[typing.Tuple[str, str]]:
+        rows = []
+        for priority, name in PRIORITY_NAMES.items():
+            stats = self.stats[priority]
+            p95 = stats.get_wait_percentile(0.95)
+            p95_str = f"{p95 * 1000:.0f}ms" if p95 is not None else "-"
+            rows.append(
+                (
+                    f"rest {name}",
+                    f"{stats.queued} queued, {stats.sent} sent,"
+                    f" {stats.coalesced} coalesced, p95 wait {p95_str}",
+                )
+            )
+        return rows
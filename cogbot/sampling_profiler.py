@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import typing
+
+log = logging.getLogger(__name__)
+
+PROFILE_INTERVAL = 0.005
+PROFILE_MAX_DEPTH = 128
+
+# Event loop machinery sits under every sample, so it says nothing on its own.
+PLUMBING_MODULES = ("asyncio", "selectors", "runpy", "threading", "__main__")
+
+# (module, function, filename, first line)
+FunctionKey = typing.Tuple[str, str, str, int]
+
+
+def get_function_key(frame) -> FunctionKey:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return module, code.co_name, code.co_filename, code.co_firstlineno
+
+
+def format_function(key: FunctionKey) -> str:
+    module, name, _, line = key
+    return f"{module}.{name}:{line}"
+
+
+def get_extension_module(stack: typing.List[FunctionKey]) -> str:
+    # Blame the innermost frame of our own code, like the loop watchdog does.
+    for module, _, _, _ in reversed(stack):
+        if module.startswith("cogbot.") and module != __name__:
+            return module
+    return "<other>"
+
+
+class ProfileResult:
+    def __init__(self, duration: float):
+        self.duration: float = duration
+        self.samples: int = 0
+        self.idle_samples: int = 0
+        self.self_counts: typing.Dict[FunctionKey, int] = {}
+        self.cumulative_counts: typing.Dict[FunctionKey, int] = {}
+        self.module_counts: typing.Dict[str, int] = {}
+        # Outermost frame first, for flamegraphs.
+        self.stacks: typing.Dict[typing.Tuple[FunctionKey, ...], int] = {}
+
+    def add_sample(self, stack: typing.List[FunctionKey]):
+        self.samples += 1
+        # An idle loop is sitting in its selector, waiting for something to do.
+        if stack[-1][0] == "selectors":
+            self.idle_samples += 1
+            return
+        self.self_counts[stack[-1]] = self.self_counts.get(stack[-1], 0) + 1
+        # Recursion shouldn't count a function more than once per sample.
+        for key in set(stack):
+            if key[0].split(".")[0] not in PLUMBING_MODULES:
+                self.cumulative_counts[key] = self.cumulative_counts.get(key, 0) + 1
+        module = get_extension_module(stack)
+        self.module_counts[module] = self.module_counts.get(module, 0) + 1
+        stack_key = tuple(stack)
+        self.stacks[stack_key] = self.stacks.get(stack_key, 0) + 1
+
+    def get_share(self, count: int) -> str:
+        return f"{100 * count / self.samples:.1f}%" if self.samples else "-"
+
+    def get_top(
+        self, counts: typing.Dict[typing.Any, int], limit: int
+    ) -> typing.List[typing.Tuple[typing.Any, int]]:
+        return sorted(counts.items(), key=lambda kv: -kv[1])[:limit]
+
+    def to_lines(self, limit: int = 10) -> typing.List[str]:
+        busy = self.samples - self.idle_samples
+        lines = [
+            f"Profiled {self.duration:.1f}s: {self.samples} samples,"
+            f" {busy} busy ({self.get_share(busy)}), rest idle",
+            "",
+            "By extension module:",
+        ]
+        for module, count in self.get_top(self.module_counts, limit):
+            lines.append(f"  {self.get_share(count):>6}  {module}")
+        lines += ["", "Top by self time:"]
+        for key, count in self.get_top(self.self_counts, limit):
+            lines.append(f"  {self.get_share(count):>6}  {format_function(key)}")
+        lines += ["", "Top by cumulative time:"]
+        for key, count in self.get_top(self.cumulative_counts, limit):
+            lines.append(f"  {self.get_share(count):>6}  {format_function(key)}")
+        return lines
+
+    def to_collapsed(self) -> str:
+        """ Render the stacks in the collapsed format that flamegraph tools read. """
+        return "".join(
+            ";".join(format_function(key) for key in stack) + f" {count}\n"
+            for stack, count in self.stacks.items()
+        )
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread (normally the event loop's) from a helper
+    thread at a fixed interval. Nothing is hooked into the profiled thread, so
+    the overhead is whatever it costs to walk a stack a couple hundred times a
+    second.
+    """
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL):
+        self.thread_id: int = thread_id
+        self.interval: float = interval
+        self.stopped = threading.Event()
+        self.result: ProfileResult = None
+
+    def sample(self) -> typing.Optional[typing.List[FunctionKey]]:
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame and len(stack) < PROFILE_MAX_DEPTH:
+            stack.append(get_function_key(frame))
+            frame = frame.f_back
+        stack.reverse()
+        return stack or None
+
+    def run(self, duration: float):
+        started = time.monotonic()
+        result = ProfileResult(duration)
+        while not self.stopped.wait(self.interval):
+            stack = self.sample()
+            if stack:
+                result.add_sample(stack)
+            if time.monotonic() - started >= duration:
+                break
+        result.duration = time.monotonic() - started
+        self.result = result
+
+
+async def profile_loop(
+    duration: float, interval: float = PROFILE_INTERVAL
+) -> ProfileResult:
+    """ Profile the thread running the current event loop for `duration` seconds. """
+    profiler = SamplingProfiler(threading.get_ident(), interval)
+    thread = threading.Thread(
+        target=profiler.run, args=(duration,), name="profiler", daemon=True
+    )
+    thread.start()
+    try:
+        while thread.is_alive():
+            await asyncio.sleep(min(0.1, duration))
+    finally:
+        profiler.stopped.set()
+    return profiler.result
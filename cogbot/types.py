@@ -2,3 +2,4 @@ ServerId = str
 ChannelId = str
 UserId = str
 RoleId = str
+EmojiId = str
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import logging
+import typing
+import urllib.parse
+
+import aiohttp
+
+log = logging.getLogger(__name__)
+
+WEB_TIMEOUT = 30.0
+WEB_LIMIT = 32
+WEB_HOST_LIMIT = 4
+
+DEFAULT_HEADERS = {"Accept-Encoding": "gzip, deflate"}
+
+
+class WebError(Exception):
+    def __init__(self, url: str, status: int):
+        super().__init__(f"HTTP {status} from: {url}")
+        self.url: str = url
+        self.status: int = status
+
+
+class WebResponse:
+    def __init__(self, url: str, status: int, headers: typing.Mapping, content: bytes):
+        self.url: str = url
+        self.status: int = status
+        self.headers: typing.Mapping = headers
+        self.content: bytes = content
+
+    def text(self, encoding: str = "utf8") -> str:
+        return self.content.decode(encoding)
+
+    def json(self) -> typing.Any:
+        return json.loads(self.text())
+
+
+class WebHostStats:
+    def __init__(self):
+        self.requests: int = 0
+        self.errors: int = 0
+        self.timeouts: int = 0
+        self.in_flight: int = 0
+
+
+class WebClient:
+    """
+    One pooled, keep-alive HTTP client for the whole bot. Connections are reused
+    per host, responses are decompressed transparently, every request has a
+    timeout, and no single host gets more than a few requests at a time.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop = None,
+        timeout: float = WEB_TIMEOUT,
+        limit: int = WEB_LIMIT,
+        host_limit: int = WEB_HOST_LIMIT,
+    ):
+        self.loop: asyncio.AbstractEventLoop = loop or asyncio.get_event_loop()
+        self.timeout: float = timeout
+        self.limit: int = limit
+        self.host_limit: int = host_limit
+        self.session: aiohttp.ClientSession = None
+        self.host_semaphores: typing.Dict[str, asyncio.Semaphore] = {}
+        self.host_stats: typing.Dict[str, WebHostStats] = {}
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # Created lazily, so that it belongs to the loop that's actually running.
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, loop=self.loop)
+            self.session = aiohttp.ClientSession(
+                connector=connector, headers=DEFAULT_HEADERS, loop=self.loop
+            )
+        return self.session
+
+    def get_host_semaphore(self, host: str) -> asyncio.Semaphore:
+        semaphore = self.host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.host_limit)
+            self.host_semaphores[host] = semaphore
+        return semaphore
+
+    def get_host_stats(self, host: str) -> WebHostStats:
+        stats = self.host_stats.get(host)
+        if stats is None:
+            stats = WebHostStats()
+            self.host_stats[host] = stats
+        return stats
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            closed = self.session.close()
+            # Older versions close synchronously.
+            if asyncio.iscoroutine(closed):
+                await closed
+        self.session = None
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: typing.Dict[str, str] = None,
+        timeout: float = None,
+        **kwargs,
+    ) -> WebResponse:
+        host = urllib.parse.urlsplit(url).netloc
+        stats = self.get_host_stats(host)
+        async with self.get_host_semaphore(host):
+            stats.requests += 1
+            stats.in_flight += 1
+            try:
+                return await asyncio.wait_for(
+                    self._request(method, url, headers=headers, **kwargs),
+                    timeout=timeout or self.timeout,
+                )
+            except asyncio.TimeoutError:
+                stats.timeouts += 1
+                raise
+            except:
+                stats.errors += 1
+                raise
+            finally:
+                stats.in_flight -= 1
+
+    async def _request(
+        self, method: str, url: str, headers: typing.Dict[str, str] = None, **kwargs
+    ) -> WebResponse:
+        session = self.get_session()
+        async with session.request(method, url, headers=headers, **kwargs) as response:
+            content = await response.read()
+            return WebResponse(url, response.status, response.headers, content)
+
+    async def get(self, url: str, **kwargs) -> WebResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def get_bytes(self, url: str, **kwargs) -> bytes:
+        response = await self.get(url, **kwargs)
+        if response.status >= 400:
+            raise WebError(url, response.status)
+        return response.content
+
+    async def get_text(self, url: str, **kwargs) -> str:
+        return (await self.get_bytes(url, **kwargs)).decode("utf8")
+
+    async def get_json(self, url: str, **kwargs) -> typing.Any:
+        return json.loads(await self.get_text(url, **kwargs))
@@ -0,0 +1,202 @@
+import asyncio
+import shutil
+import tempfile
+import unittest
+
+from aiohttp import web
+
+from cogbot.dataset_cache import fetch_snapshot
+from cogbot.dataset_loader import DatasetLoader
+from cogbot.web_client import WebClient
+
+
+class StandInServer:
+    """ A local HTTP server to point the web client at, instead of the internet. """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.app = web.Application(loop=loop)
+        self.runner = None
+        self.handler = None
+        self.server = None
+        self.url: str = None
+
+    def route(self, path: str, handler):
+        self.app.router.add_route("GET", path, handler)
+
+    async def start(self):
+        # aiohttp moved from `make_handler` to runners along the way.
+        if hasattr(web, "AppRunner"):
+            self.runner = web.AppRunner(self.app)
+            await self.runner.setup()
+            site = web.TCPSite(self.runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+        else:
+            self.handler = self.app.make_handler()
+            self.server = await self.loop.create_server(self.handler, "127.0.0.1", 0)
+            port = self.server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+        else:
+            self.server.close()
+            await self.server.wait_closed()
+            await self.handler.finish_connections(1.0)
+            await self.app.cleanup()
+
+
+class WebTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = StandInServer(self.loop)
+        self.web = WebClient(loop=self.loop)
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.web.close())
+        if self.server.url:
+            self.loop.run_until_complete(self.server.stop())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_async(self, coro):
+        async def run():
+            await self.server.start()
+            return await coro
+
+        return self.loop.run_until_complete(run())
+
+
+class TestWebClient(WebTestCase):
+    def test_timeout(self):
+        async def slow(request):
+            await asyncio.sleep(2.0)
+            return web.Response(text="too late")
+
+        self.server.route("/slow", slow)
+
+        async def check():
+            with self.assertRaises(asyncio.TimeoutError):
+                await self.web.get(self.server.url + "/slow", timeout=0.2)
+
+        self.run_async(check())
+        stats = self.web.get_host_stats(self.server.url[len("http://") :])
+        self.assertEqual(stats.timeouts, 1)
+        self.assertEqual(stats.in_flight, 0)
+
+    def test_host_limit(self):
+        self.web.host_limit = 2
+        active = [0, 0]
+
+        async def busy(request):
+            active[0] += 1
+            active[1] = max(active[1], active[0])
+            await asyncio.sleep(0.05)
+            active[0] -= 1
+            return web.Response(text="ok")
+
+        self.server.route("/busy", busy)
+
+        async def check():
+            url = self.server.url + "/busy"
+            return await asyncio.gather(*(self.web.get_text(url) for _ in range(8)))
+
+        self.assertEqual(self.run_async(check()), ["ok"] * 8)
+        self.assertEqual(active[1], 2)
+
+
+class TestRevalidation(WebTestCase):
+    def setUp(self):
+        super().setUp()
+        self.requests = []
+        self.body = '{"version": 1}'
+        self.server.route("/etag", self.etag_handler)
+        self.server.route("/modified", self.modified_handler)
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.cache_dir)
+
+    async def etag_handler(self, request):
+        self.requests.append(request.headers.get("If-None-Match"))
+        etag = f'"{len(self.body)}-{hash(self.body)}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304)
+        return web.Response(text=self.body, headers={"ETag": etag})
+
+    async def modified_handler(self, request):
+        self.requests.append(request.headers.get("If-Modified-Since"))
+        last_modified = "Mon, 06 Jan 2020 00:00:00 GMT"
+        if request.headers.get("If-Modified-Since") == last_modified:
+            return web.Response(status=304)
+        return web.Response(text=self.body, headers={"Last-Modified": last_modified})
+
+    def test_etag_not_modified(self):
+        async def check():
+            url = self.server.url + "/etag"
+            first = await fetch_snapshot(self.web, url)
+            second = await fetch_snapshot(self.web, url, first)
+            self.assertIs(second, first)
+            self.body = '{"version": 2}'
+            third = await fetch_snapshot(self.web, url, first)
+            self.assertEqual(third.content, b'{"version": 2}')
+
+        self.run_async(check())
+        self.assertIsNone(self.requests[0])
+        self.assertIsNotNone(self.requests[1])
+
+    def test_last_modified_not_modified(self):
+        async def check():
+            url = self.server.url + "/modified"
+            first = await fetch_snapshot(self.web, url)
+            return first, await fetch_snapshot(self.web, url, first)
+
+        first, second = self.run_async(check())
+        self.assertIs(second, first)
+        self.assertEqual(self.requests[1], first.last_modified)
+
+    def test_loader_uses_cache(self):
+        loader = DatasetLoader(self.web, loop=self.loop, cache_dir=self.cache_dir)
+        updates = []
+
+        async def check():
+            url = self.server.url + "/etag"
+            self.assertEqual(await loader.load(url), {"version": 1})
+            # Unchanged: served from the snapshot, revalidated with a 304.
+            self.assertEqual(await loader.fetch(url, 5.0), (b'{"version": 1}', False))
+            # Changed: the snapshot is served first, then the update arrives.
+            self.body = '{"version": 2}'
+            result = await loader.load(url, on_update=updates.append)
+            self.assertEqual(result, {"version": 1})
+            while not updates:
+                await asyncio.sleep(0.01)
+
+        try:
+            self.run_async(check())
+        finally:
+            loader.close()
+        self.assertEqual(updates, [{"version": 2}])
+
+    def test_loader_falls_back_to_snapshot(self):
+        loader = DatasetLoader(self.web, loop=self.loop, cache_dir=self.cache_dir)
+
+        async def check():
+            url = self.server.url + "/etag"
+            await loader.load(url)
+            await self.server.stop()
+            return await loader.fetch(url, 1.0)
+
+        try:
+            self.assertEqual(self.run_async(check()), (b'{"version": 1}', False))
+        finally:
+            loader.close()
+        # Already stopped.
+        self.server.url = None
+
+
+if __name__ == "__main__":
+    unittest.main()